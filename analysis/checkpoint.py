@@ -0,0 +1,165 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   On-disk checkpoints of resolved roots. A checkpoint belongs to one network
+   and month and is named by a fingerprint of the inputs and of the resolution
+   code (`code_version`):
+
+      <dir>/<network>-<month>-<fingerprint>/shard-00000.npz, shard-00001.npz, ..
+
+   Every shard holds a batch of roots as (name, touched names, krate,
+   resolved_tree) in columnar form. All strings of the shard are interned into
+   one UTF-8 table, and the trees are int32 columns with a row offset per root.
+   Shards are written atomically while roots are resolved (every
+   `every` roots or `seconds`), so an interrupted run resumes from the last
+   written shard, and a finished one is loaded instead of being resolved again.
+
+   Example:
+      cp = Checkpoint("cache/closures", "praezi", "2016-12", fingerprint)
+      done = cp.load()            # {name: (touched, krate, resolved_tree)}
+      cp.add(name, entry)         # writes a shard when a batch is full
+      cp.flush()
+"""
+import glob
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+## Bump when the stored entries change, or when the resolution output changes through code that
+## code_version() does not cover (e.g. the semver FFI library)
+FORMAT = 1
+
+
+def code_version(paths):
+    """
+        Digest of the source files the resolved entries depend on
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()[:16]
+
+
+def _strings(values):
+    blob = "\n".join(values).encode('utf-8')
+    return np.frombuffer(blob, dtype=np.uint8) if blob else np.zeros(0, dtype=np.uint8)
+
+
+def encode(entries):
+    """
+        Columnar arrays of [(name, (touched, krate, resolved_tree)),..]
+    """
+    ids = {}
+    def intern(s):
+        if s not in ids:
+            ids[s] = len(ids)
+        return ids[s]
+
+    width = 0
+    names, krates, touched, touched_offsets, rows, row_offsets = [], [], [], [0], [], [0]
+    for (name, (_touched, krate, resolved_tree)) in entries:
+        names.append(intern(name))
+        krates.append(-1 if krate is None else intern(krate))
+        touched.extend(intern(t) for t in sorted(_touched))
+        touched_offsets.append(len(touched))
+        for row in resolved_tree:
+            width = len(row)
+            rows.extend(intern(s) for s in row)
+        row_offsets.append(len(rows) // width if width else 0)
+    return {
+        "format": np.array([FORMAT, width, len(ids)], dtype=np.int64),
+        "strings": _strings(ids),
+        "names": np.array(names, dtype=np.int32),
+        "krates": np.array(krates, dtype=np.int32),
+        "touched": np.array(touched, dtype=np.int32),
+        "touched_offsets": np.array(touched_offsets, dtype=np.int64),
+        "rows": np.array(rows, dtype=np.int32).reshape(-1, width or 1),
+        "row_offsets": np.array(row_offsets, dtype=np.int64),
+    }
+
+
+def decode(arrays):
+    """
+        {name: (touched, krate, resolved_tree)} of a shard, None if it has another format
+    """
+    if int(arrays["format"][0]) != FORMAT:
+        return None
+    strings = arrays["strings"].tobytes().decode('utf-8').split("\n") if int(arrays["format"][2]) else []
+    touched = [strings[i] for i in arrays["touched"].tolist()]
+    touched_offsets = arrays["touched_offsets"].tolist()
+    rows = list(zip(*[[strings[i] for i in col] for col in arrays["rows"].T.tolist()]))
+    row_offsets = arrays["row_offsets"].tolist()
+    entries = {}
+    for (i, (name, krate)) in enumerate(zip(arrays["names"].tolist(), arrays["krates"].tolist())):
+        entries[strings[name]] = (set(touched[touched_offsets[i]:touched_offsets[i + 1]]),
+                                  None if krate < 0 else strings[krate],
+                                  rows[row_offsets[i]:row_offsets[i + 1]])
+    return entries
+
+
+class Checkpoint(object):
+    def __init__(self, directory, network, month, fingerprint, every=1000, seconds=60):
+        self.path = os.path.join(directory, "{}-{}-{}".format(network, month, fingerprint))
+        self.every = every
+        self.seconds = seconds
+        self.restored = 0
+        self._batch = []
+        self._flushed = time.time()
+
+    def shards(self):
+        return sorted(glob.glob(os.path.join(self.path, "shard-*.npz")))
+
+    def load(self):
+        """
+            {name: (touched, krate, resolved_tree)} of all written shards
+        """
+        entries = {}
+        for shard in self.shards():
+            with np.load(shard) as arrays:
+                decoded = decode(arrays)
+            if decoded is not None:
+                entries.update(decoded)
+        return entries
+
+    def add(self, name, entry):
+        self._batch.append((name, entry))
+        if len(self._batch) >= self.every or time.time() - self._flushed >= self.seconds:
+            self.flush()
+
+    def flush(self):
+        self._flushed = time.time()
+        if not self._batch:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".shard-", suffix=".npz", dir=self.path)
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, **encode(self._batch))
+        os.chmod(tmp, 0o664)
+        os.replace(tmp, os.path.join(self.path, "shard-{:05d}.npz".format(len(self.shards()))))
+        self._batch = []
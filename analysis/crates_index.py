@@ -0,0 +1,305 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Lookup tables of evolysis-rustcg.py: the release table (releases.csv), the
+   docs.rs build table (docsrs.csv) and the dependency and feature tables parsed
+   from crates.io-index.
+
+   Parsing the index takes minutes, so the tables are written once to a pickle
+   in the cache directory (EVOLYSIS_CACHE_DIR, default `cache/`). The cache is
+   keyed by the git HEAD of the index, the blacklists/targets below, and the
+   size and mtime of the CSV files. Later runs (and `python3 -i` sessions) load
+   the pickle. Without a cache the index is parsed by a process pool of
+   EVOLYSIS_JOBS workers (default: all cores) and a per-phase timing report is
+   printed.
+
+   One-time ingest:
+      python3 analysis/crates_index.py [crates.io-index] [releases.csv] [docsrs.csv]
+"""
+import collections
+import hashlib
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+
+FORMAT = 1
+
+CACHE_DIR = os.environ.get("EVOLYSIS_CACHE_DIR", "cache")
+
+## Worker processes parsing the index when there is no cache
+JOBS = int(os.environ.get("EVOLYSIS_JOBS", os.cpu_count() or 1))
+SHARDS_PER_JOB = 4
+MIN_PARALLEL_FILES = 1000
+
+####
+##### Blacklist
+####
+
+### js code: 
+###   var ab = Array.from(document.getElementsByClassName("ember-view _name_s6xett")).map(x => '"' + x.innerText.trim() + '"').join(",")
+###   console.log(ab)
+
+### pages: https://crates.io/categories/os::windows-apis?sort=alpha
+windows = set([
+    "amsi","autopilot","cfile","clipboard-win","com","comedy","d3d12","detours","detours-sys", \
+    "dhc","dl_api","druid-shell","druid-win-shell","elbow-grease","embed-resource","eventlog","fd-lock","fenestroj","filetime_win", \
+    "guid_win","hcs-rs","iui","junction","lawrencium","lock_keys","lpwstr","mail_slot","mem_file","mscorlib-safe", \
+    "mscorlib_safe_derive","mscorlib-sys","ntapi","nt_native","nt_version","nvim_windows_remote","oaidl","palaver","proxyconf","raw_sync", \
+    "serial-windows","shared_memory","shared_memory_derive","stop-thread","system_shutdown","thin_main_loop","tlhelp32","uds_windows","ui-sys","verona", \
+    "virtdisk-rs","vmsavedstatedump_rs","w32-error","wallpaper-windows-user32","wepoll-binding","wepoll-sys","wepoll-sys-stjepang","wexit","wfd","wil", \
+    "wild","win32console","win32job","win32_notification","winapi","winapi-easy","winapi_forked_icmpapi","winapi-util","winbluetooth","win-crypto-ng", \
+    "windows-acl","windows-dll","windows-dll-codegen","windows-permissions","windows-service","winhandle","winlog","win-msg-name","winpty-sys","winreg", \
+    "winutils-rs","win-win","wio","wmi","wstr"])
+
+# pages: https://crates.io/categories/os::macos-apis 
+macos = set([
+    "core-foundation","security-framework","security-framework-sys","darwin-libproc-sys","darwin-libproc","druid-shell","palaver","system-configuration-sys","system-configuration","pfctl", \
+    "autopilot","ui-sys","iui","system_shutdown","ash-molten","fd-lock","fse_dump","nightlight","xcrun","passkit", \
+    "core_bluetooth","core-services","filedesc","iron-oxide","addy","objrs","ds_store","objrs_frameworks_foundation","ptrauth-sys","apply-user-defaults", \
+    "objrs_frameworks_app_kit","objrs_frameworks_core_graphics","objrs_frameworks_metal","objrs_frameworks_metal_kit","ituneslibrary-sys","lock_keys","coreutils_core","cacao","elbow-grease","cargo-cider", \
+    "posix-socket"])
+
+
+## 
+## find . -type f -exec cat {} \; | jq .deps[].target | sort | uniq > ../targets.txt
+targets = set(["x86_64-unknown-linux-gnu","x86_64-unknown-linux-musl","i686-unknown-linux-gnu","i586-unknown-linux-gnu", \
+    "cfg(unix)", "cfg(target_os = \"linux\")", "cfg(target_family = \"unix\")", "cfg(not(windows))", \
+    "cfg(not(target_arch = \"wasm32\"))", "cfg(not(target_env = \"msvc\"))", "cfg(not(target_os = \"emscripten\"))", \
+    "cfg(not(target_os = \"macos\"))", "cfg(not(target_os = \"unknown\"))", "cfg(not(target_os = \"windows\"))", \
+    "cfg(any(unix, macos))", "cfg(any(target_os = \"linux\", target_os = \"android\"))", \
+    "cfg(any(target_os = \"linux\", target_os = \"dragonfly\", target_os = \"freebsd\"))", \
+    "cfg(any(target_os = \"linux\", target_os = \"dragonfly\", target_os = \"freebsd\", target_os = \"openbsd\"))", \
+    "cfg(all(unix, not(any(target_os = \"emscripten\", target_os = \"unknown\"))))", "cfg(all(unix, not(target_os = \"emscripten\")))", \
+    "cfg(all(unix, not(target_os = \"macos\")))","cfg(all(unix, not(target_os = \"redox\")))"
+    ])
+
+
+####
+##### CREATE LOOKUP TABLES
+####
+
+def load_releases(path):
+    """
+        Release table with timestamps: name -> {(v,ts),..}
+    """
+    _releases = {}
+    with open(path) as f:
+        for line in f:
+            ts, _name, _ver = line.rstrip().replace('\\"', "").strip('"').split(",")
+
+            if _name not in _releases:
+                _releases[_name] = set()
+
+            _releases[_name].add((_ver,ts))
+    return _releases
+
+
+def load_docsrs(path):
+    """
+        Docs.rs build table: name::ver -> True | False
+    """
+    _docsrs = {}
+    with open(path) as ft:
+        for line in ft:
+            _name,_ver,_status,_c,_d,_y = line.rstrip().split(",")
+            crate_key = "{}::{}".format(_name, _ver)
+            if _status == "True":
+                _docsrs[crate_key]  = True
+            else:
+                _docsrs[crate_key] = False
+    return _docsrs
+
+
+def valid_dep(d):
+    return 'kind' in d \
+            and (d['kind'] == 'normal' or d['kind'] == 'build') \
+                and (d['target'] == None or d['target'] in targets) 
+
+
+def index_files(index_dir):
+    """
+        All crate files of the index (skipping .git/ and config.json)
+    """
+    files = []
+    for (dirpath, dirnames, filenames) in os.walk(index_dir):
+        dirnames[:] = sorted(d for d in dirnames if d != ".git")
+        for name in sorted(filenames):
+            if "config.json" not in name:
+                files.append(os.path.join(dirpath, name))
+    return files
+
+
+def ingest_files(paths):
+    """
+        Dependency and features tables of a shard of index files, first entry of a crate_key wins
+    """
+    _dependencies = {}
+    _features = {}
+    for path in paths:
+        with open(path) as idx_fh:
+            for raw_entry in idx_fh.readlines():
+                entry = json.loads(raw_entry)
+                if entry['name'] not in windows and entry['name'] not in macos: #do not process macos/windows packages
+                    crate_key = "{}::{}".format(entry['name'],entry['vers'])
+                    if crate_key not in _features:
+                        _features[crate_key] = entry['features']
+                    if crate_key not in _dependencies:
+                        _dependencies[crate_key] = list()
+                        for d in entry['deps']:
+                            if valid_dep(d):
+                                if 'package' in d:
+                                    d_name = d['package']
+                                else:
+                                    d_name = d['name']
+                                if d_name not in windows and d_name not in macos: #remove macos/windows packages in deps
+                                    _dependencies[crate_key].append((d_name, d['req'],d['features'], d['optional'], d['default_features']))
+    return _dependencies, _features
+
+
+def shards(files, jobs):
+    """
+        Contiguous slices of the file list, a few per worker to even out the load
+    """
+    n = max(1, len(files) // (jobs * SHARDS_PER_JOB) + 1)
+    return [files[i:i + n] for i in range(0, len(files), n)]
+
+
+def ingest(index_dir, jobs=JOBS, timings=None):
+    """
+        Dependency table: name::ver -> [(d_name, d_req, d_features, d_optional, d_default_features),..]
+        Features table: name::ver -> {feature: [..]}
+
+        The index files are sharded over `jobs` processes; partial tables are
+        merged in file order, so the first entry of a crate_key wins as in a
+        sequential walk.
+    """
+    timings = timings if timings is not None else collections.OrderedDict()
+
+    with instrument.phase("index walk") as ph:
+        files = index_files(index_dir)
+    timings["walk"] = ph.wall
+
+    with instrument.phase("index parse") as ph:
+        if jobs <= 1 or len(files) < MIN_PARALLEL_FILES:
+            parts = [ingest_files(files)]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                parts = list(pool.map(ingest_files, shards(files, jobs)))
+    timings["parse"] = ph.wall
+
+    with instrument.phase("index merge") as ph:
+        _dependencies, _features = parts[0]
+        for (deps, feats) in parts[1:]:
+            for (crate_key, value) in deps.items():
+                if crate_key not in _dependencies:
+                    _dependencies[crate_key] = value
+            for (crate_key, value) in feats.items():
+                if crate_key not in _features:
+                    _features[crate_key] = value
+    timings["merge"] = ph.wall
+    return _dependencies, _features
+
+
+####
+##### Snapshot cache
+####
+
+def index_head(index_dir):
+    try:
+        out = subprocess.run(["git", "-C", index_dir, "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.decode('ascii').strip()
+
+
+def cache_key(index_dir, releases, docsrs):
+    head = index_head(index_dir)
+    if head is None:
+        return None
+    key = [FORMAT, head, sorted(windows), sorted(macos), sorted(targets)]
+    for path in [releases, docsrs]:
+        st = os.stat(path)
+        key.append([st.st_size, st.st_mtime_ns])
+    digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+    return "{}-{}".format(head[:12], digest[:12])
+
+
+def cache_path(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, "crates-index-{}.pickle".format(key))
+
+
+def load_tables(index_dir="crates.io-index", releases="releases.csv", docsrs="docsrs.csv", cache_dir=CACHE_DIR, jobs=JOBS):
+    """
+        (_releases, _docsrs, _dependencies, _features), from the cache if the index HEAD is unchanged
+    """
+    key = cache_key(index_dir, releases, docsrs)
+    if key is not None and os.path.exists(cache_path(key, cache_dir)):
+        with instrument.phase("index cache read"):
+            with open(cache_path(key, cache_dir), "rb") as fh:
+                return pickle.load(fh)
+
+    if key is None:
+        print("[{}] {} is not a git checkout, the tables are not cached".format(sys.argv[0], index_dir))
+
+    timings = collections.OrderedDict()
+    _dependencies, _features = ingest(index_dir, jobs, timings)
+
+    with instrument.phase("releases") as ph:
+        _releases = load_releases(releases)
+    timings["releases"] = ph.wall
+
+    with instrument.phase("docsrs") as ph:
+        _docsrs = load_docsrs(docsrs)
+    timings["docsrs"] = ph.wall
+
+    tables = (_releases, _docsrs, _dependencies, _features)
+
+    if key is not None:
+        with instrument.phase("index cache write") as ph:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".crates-index-", dir=cache_dir)
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(tables, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.chmod(tmp, 0o664)
+            os.replace(tmp, cache_path(key, cache_dir))
+        timings["cache"] = ph.wall
+
+    print("[{}] ingested {} with {} jobs: {}".format(sys.argv[0], index_dir, jobs,
+        ", ".join("{} {:.1f}s".format(phase, secs) for (phase, secs) in timings.items())))
+    return tables
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:] + ["crates.io-index", "releases.csv", "docsrs.csv"][len(sys.argv) - 1:]
+    _releases, _docsrs, _dependencies, _features = load_tables(*args[:3])
+    print("[{}] {} packages, {} docs.rs builds, {} index entries (cache key: {})".format(
+        sys.argv[0], len(_releases), len(_docsrs), len(_dependencies), cache_key(*args[:3])))
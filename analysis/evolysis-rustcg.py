@@ -25,170 +25,92 @@
 """ 
    Builds a PDN/CDN for new releases at a timestamp t. The resolution mechanism is based on using the latest available version at time t. Practically, the resolution is different but we use this assumption.
    Run: python3 evolysis-rustcg.py timestamp
+   Range mode: python3 evolysis-rustcg.py start..end (e.g., 2015-08..2020-02) builds the networks month by month and writes MONTHLY_METRICS for each month to out/.
+   Resolved roots are checkpointed to cache/closures/ (EVOLYSIS_CHECKPOINT_DIR): a rerun loads them, an interrupted run resumes from the last written shard.
 """
 import sys
 import json
 import base64
 import os 
-import glob
-import fnmatch
 import collections
+import gc
+import hashlib
+import atexit
 
-from ctypes import cdll, c_bool, c_void_p, cast, c_char_p, c_int32
-from pathlib import Path
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
 
 import pandas as pd
 import numpy as np
-import networkx as nx
+
+import forkpool
+import instrument
+import checkpoint
+from stitchcache import StitchCache, STORE
+from fntable import FnTable, as_fn_table, unique_rows
+from features import FeatureTable
+from reach import Condensation, reach_counts, estimate_reach_counts, source_label_counts
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common"))
+import manifest
+import pubfns
 
 
 ####
-##### SETUP RUST VERSION RESOLVER
+##### SETUP RUST VERSION RESOLVER (see semver_ffi.py and resolver.py)
 ####
 
-RUST = cdll.LoadLibrary("target/release/libsemver_ffi.so")
-
-RUST.is_match.argtypes = (c_void_p,c_void_p)
-RUST.is_match.restype = c_bool
-RUST.cmp.argtypes = (c_void_p,c_void_p)
-RUST.cmp.restype = c_int32
-
-def cmp_to_key(mycmp):
-    'Convert a cmp= function into a key= function'
-    class K(object):
-        def __init__(self, obj, *args):
-            self.obj = obj
-        def __lt__(self, other):
-            return mycmp(self.obj, other.obj) < 0
-        def __gt__(self, other):
-            return mycmp(self.obj, other.obj) > 0
-        def __eq__(self, other):
-            return mycmp(self.obj, other.obj) == 0
-        def __le__(self, other):
-            return mycmp(self.obj, other.obj) <= 0  
-        def __ge__(self, other):
-            return mycmp(self.obj, other.obj) >= 0
-        def __ne__(self, other):
-            return mycmp(self.obj, other.obj) != 0
-    return K
+from resolver import Resolver
 
 
 ####
-##### Blacklist
+##### CREATE LOOKUP TABLES (see crates_index.py)
 ####
 
-### js code: 
-###   var ab = Array.from(document.getElementsByClassName("ember-view _name_s6xett")).map(x => '"' + x.innerText.trim() + '"').join(",")
-###   console.log(ab)
-
-### pages: https://crates.io/categories/os::windows-apis?sort=alpha
-windows = set([
-    "amsi","autopilot","cfile","clipboard-win","com","comedy","d3d12","detours","detours-sys", \
-    "dhc","dl_api","druid-shell","druid-win-shell","elbow-grease","embed-resource","eventlog","fd-lock","fenestroj","filetime_win", \
-    "guid_win","hcs-rs","iui","junction","lawrencium","lock_keys","lpwstr","mail_slot","mem_file","mscorlib-safe", \
-    "mscorlib_safe_derive","mscorlib-sys","ntapi","nt_native","nt_version","nvim_windows_remote","oaidl","palaver","proxyconf","raw_sync", \
-    "serial-windows","shared_memory","shared_memory_derive","stop-thread","system_shutdown","thin_main_loop","tlhelp32","uds_windows","ui-sys","verona", \
-    "virtdisk-rs","vmsavedstatedump_rs","w32-error","wallpaper-windows-user32","wepoll-binding","wepoll-sys","wepoll-sys-stjepang","wexit","wfd","wil", \
-    "wild","win32console","win32job","win32_notification","winapi","winapi-easy","winapi_forked_icmpapi","winapi-util","winbluetooth","win-crypto-ng", \
-    "windows-acl","windows-dll","windows-dll-codegen","windows-permissions","windows-service","winhandle","winlog","win-msg-name","winpty-sys","winreg", \
-    "winutils-rs","win-win","wio","wmi","wstr"])
-
-# pages: https://crates.io/categories/os::macos-apis 
-macos = set([
-    "core-foundation","security-framework","security-framework-sys","darwin-libproc-sys","darwin-libproc","druid-shell","palaver","system-configuration-sys","system-configuration","pfctl", \
-    "autopilot","ui-sys","iui","system_shutdown","ash-molten","fd-lock","fse_dump","nightlight","xcrun","passkit", \
-    "core_bluetooth","core-services","filedesc","iron-oxide","addy","objrs","ds_store","objrs_frameworks_foundation","ptrauth-sys","apply-user-defaults", \
-    "objrs_frameworks_app_kit","objrs_frameworks_core_graphics","objrs_frameworks_metal","objrs_frameworks_metal_kit","ituneslibrary-sys","lock_keys","coreutils_core","cacao","elbow-grease","cargo-cider", \
-    "posix-socket"])
-
-
-## 
-## find . -type f -exec cat {} \; | jq .deps[].target | sort | uniq > ../targets.txt
-targets = set(["x86_64-unknown-linux-gnu","x86_64-unknown-linux-musl","i686-unknown-linux-gnu","i586-unknown-linux-gnu", \
-    "cfg(unix)", "cfg(target_os = \"linux\")", "cfg(target_family = \"unix\")", "cfg(not(windows))", \
-    "cfg(not(target_arch = \"wasm32\"))", "cfg(not(target_env = \"msvc\"))", "cfg(not(target_os = \"emscripten\"))", \
-    "cfg(not(target_os = \"macos\"))", "cfg(not(target_os = \"unknown\"))", "cfg(not(target_os = \"windows\"))", \
-    "cfg(any(unix, macos))", "cfg(any(target_os = \"linux\", target_os = \"android\"))", \
-    "cfg(any(target_os = \"linux\", target_os = \"dragonfly\", target_os = \"freebsd\"))", \
-    "cfg(any(target_os = \"linux\", target_os = \"dragonfly\", target_os = \"freebsd\", target_os = \"openbsd\"))", \
-    "cfg(all(unix, not(any(target_os = \"emscripten\", target_os = \"unknown\"))))", "cfg(all(unix, not(target_os = \"emscripten\")))", \
-    "cfg(all(unix, not(target_os = \"macos\")))","cfg(all(unix, not(target_os = \"redox\")))"
-    ])
-####
-##### CREATE LOOKUP TABLES
-####
+from crates_index import load_tables, cache_key, CACHE_DIR, JOBS
 
 #### Release table with timestamps
 ##   name -> [(ts,v),()]
-_releases = {}
 #### Docs.rs build table
 ## name::ver -> true | false
-_docsrs  = {}
-
 #### Dependency Table
 ## name::ver -> ["(d1,r1),..,etc"]
-_dependencies = {}
-
 #### Features Table
-_features = {}
-
+# Phase timings, counters and cache statistics of the run are written to out/<argv[1]>-report.json (see instrument.py)
+if instrument.PROFILE_MS:
+    instrument.start_profiler()
 
-with open("releases.csv") as f:
-    for line in f:
-        ts, _name, _ver = line.rstrip().replace('\\"', "").strip('"').split(",")
-
-        if _name not in _releases:
-            _releases[_name] = set()
-        
-        _releases[_name].add((_ver,ts))
-
-with open("docsrs.csv") as ft:
-    for line in ft:
-        _name,_ver,_status,_c,_d,_y = line.rstrip().split(",")
-        crate_key = "{}::{}".format(_name, _ver)
-        if _status == "True":
-            _docsrs[crate_key]  = True
-        else:
-            _docsrs[crate_key] = False
-
-
-def valid_dep(d):
-    return 'kind' in d \
-            and (d['kind'] == 'normal' or d['kind'] == 'build') \
-                and (d['target'] == None or d['target'] in targets) 
-            
-for path in Path("crates.io-index").glob('**/*'):
-    if path.is_file() and "config.json" not in path.name and "crates.io-index/.git/" not in str(path):
-        with path.open() as idx_fh:
-            for raw_entry in idx_fh.readlines():
-                entry = json.loads(raw_entry)
-                if entry['name'] not in windows and entry['name'] not in macos: #do not process macos/windows packages
-                    crate_key = "{}::{}".format(entry['name'],entry['vers'])
-                    if crate_key not in _features:
-                        _features[crate_key] = entry['features']
-                    if crate_key not in _dependencies:
-                        _dependencies[crate_key] = list()
-                        for d in entry['deps']:
-                            if valid_dep(d):
-                                if 'package' in d:
-                                    d_name = d['package']
-                                else:
-                                    d_name = d['name']
-                                if d_name not in windows and d_name not in macos: #remove macos/windows packages in deps
-                                    _dependencies[crate_key].append((d_name, d['req'],d['features'], d['optional'], d['default_features']))
+with instrument.phase("load tables"):
+    _releases, _docsrs, _dependencies, _features = load_tables()
+# Flattened features and interned feature sets, filled on demand (see features.py)
+_feature_table = FeatureTable(_features)
+# The tables are never freed; keep them out of the cyclic GC's full collections
+gc.freeze()
 
 ####
 ##### Parse time interval
 ####
-ts = sys.argv[1]
-ts_year,ts_month = ts.split("-")
+# A single month (2015-08) or a range of months (2015-08..2020-02)
+if ".." in sys.argv[1]:
+    ts_start, ts_end = sys.argv[1].split("..")
+else:
+    ts_start = ts_end = sys.argv[1]
 ts_day=15 #latest day of the index is 14th Feb 2020
 
+def parse_month(ts):
+    ts_year,ts_month = ts.split("-")
+    return datetime(int(ts_year),int(ts_month),int(ts_day))
+
+def months(ts_start, ts_end):
+    dt, dt_end = parse_month(ts_start), parse_month(ts_end)
+    while dt <= dt_end:
+        yield dt.strftime("%Y-%m")
+        dt = dt + relativedelta(months=1)
+
 # A valid release is with in t and t-1 
-dt_max = datetime(int(ts_year),int(ts_month),int(ts_day))
+ts = ts_start
+dt_max = parse_month(ts)
 dt_min = dt_max - relativedelta(months=1)
 
 ####
@@ -204,33 +126,63 @@ def parse_ts(ts):
 def is_docsrs_valid(p,v):
     return _docsrs.get("{}::{}".format(p,v),False) 
 
+# crate::ver -> {artifact kinds} of the stitching store, None without a manifest (see common/manifest.py)
+_praezi_manifest = manifest.load(STORE)
+
 def is_praezi_valid(p,v):
-    return os.path.isdir("/datasets/praezi/stitching/{}/{}/".format(p,v))
+    if _praezi_manifest is not None:
+        return "{}::{}".format(p,v) in _praezi_manifest
+    return os.path.isdir(os.path.join(STORE, p, v))
+
+# Releases in chronological order: [(date, name, ver),..]
+# Snapshots grow along it, one month at a time in range mode
+with instrument.phase("timeline"):
+    _timeline = sorted([(parse_ts(v_ts).date(), p, v) for (p,vs) in _releases.items() for (v,v_ts) in vs])
+_timeline_pos = 0
+
+# name -> {v1,v2,v3,..}
+_index_versions = {}
+_docsrs_versions = {}
+_praezi_versions = {}
+
+def advance_snapshots(dt_max):
+    """
+        Add the releases up to dt_max to the snapshots, returns the names with new versions per snapshot
+    """
+    global _timeline_pos
+    changed = {"index": set(), "docsrs": set(), "praezi": set()}
+    while _timeline_pos < len(_timeline) and _timeline[_timeline_pos][0] <= dt_max.date():
+        (_, p, v) = _timeline[_timeline_pos]
+        _timeline_pos += 1
+        # index (no checks)
+        _index_versions.setdefault(p, set()).add(v)
+        changed["index"].add(p)
+        # docsrs
+        if is_docsrs_valid(p,v):
+            _docsrs_versions.setdefault(p, set()).add(v)
+            changed["docsrs"].add(p)
+        # praezi
+        if is_praezi_valid(p,v):
+            _praezi_versions.setdefault(p, set()).add(v)
+            changed["praezi"].add(p)
+    return changed
+
+def ordered_snapshot(_versions):
+    # keep the package order of _releases
+    return {p: _versions[p] for p in _releases if p in _versions}
 
 # name -> [v1,v2,v3,..]
 _docsrs_snapshot= {}
 _praezi_snapshot = {}
 _index_snapshot = {}
 
-for (p,vs) in _releases.items():
-    for (v,v_ts) in vs:
-        v_dt = parse_ts(v_ts)
-        # is this a version for dependencies?
-        if v_dt.date() <= dt_max.date():
-            # index (no checks)
-            if p not in _index_snapshot:
-                _index_snapshot[p] = set()
-            _index_snapshot[p].add(v)
-            # docsrs
-            if is_docsrs_valid(p,v):
-                if p not in _docsrs_snapshot:
-                    _docsrs_snapshot[p] = set()
-                _docsrs_snapshot[p].add(v)
-            # praezi
-            if is_praezi_valid(p,v):
-                if p not in _praezi_snapshot:
-                    _praezi_snapshot[p] = set()
-                _praezi_snapshot[p].add(v)
+# One resolver per snapshot: versions are sorted once and (name, req) lookups are memoized
+_index_resolver = Resolver(_index_snapshot)
+_docsrs_resolver = Resolver(_docsrs_snapshot)
+_praezi_resolver = Resolver(_praezi_snapshot)
+
+def resolver_stats():
+    return {"index": _index_resolver.stats(), "docsrs": _docsrs_resolver.stats(), "praezi": _praezi_resolver.stats()}
 
 # ####
 # ###### Calculate Package-level Closure 
@@ -240,198 +192,326 @@ def is_valid_dep(d_name, d_optional, enabled_optionals):
     if d_optional == False:
         return True
     else:
-        return d_name in set(enabled_optionals)
+        return d_name in enabled_optionals.members
 
-def flatten_features(keys, dict):
-    flatten = []
-    for key in keys: 
-        if key in dict:
-            flatten = flatten + flatten_features(dict[key], dict)
-        else:
-            flatten.append(key)
-    return flatten
-
-
-def resolve_features(d_krate,d_features,d_optional,d_default_features, features):
-    # Scenario: no optional, no default features, and no default features requested
-    enabled_deps = []
-    if d_optional == False and d_default_features == False and not d_features:
-        return enabled_deps
-    # Scenario: default features enabled
-    if d_default_features:
-        #1. check if there are features for this particulat package and then fetch default features
-        if d_krate in features and "default" in features[d_krate]:
-            enabled_deps = enabled_deps + list(flatten_features(["default"], features[d_krate]))
-    #Scenario: enabled features
-    if d_features:
-        if d_krate in features:
-                    enabled_deps = enabled_deps + list(flatten_features(d_features, features[d_krate]))
-    return list(set(enabled_deps))
-
-def resolve(krate, enabled_optionals, dependencies, features, releases, visited=None):
-    if visited == None:
-        visited = set() 
-    visited.add(krate + str(sorted(enabled_optionals)))
-
-    transitve_opts = {}
-    for opt in enabled_optionals:
-        if "/" in opt:
-            dep, feature = opt.split("/")
-            if dep not in transitve_opts:
-                transitve_opts[dep] = []
-            transitve_opts[dep].append(feature)
-            
-    for (d_name,d_req,d_features,d_optional,d_default_features) in dependencies.get(krate,[]):
-        if is_valid_dep(d_name, d_optional, enabled_optionals):
-            r = releases[d_name]
-            d_vs = [d_ver.encode('ascii') for d_ver in r if RUST.is_match(d_req.encode('ascii'),d_ver.encode('ascii'))]
-            d_vs = [d_ver.decode('ascii') for d_ver in sorted(d_vs, key=cmp_to_key(RUST.cmp))]
-            if not d_vs:
-                raise Exception("Incomplete Dependency Tree")
-            d_v = d_vs.pop()
-            d_krate = "{}::{}".format(d_name,d_v)
-            yield (krate,d_krate)
-            enabled_optionals = resolve_features(d_krate,d_features,d_optional,d_default_features, features)
-            if d_name in transitve_opts:
-                enabled_optionals = enabled_optionals + list(flatten_features(transitve_opts[d_name], features[d_krate])) 
-            if d_krate + str(sorted(enabled_optionals)) not in visited:
-                for z_krate in resolve(d_krate, enabled_optionals, dependencies,features, releases, visited):
-                    yield z_krate
-
-def dep_closure(_snapshot, _dependencies, _features):
+def passed_features(enabled_optionals):
+    """
+        dep -> [feature,..] enabled by the "dep/feature" entries of a FeatureSet
+    """
+    if enabled_optionals.transitive is None:
+        raise Exception("Invalid feature in {}".format(enabled_optionals))
+    return enabled_optionals.transitive
+
+## `features` below is a FeatureTable, enabled optionals are FeatureSets and
+## a (krate, enabled optionals) state is keyed by the tuple of both
+
+def expand(krate, enabled_optionals, dependencies, features, resolver):
+    """
+        One level of the dependency tree of a (krate, enabled optionals) state: the edge to
+        every enabled dependency and the state it is resolved in.
+        ([([edge], (d_key, d_krate, d_enabled_optionals)),..], failed, names looked up)
+    """
+    outer, resolver.touched = resolver.touched, set()
+    steps = []
+    failed = False
+    try:
+        transitve_opts = passed_features(enabled_optionals)
+
+        for (d_name,d_req,d_features,d_optional,d_default_features) in dependencies.get(krate,[]):
+            if is_valid_dep(d_name, d_optional, enabled_optionals):
+                d_v = resolver.resolve(d_name, d_req)
+                if d_v is None:
+                    raise Exception("Incomplete Dependency Tree")
+                d_krate = "{}::{}".format(d_name,d_v)
+                enabled_optionals = features.dependency(d_krate,d_features,d_optional,d_default_features,transitve_opts.get(d_name))
+                steps.append(([(krate,d_krate)], ((d_krate, enabled_optionals), d_krate, enabled_optionals)))
+    except Exception as e:
+        failed = True
+    finally:
+        touched, resolver.touched = resolver.touched, outer
+    return (steps, failed, touched)
+
+def replay(expansion, root):
+    """
+        Depth-first walk over memoized expansions from a root state, visiting every state
+        key once. expansion(key, ...) -> [(items, child or None),..]
+    """
+    visited = set([root[0]])
+    resolved_tree = []
+    stack = [[expansion(*root), 0]]
+    while stack:
+        top = stack[-1]
+        steps, i = top
+        if i == len(steps):
+            stack.pop()
+            continue
+        top[1] = i + 1
+        items, child = steps[i]
+        resolved_tree.extend(items)
+        if child is not None and child[0] not in visited:
+            visited.add(child[0])
+            stack.append([expansion(*child), 0])
+    return resolved_tree
+
+def resolve_tree(krate, dependencies, features, resolver, expansions):
+    """
+        Dependency edges of krate without enabled optionals, replayed from expansions
+        memoized across roots: key (krate, enabled optionals) -> expand(...)
+    """
+    def expansion(key, krate, enabled_optionals):
+        if key not in expansions:
+            expansions[key] = expand(krate, enabled_optionals, dependencies, features, resolver)
+        steps, failed, touched = expansions[key]
+        if resolver.touched is not None:
+            resolver.touched.update(touched)
+        if failed:
+            raise Exception("Incomplete Dependency Tree")
+        return steps
+
+    return replay(expansion, ((krate, features.EMPTY), krate, features.EMPTY))
+
+def invalidate_expansions(expansions, changed):
+    """
+        Drop the memoized expansions that looked up a package with new versions
+    """
+    for key in [key for (key, (_, _, touched)) in expansions.items() if not touched.isdisjoint(changed)]:
+        del expansions[key]
+
+def stale_roots(snapshot, _roots, changed):
+    """
+        Packages to resolve (again): new ones and those whose last resolution looked at a package with new versions
+    """
+    return set([p for p in snapshot if p not in _roots or not _roots[p][0].isdisjoint(changed)])
+
+def traced(_resolver, resolve_root, p):
+    """
+        (touched names, krate, resolved_tree) of a root package
+    """
+    _resolver.touched = set([p])
+    try:
+        krate, resolved_tree = resolve_root(p)
+    finally:
+        touched, _resolver.touched = _resolver.touched, None
+    return (touched, krate, resolved_tree)
+
+# Roots are resolved by forked workers (EVOLYSIS_JOBS, default: all cores) when there are enough of them
+CLOSURE_JOBS = JOBS
+MIN_PARALLEL_ROOTS = 256
+
+def estimated_size(p, _resolver, _roots):
+    # size of the previous tree, or the number of dependencies of the latest version
+    if p in _roots:
+        return len(_roots[p][2])
+    vs = _resolver.sorted(p)
+    return len(_dependencies.get("{}::{}".format(p,vs[-1]),[])) if vs else 0
+
+def closure(_resolver, resolve_root, _roots=None, changed=(), _checkpoint=None):
+    """
+        Resolve the packages of a snapshot with resolve_root(p) -> (krate, resolved_tree).
+        _roots keeps name -> (touched names, krate, resolved_tree) across snapshots,
+        so only the stale roots are resolved again. The result does not depend on
+        the number of workers: it is assembled in snapshot order.
+        With a checkpoint, roots it holds are not resolved again and resolved roots are added to it.
+    """
+    if _roots is None:
+        _roots = {}
+    stale = stale_roots(_resolver.snapshot, _roots, changed)
     pkgs = {}
-    for p,vs in _snapshot.items():
-        vs = _snapshot[p]
-        vs = [v.encode("ascii") for v in vs]
-        vs = [v.decode('ascii') for v in sorted(vs, key=cmp_to_key(RUST.cmp))]
-
-        resolved_tree = []
-        while vs:
-            v = vs.pop()
-            krate = "{}::{}".format(p,v)
-            try:
-                resolved_tree = list(resolve(krate,[],_dependencies,_features,_snapshot))
-            except Exception as e:
-                continue
-            break #we dont need to continue, we have a resolved release from this package
+    if _checkpoint is not None:
+        restored = [(p, entry) for (p, entry) in _checkpoint.load().items() if p in stale]
+        for (p, entry) in restored:
+            _roots[p] = entry
+            stale.discard(p)
+        _checkpoint.restored = len(restored)
+    # Trees and expansions are acyclic, GC passes over them are wasted time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if CLOSURE_JOBS > 1 and len(stale) >= MIN_PARALLEL_ROOTS:
+            # largest trees first, so no worker is left with a big one at the end
+            roots = sorted([p for p in _resolver.snapshot if p in stale], key=lambda p: -estimated_size(p, _resolver, _roots))
+            for (p, entry) in forkpool.imap(lambda p: traced(_resolver, resolve_root, p), roots, CLOSURE_JOBS):
+                _roots[p] = entry
+                if _checkpoint is not None:
+                    _checkpoint.add(p, entry)
+        else:
+            for p in _resolver.snapshot:
+                if p in stale:
+                    _roots[p] = traced(_resolver, resolve_root, p)
+                    if _checkpoint is not None:
+                        _checkpoint.add(p, _roots[p])
+        if _checkpoint is not None:
+            _checkpoint.flush()
+
+        for p in _resolver.snapshot:
+            _, krate, resolved_tree = _roots[p]
+            if resolved_tree:
+                pkgs[krate] = resolved_tree
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return pkgs
+
+def resolve_dep_root(p, _resolver, _dependencies, _features, _expansions):
+    """
+        (krate, resolved_tree) of the latest release of p with a complete dependency tree
+    """
+    vs = list(_resolver.sorted(p))
+
+    resolved_tree = []
+    krate = None
+    while vs:
+        v = vs.pop()
+        krate = "{}::{}".format(p,v)
+        try:
+            resolved_tree = resolve_tree(krate,_dependencies,_features,_resolver,_expansions)
+        except Exception as e:
+            continue
+        break #we dont need to continue, we have a resolved release from this package
+    return krate, resolved_tree
+
+def dep_closure(_resolver, _dependencies, _features, _roots=None, changed=(), _expansions=None, _checkpoint=None):
+    if _expansions is None:
+        _expansions = {}
 
-        if resolved_tree:
-            if krate not in pkgs:
-                pkgs[krate] = []
-            for d in resolved_tree:
-                pkgs[krate].append(d)
+    def resolve_root(p):
+        return resolve_dep_root(p, _resolver, _dependencies, _features, _expansions)
 
-    return pkgs 
+    return closure(_resolver, resolve_root, _roots, changed, _checkpoint)
 
 # ####
 # ###### Calculate Function-level Closure 
 # ####
 
-_cache = {}
-def get_entrypoints(krate):
-    if krate in _cache:
-        return _cache[krate]
-    p,v= krate.split("::")
-    folder = "/datasets/praezi/stitching/{}/{}".format(p,v)
+# Bounded LRU caches of the stitching files, optionally backed by disk (see stitchcache.py)
+
+def parse_entrypoints(krate, files):
     entrypoints = set()
-    for entry_file in os.listdir(folder):
-        if fnmatch.fnmatch(entry_file, 'entrypoints-*.txt'):
-            entrypoints = entrypoints.union(set([line.rstrip('\n') for line in open("{}/{}".format(folder,entry_file))]))
-    _cache[krate] = entrypoints
+    for entry_file in files:
+        entrypoints = entrypoints.union(set([line.rstrip('\n') for line in open(entry_file)]))
     return entrypoints
 
-_paths_cache = {}
-def get_paths(krate):
-    if krate in _paths_cache:
-        return _paths_cache[krate]
-    p,v= krate.split("::")
-    folder = "/datasets/praezi/stitching/{}/{}".format(p,v)
+def parse_dep_paths(krate, files):
     paths = {}
-    for paths_file in os.listdir(folder):
-        if fnmatch.fnmatch(paths_file, 'paths-*.txt'):
-            for call in [line.rstrip('\n') for line in open("{}/{}".format(folder,paths_file))]:
-                s_fn, t_name, t_fn, t_dispatch = call.split(",")
-                if s_fn not in paths:
-                    paths[s_fn] = set()
-                paths[s_fn].add((t_name,t_fn,t_dispatch))
-    _paths_cache[krate] = paths
+    for paths_file in files:
+        for call in [line.rstrip('\n') for line in open(paths_file)]:
+            s_fn, t_name, t_fn, t_dispatch = call.split(",")
+            if t_name not in paths:
+                paths[t_name] = {}
+            if s_fn not in paths[t_name]:
+                paths[t_name][s_fn] = set()
+            paths[t_name][s_fn].add((t_fn,t_dispatch))
     return paths
 
-def resolve_with_cg(krate, krate_eps, enabled_optionals, dependencies, features, releases, visited=None):
-    # Add to visited 
-    if visited == None:
-        visited = set() 
-    visited.add(krate + str(sorted(enabled_optionals)))
-    # Inspect if we have enabled options for dependencies
-    transitve_opts = {}
-    for opt in enabled_optionals:
-        if "/" in opt:
-            dep, feature = opt.split("/")
-            if dep not in transitve_opts:
-                transitve_opts[dep] = []
-            transitve_opts[dep].append(feature)
-    
-    # Fetch call paths for this package version
-    krate_paths = get_paths(krate)
-            
-    for (d_name,d_req,d_features,d_optional,d_default_features) in dependencies.get(krate,[]):
-        if is_valid_dep(d_name, d_optional, enabled_optionals):
-            if d_name not in releases:
-                raise Exception("Missing Call Graphs for package: " + d_name)
-            r = releases[d_name]
-            d_vs = [d_ver.encode('ascii') for d_ver in r if RUST.is_match(d_req.encode('ascii'),d_ver.encode('ascii'))]
-            d_vs = [d_ver.decode('ascii') for d_ver in sorted(d_vs, key=cmp_to_key(RUST.cmp))]
-            if not d_vs:
-                raise Exception("No call graphs available for package: " + d_name)
-            d_v = d_vs.pop()
-            d_krate = "{}::{}".format(d_name,d_v)
-            d_eps = set()
-            d_calls = set()
-            for e in krate_eps:
-                if e not in krate_paths:
-                    continue
-                for call in krate_paths[e]:
-                    t_name, t_fn, t_dispatch = call
-                    if t_name == d_name:
-                        d_eps.add(t_fn)
-                        d_calls.add((krate, e, t_name, d_v, t_fn, t_dispatch))
-            for call in d_calls:
-                yield call
-            if d_eps: #check if there are calls to check in the dep
-                # Resolve features
-                enabled_optionals = resolve_features(d_krate,d_features,d_optional,d_default_features, features)
-                if d_name in transitve_opts:
-                    enabled_optionals = enabled_optionals + list(flatten_features(transitve_opts[d_name], features[d_krate])) 
-                if d_krate + str(sorted(enabled_optionals)) not in visited:
-                    for z_krate in resolve_with_cg(d_krate, d_eps, enabled_optionals, dependencies,features, releases, visited):
-                        yield z_krate
-
-def dep_fn_closure(_snapshot, _dependencies, _features):
-    pkgs = {}
-    for p,vs in _snapshot.items():
-        vs = _snapshot[p]
-        vs = [v.encode("ascii") for v in vs]
-        vs = [v.decode('ascii') for v in sorted(vs, key=cmp_to_key(RUST.cmp))]
-
-        resolved_tree = []
-        while vs:
-            v = vs.pop()
-            krate = "{}::{}".format(p,v)
-            krate_eps = get_entrypoints(krate)
-            try:
-                resolved_tree = list(resolve_with_cg(krate,krate_eps,[],_dependencies,_features,_snapshot))
-            except Exception as e:
-                continue
-            break #we dont need to continue, we have a resolved release from this package
+_cache = StitchCache("entrypoints", "entrypoints", parse_entrypoints)
+def get_entrypoints(krate):
+    return _cache.get(krate)
+
+_dep_paths_cache = StitchCache("dep-paths", "paths", parse_dep_paths)
+def get_dep_paths(krate):
+    """
+        Call paths grouped by dependency: d_name -> {s_fn: {(t_fn, t_dispatch),..}}
+    """
+    return _dep_paths_cache.get(krate)
 
-        if resolved_tree:
-            pkgs[krate] = resolved_tree
-    return pkgs 
+def expand_with_cg(krate, krate_eps, enabled_optionals, dependencies, features, resolver):
+    """
+        One level of the call graph tree of a (krate, entrypoints, enabled optionals) state: the
+        calls from the entrypoints into every enabled dependency and, if there are any, the state
+        of the dependency with the called functions as its entrypoints.
+        ([([call,..], (d_key, d_krate, d_eps, d_enabled_optionals) or None),..], failed, names looked up)
+    """
+    outer, resolver.touched = resolver.touched, set()
+    steps = []
+    failed = False
+    try:
+        transitve_opts = passed_features(enabled_optionals)
+
+        krate_paths = get_dep_paths(krate)
+
+        for (d_name,d_req,d_features,d_optional,d_default_features) in dependencies.get(krate,[]):
+            if is_valid_dep(d_name, d_optional, enabled_optionals):
+                if d_name not in resolver:
+                    raise Exception("Missing Call Graphs for package: " + d_name)
+                d_v = resolver.resolve(d_name, d_req)
+                if d_v is None:
+                    raise Exception("No call graphs available for package: " + d_name)
+                d_krate = "{}::{}".format(d_name,d_v)
+                d_paths = krate_paths.get(d_name, {})
+                if len(d_paths) < len(krate_eps):
+                    called = [e for e in d_paths if e in krate_eps]
+                else:
+                    called = [e for e in krate_eps if e in d_paths]
+                d_eps = set()
+                d_calls = set()
+                for e in called:
+                    for (t_fn, t_dispatch) in d_paths[e]:
+                        d_eps.add(t_fn)
+                        d_calls.add((krate, e, d_name, d_v, t_fn, t_dispatch))
+                child = None
+                if d_eps: #check if there are calls to check in the dep
+                    # Resolve features
+                    enabled_optionals = features.dependency(d_krate,d_features,d_optional,d_default_features,transitve_opts.get(d_name))
+                    child = ((d_krate, enabled_optionals), d_krate, frozenset(d_eps), enabled_optionals)
+                    _dep_paths_cache.prefetch(d_krate)
+                steps.append((list(d_calls), child))
+    except Exception as e:
+        failed = True
+    finally:
+        touched, resolver.touched = resolver.touched, outer
+    return (steps, failed, touched)
+
+def resolve_tree_with_cg(krate, krate_eps, dependencies, features, resolver, expansions):
+    """
+        Calls reachable from the entrypoints of krate without enabled optionals, replayed from
+        expansions memoized across roots: ((krate, enabled optionals), entrypoints) -> expand_with_cg(...)
+    """
+    def expansion(key, krate, krate_eps, enabled_optionals):
+        if (key, krate_eps) not in expansions:
+            expansions[(key, krate_eps)] = expand_with_cg(krate, krate_eps, enabled_optionals, dependencies, features, resolver)
+        steps, failed, touched = expansions[(key, krate_eps)]
+        if resolver.touched is not None:
+            resolver.touched.update(touched)
+        if failed:
+            raise Exception("Incomplete Call Graph Tree")
+        return steps
+
+    return replay(expansion, ((krate, features.EMPTY), krate, frozenset(krate_eps), features.EMPTY))
+
+def resolve_fn_root(p, _resolver, _dependencies, _features, _expansions):
+    """
+        (krate, resolved_tree) of the latest release of p with a complete call graph tree
+    """
+    vs = list(_resolver.sorted(p))
+
+    resolved_tree = []
+    krate = None
+    while vs:
+        v = vs.pop()
+        krate = "{}::{}".format(p,v)
+        krate_eps = get_entrypoints(krate)
+        try:
+            resolved_tree = resolve_tree_with_cg(krate,krate_eps,_dependencies,_features,_resolver,_expansions)
+        except Exception as e:
+            continue
+        break #we dont need to continue, we have a resolved release from this package
+    return krate, resolved_tree
+
+def dep_fn_closure(_resolver, _dependencies, _features, _roots=None, changed=(), _expansions=None, _checkpoint=None):
+    if _expansions is None:
+        _expansions = {}
+
+    def resolve_root(p):
+        return resolve_fn_root(p, _resolver, _dependencies, _features, _expansions)
+
+    return closure(_resolver, resolve_root, _roots, changed, _checkpoint)
 
 def fn2pkgclosure(_closure):
-    _pkg_edges = {}
-    for k,fns in _closure.items():
-        _pkg_edges[k] = set([(src_krate,"{}::{}".format(d_name, d_ver)) for (src_krate, s_fn, d_name, d_ver, t_fn, t_dispatch) in fns]) 
+    table = as_fn_table(_closure)
+    _pkg_edges = dict((k, set()) for k in table.roots)
+    krates = table.krates
+    for (r, src, dst) in unique_rows(table.root, table.src, table.dst).tolist():
+        _pkg_edges[table.roots[r]].add((krates[src], krates[dst]))
     return _pkg_edges
 
 
@@ -440,6 +520,7 @@ def fn2pkgclosure(_closure):
 # ###### Functions for Analysis
 # ####
 
+@instrument.timed
 def num_of_dependencies(_closure, name):
     """
         Calculate the number of direct and transitive dependencies per package version for a resolved network
@@ -461,160 +542,95 @@ def num_of_dependencies(_closure, name):
     pd_d = pd.Series(_pd_dict_d)
     pd_t = pd.Series(_pd_dict_t) 
 
-    pd_d.to_csv("out/{}-{}-dep-d".format(sys.argv[1],name))
-    pd_t.to_csv("out/{}-{}-dep-t.csv".format(sys.argv[1],name))
+    pd_d.to_csv("out/{}-{}-dep-d".format(ts,name))
+    pd_t.to_csv("out/{}-{}-dep-t.csv".format(ts,name))
 
 
+@instrument.timed
 def num_of_dependents(_closure,name):
     """
         Calculate the number of direct and transitive dependents per package version for a resolved network
     """
 
-    ## Create reverse dependency relations
-    node_list = []
-    edge_list = []
-    visited_node = set()
+    ## Number packages in order of appearance and create reverse dependency relations
     id_lookup = {}
+    src = []
+    dst = []
+    for s,ds in _closure.items():
+        id_lookup.setdefault(s, len(id_lookup))
+        for (t_s,t_t) in ds:
+            id_lookup.setdefault(t_s, len(id_lookup))
+            id_lookup.setdefault(t_t, len(id_lookup))
+            src.append(id_lookup[t_t])
+            dst.append(id_lookup[t_s])
 
-    ## Populate nodes
-    id = 0
-    for s,ts in _closure.items():
-        if s not in visited_node:
-            visited_node.add(s)
-            id_lookup[s] = id
-            node_list.append((id,{"name": s.split("::")[0], "ver": s.split("::")[1]}))
-            id += 1
-    
-        for (t_s,t_t) in ts:
-            if t_s not in visited_node:
-                visited_node.add(t_s)
-                id_lookup[t_s] = id
-                node_list.append((id,{"name": t_s.split("::")[0], "ver": t_s.split("::")[1]}))
-                id += 1         
-
-            if t_t not in visited_node:
-                visited_node.add(t_t)
-                id_lookup[t_t] = id
-                node_list.append((id,{"name": t_t.split("::")[0], "ver": t_t.split("::")[1]}))
-                id += 1    
-      
-    ## Populate edges
-    for _,ts in _closure.items():
-        for (t_s,t_t) in ts:
-            edge_list.append((id_lookup[t_s], id_lookup[t_t]))
-
-    G = nx.DiGraph()
-    G.add_nodes_from(node_list)
-    G.add_edges_from(edge_list)
-    G = G.reverse(copy=True)
-
-    _pd_dict_d  = {}
-    _pd_dict_t = {}
+    G = Condensation(len(id_lookup), np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64))
+    direct = G.out_degree()
+    #transitive: every reachable package that is not a direct dependent
+    trans = reach_counts(G) - direct
 
-    for n in G.nodes():
-        #direct
-        _pd_dict_d[G.nodes[n]['name'] + "::" + G.nodes[n]['ver']] = G.out_degree(n)
-        #transitive
-        all_nh = sum([G.number_of_edges(u,v) for (u,v) in nx.bfs_edges(G, source=n)])
-        trans_nh = all_nh - G.out_degree(n) 
-        _pd_dict_t[G.nodes[n]['name'] + "::" + G.nodes[n]['ver']] = trans_nh 
-    
-    pd_d = pd.Series(_pd_dict_d)
-    pd_t = pd.Series(_pd_dict_t) 
+    pd_d = pd.Series(direct, index=list(id_lookup))
+    pd_t = pd.Series(trans, index=list(id_lookup))
 
-    pd_d.to_csv("out2/{}-{}-dependents-dr.csv".format(sys.argv[1],name))
-    pd_t.to_csv("out2/{}-{}-dependents-tr.csv".format(sys.argv[1],name))    
+    pd_d.to_csv("out/{}-{}-dependents-dr.csv".format(ts,name))
+    pd_t.to_csv("out/{}-{}-dependents-tr.csv".format(ts,name))
 
 
+@instrument.timed
 def num_of_dependency_fns(_fn_closure, name):
     """
         Calculate the number of direct and transitive calls to dependencies per package version
     """
+    table = as_fn_table(_fn_closure)
+    n = len(table.roots)
 
-    def helper(head, pkg_graph):
-        for n in pkg_graph.nodes():
-            if n == head:
-                dir_dep_calls = pkg_graph.out_degree(n)
-                all_dep_calls = len(pkg_graph.edges())
-                transitive_dep_calls = all_dep_calls - dir_dep_calls #remove direct calls
-                return {"d": dir_dep_calls, "t": transitive_dep_calls}
-            else:
-                continue
+    # distinct (src_krate, s_fn, dst_krate, t_fn) calls per root, direct ones leave the root itself
+    calls = unique_rows(table.root, table.src, table.s_fn, table.dst, table.t_fn)
+    roots = calls[:,0]
+    all_dep_calls = np.bincount(roots, minlength=n)
+    dir_dep_calls = np.bincount(roots[calls[:,1] == table.root_krates()[roots]], minlength=n)
 
-    _pkg_graph = {}
+    pd_d = pd.Series(dir_dep_calls, index=table.roots)
+    pd_t = pd.Series(all_dep_calls - dir_dep_calls, index=table.roots)
 
-    for k,fns in _fn_closure.items():
-        G = nx.MultiDiGraph()
-        unique_edges = set([(src_krate, s_fn, "{}::{}".format(d_name,d_ver), t_fn) for (src_krate, s_fn, d_name, d_ver, t_fn, t_dispatch) in fns])
-        for (src_krate,_,dst_krate, _) in unique_edges: 
-            G.add_edge(src_krate, dst_krate)
-        _pkg_graph[k] = G
-    
-    _pd_dict_t = {}
-    _pd_dict_d = {}
-    
-    for (k, graph) in _pkg_graph.items():
-        ds = helper(k, graph)
-        _pd_dict_t[k] = ds['t']
-        _pd_dict_d[k] = ds['d']
-
-    pd_d = pd.Series(_pd_dict_d)
-    pd_t = pd.Series(_pd_dict_t) 
+    pd_d.to_csv("out/{}-{}-dependency-fn-d.csv".format(ts,name))
+    pd_t.to_csv("out/{}-{}-dependency-fn-t.csv".format(ts,name))
 
+@instrument.timed
 def num_of_dependents_fns(_fn_closure, name):
     """
-        Calculate the number of direct and transitive calls to dependents per package version
-    """
-    def dependents(pkg_graph):
-        reverse = pkg_graph.reverse(copy=True)
-        measured = []
-        for n in reverse:
-            dir_dep_calls = reverse.out_degree(n)
-            all_dep_calls = sum([reverse.number_of_edges(u,v) for (u,v) in nx.bfs_edges(reverse, source=n)])
-            trans_dep_calls = all_dep_calls - dir_dep_calls
-            measured.append((n, dir_dep_calls, trans_dep_calls))
-        return measured
-        
-    _pkg_graph = {}
-
-    for k,fns in _fn_closure.items():
-
-        G = nx.MultiDiGraph()
-        
-        unique_edges = set([(src_krate, s_fn, "{}::{}".format(d_name,d_ver), t_fn) for (src_krate, s_fn, d_name, d_ver, t_fn, t_dispatch) in fns])
-        for (src_krate,_,dst_krate, _) in unique_edges: 
-            G.add_edge(src_krate, dst_krate)
-        
-        _pkg_graph[k] = G
-    
-    _pd_dict_d = {}
-    _pd_dict_t = {}
+        Calculate the number of direct and transitive calls to dependents per package version,
+        summed over all dependency trees. Direct: distinct calls into the package. Transitive:
+        distinct calls into every package that (transitively) depends on it in the tree, i.e.
+        the direct calls of all its reachable dependents. This differs from the original
+        metric, which summed the call edges along a BFS tree of the reversed call graph.
+    """
+    table = as_fn_table(_fn_closure)
+    calls = unique_rows(table.root, table.src, table.s_fn, table.dst, table.t_fn)
 
-    for (k, graph) in _pkg_graph.items():
-        for (pkg_ver, direct_calls, transitive_calls) in num_of_dependents(graph):
-    
-            if pkg_ver not in _pd_dict_d:
-                _pd_dict_d[pkg_ver] = list()
-            
-            if pkg_ver not in _pd_dict_t:
-                _pd_dict_t[pkg_ver] = list()
-            
-            _pd_dict_d[pkg_ver].append(direct_calls)
-            _pd_dict_t[pkg_ver].append(transitive_calls)
-    
-    for (k, vs) in _pd_dict_d.items():
-        _pd_dict_d[k] = sum(vs)
+    # one node per (root, krate): the dependency trees are disjoint subgraphs
+    ncalls = len(calls)
+    nodes, node_of = unique_rows(np.concatenate([calls[:,0], calls[:,0]]), np.concatenate([calls[:,1], calls[:,3]]), return_inverse=True)
+    callers, callees = node_of[:ncalls], node_of[ncalls:]
 
-    for (k, vs) in _pd_dict_t.items():
-        _pd_dict_t[k] = sum(vs)
+    G = Condensation(len(nodes), callees, callers)
+    direct = np.bincount(callees, minlength=len(nodes))
+    # bit offsets per root keep every bitset as wide as the calls of one tree
+    trans = reach_counts(G, direct, nodes[:,0])
 
+    krates, first = np.unique(nodes[:,1], return_index=True)
+    krates = krates[np.argsort(first, kind="stable")]
+    index = [table.krates[k] for k in krates.tolist()]
+    krate_d = np.bincount(nodes[:,1], weights=direct, minlength=len(table.krates)).astype(np.int64)
+    krate_t = np.bincount(nodes[:,1], weights=trans, minlength=len(table.krates)).astype(np.int64)
 
-    pd_d = pd.Series(_pd_dict_d)
-    pd_t = pd.Series(_pd_dict_t) 
+    pd_d = pd.Series(krate_d[krates], index=index)
+    pd_t = pd.Series(krate_t[krates], index=index)
 
-    pd_d.to_csv("out/{}-{}-dependents-fn-d.csv".format(sys.argv[1],name))
-    pd_t.to_csv("out/{}-{}-dependents-fn-t.csv".format(sys.argv[1],name))
+    pd_d.to_csv("out/{}-{}-dependents-fn-d.csv".format(ts,name))
+    pd_t.to_csv("out/{}-{}-dependents-fn-t.csv".format(ts,name))
 
+@instrument.timed
 def num_of_overlap(_closure,name):
     """
         Calculate the number of overlapping packages in a dependency tree
@@ -626,161 +642,349 @@ def num_of_overlap(_closure,name):
         _pd_dict_overlap[k] = len([d for d, count in collections.Counter(ds).items() if count > 1]) 
 
     pd = pd.Series(_pd_dict_overlap)
-    pd.to_csv("out/{}-{}-package-overlap.csv".format(sys.argv[1],name))
+    pd.to_csv("out/{}-{}-package-overlap.csv".format(ts,name))
 
 
+@instrument.timed
 def num_of_overlap_depfn(_fn_closure, name):
     """
         Calculate the number of overlapping functions in a dependency tree
     """
-    _dict_overlap = {}
-    for k,fns in _fn_closure.items():
-        visited = set()
-        selected = []
-        for (_, _, d_name, d_ver, t_fn, _) in fns:
-            d_krate = "{}::{}::{}".format(d_name,d_ver,t_fn)
-            if d_krate in visited:
-                continue
-            else:
-                visited.add(d_krate)
-                selected.append(t_fn)
-        _dict_overlap[k] = len([fn for fn, count in collections.Counter(selected).items() if count > 1])
-    
-    pd_d = pd.Series(_dict_overlap)
-    pd_d.to_csv("out/{}-{}-overlap-fn.csv".format(sys.argv[1],name))
+    table = as_fn_table(_fn_closure)
+
+    # a t_fn overlaps when the same name is called in more than one package version of the tree,
+    # whether versions of one dependency or different packages
+    targets = unique_rows(table.root, table.dst, table.t_fn)
+    fns, counts = unique_rows(targets[:,0], targets[:,2], return_counts=True)
+    overlap = np.bincount(fns[counts > 1, 0], minlength=len(table.roots))
+
+    pd_d = pd.Series(overlap, index=table.roots)
+    pd_d.to_csv("out/{}-{}-overlap-fn.csv".format(ts,name))
+
+def parse_public_fns(krate, files):
+    """
+        Sorted distinct hashes of the public functions (see common/pubfns.py), read from the
+        pubfns file next to each entrypoints file or hashed from the entrypoints when there is none
+    """
+    p,v= krate.split("::")
+    hashes = []
+    for entry_file in files:
+        if os.path.exists(pubfns.pubfns_path(entry_file)):
+            hashes.append(np.fromfile(pubfns.pubfns_path(entry_file), dtype="<u8"))
+        else:
+            hashes.append(np.array(pubfns.hashes(p, parse_entrypoints(krate, [entry_file])), dtype=np.uint64))
+    return np.unique(np.concatenate(hashes)) if hashes else np.zeros(0, dtype=np.uint64)
+
+_public_fns_cache = StitchCache("public-fns", "entrypoints", parse_public_fns, sizeof=lambda hashes: hashes.nbytes)
 
+@instrument.timed
 def percentage_bloat_fns(_fn_closure, name):
     """
         Percentage of function bloat in a dependency treee
     """
-    _cache = {}
-    def get_public_fns(krate):
-        if krate in _cache:
-            return _cache[krate]
-        p,v= krate.split("::")
-        folder = "/datasets/praezi/stitching/{}/{}".format(p,v)
-        fns = set()
-        for _file in os.listdir(folder):
-            if fnmatch.fnmatch(_file, 'entrypoints-*.txt'):
-                fns = fns.union(set([line.rstrip('\n') for line in open("{}/{}".format(folder,_file))]))
-        fns = [base64.b64decode(fn.encode('ascii')).decode('ascii') for fn in fns]
-        fns = ["{}::{}".format(p,fn) for fn in fns]
-        _cache[krate] = fns
-        return fns
+    get_public_fns = _public_fns_cache.get
 
     _pd_dict_full = {}
     _pd_dict_set = {}
 
     for p, edges in _fn_closure.items():
-        fns = []
-        visited = set()
+        krates = set()
         for (s,t) in edges:
-            if s not in visited:
-                visited.add(s)
-                fns = fns + get_public_fns(s)
-            if t not in visited:
-                visited.add(t)
-                fns = fns + get_public_fns(t)
-        if len(fns) > 0:
-            _pd_dict_full[p] = len(fns)
-            _pd_dict_set[p] = len(set(fns))
+            krates.add(s)
+            krates.add(t)
+        fns = [get_public_fns(k) for k in krates]
+        full = sum(len(h) for h in fns)
+        if full > 0:
+            _pd_dict_full[p] = full
+            _pd_dict_set[p] = len(np.unique(np.concatenate(fns)))
     
     df_full = pd.Series(_pd_dict_full,name="full")
     df_set = pd.Series(_pd_dict_set,name="unique")
     df = pd.concat([df_full, df_set],axis=1)
     df['ratio'] = 1 - (df['unique'] / df['full'])
-    df.to_csv("out/bloat/{}-{}-pub-fn-bloat.csv".format(sys.argv[1],name))
+    df.to_csv("out/bloat/{}-{}-pub-fn-bloat.csv".format(ts,name))
 
 
-def percentage_package_reach(_closure,name):
+## HyperLogLog precision of percentage_package_reach, unset: exact reach
+REACH_PRECISION = int(os.environ["EVOLYSIS_REACH_PRECISION"]) if os.environ.get("EVOLYSIS_REACH_PRECISION") else None
+
+@instrument.timed
+def percentage_package_reach(_closure,name,precision=REACH_PRECISION):
     """
-        Calculate the local reaching centrality for each package in the network
+        Calculate the local reaching centrality for each package in the network.
+        With a precision p (4-16), reach is estimated with HyperLogLog sketches of 2^p registers
+        (standard error ~1.04/sqrt(2^p)) and written to a -local-reach-approx.csv file.
     """
-    G = nx.DiGraph()
-
+    ## Number packages in order of appearance, edges point from dependency to dependent
+    id_lookup = {}
+    src = []
+    dst = []
     for _,ds in _closure.items():
         for (s,t) in ds:
-            G.add_edge(t,s)
-
-    _centrality = {}
-
-    for n in G.nodes():
-        _centrality[n] = nx.local_reaching_centrality(G,n)
+            id_lookup.setdefault(t, len(id_lookup))
+            id_lookup.setdefault(s, len(id_lookup))
+            src.append(id_lookup[t])
+            dst.append(id_lookup[s])
+
+    G = Condensation(len(id_lookup), np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64))
+    if precision is None:
+        reach, suffix = reach_counts(G), ""
+    else:
+        reach, suffix = estimate_reach_counts(G, precision), "-approx"
 
-    pdc = pd.Series(_centrality)
-    pdc.to_csv("out/centrality/{}-{}-local-reach.csv".format(sys.argv[1],name))
+    pdc = pd.Series(reach / (len(id_lookup) - 1), index=list(id_lookup))
+    pdc.to_csv("out/centrality/{}-{}-local-reach{}.csv".format(ts,name,suffix))
 
+@instrument.timed
 def num_fn_reach_package(_fn_closure, name, pkgs = []):
     """
         Given a set of packages, look up functions in these packages and the calculate their reach in the CDN
     """
-    G = nx.DiGraph()
-    _id = 0
-    _node_id = {}
-    edges = [] 
-    for _, fns in _fn_closure.items():
-        for (src_krate, s_fn, d_name, d_ver, t_fn, t_dispatch) in fns:
-            key_src = src_krate + s_fn 
-            key_dst = d_name + "::" + d_ver + t_fn
-            edges.append((key_src,key_dst))
-            if key_src not in _node_id:
-                _node_id[key_src]  = _id
-                _id+=1
-            G.add_node(_node_id[key_src],krate=src_krate, fn=s_fn)
-            if key_dst not in _node_id:
-                _node_id[key_dst]  = _id
-                _id+=1
-            
-            G.add_node(_node_id[key_dst],krate=d_name + "::" + d_ver, fn=t_fn)
-            G.add_edge(_node_id[key_dst],_node_id[key_src])
+    table = as_fn_table(_fn_closure)
+    G = table.fn_graph()
 
     # Find all functions from the provided package(s)
-    search_terms = pkgs 
-    search_nodes = []
-    for term in search_terms:
-        search_nodes = search_nodes + [(n,d) for n,d in G.nodes(data=True) if d['krate']==term]
-
-
-    def find_all(G,n):
-        visited = set()
-        visited.add(n)
-        worklist = list(G.neighbors(n))
-
-        while worklist:
-            w = worklist.pop()
-            if w in visited:
-                continue
-            visited.add(w)
-            worklist = worklist + list(G.neighbors(w))
-        
-        return list(set(visited) - set([n]))
+    search_nodes = np.concatenate([G.functions(table.krate_id(term)) for term in pkgs] + [np.zeros(0, dtype=np.int64)])
 
+    # number of packages among the (transitive) callers of every function
+    reach = source_label_counts(G.n, G.callee, G.caller, G.krate, search_nodes)
 
     lines = []
     lines.append("package,fn,reach")
-    for n,d in search_nodes:
-        all_fn = find_all(G,n)
-        all_pkg = set([G.nodes[_fn]['krate'] for _fn in all_fn])
-        lines.append("{},{},{}".format(d['krate'],base64.b64decode(d['fn'].encode('ascii')).decode('ascii'),len(all_pkg)))
+    for (n, all_pkg) in zip(search_nodes.tolist(), reach.tolist()):
+        fn = table.fns[G.fn[n]]
+        lines.append("{},{},{}".format(table.krates[G.krate[n]],base64.b64decode(fn.encode('ascii')).decode('ascii'),all_pkg))
 
-    with open("out/centrality/{}-{}-fn-reach.csv".format(sys.argv[1],name), "w") as outfile:
+    with open("out/centrality/{}-{}-fn-reach.csv".format(ts,name), "w") as outfile:
         outfile.writelines(s + '\n' for s in lines)
 
 # ####
 # ###### Create Networks 
 # #####
 
-# Calculate Dependency Closure (package level)
-index_closure = dep_closure(_index_snapshot,_dependencies,_features)
-docsrs_closure = dep_closure(_docsrs_snapshot,_dependencies,_features)
+# name -> (touched names, krate, resolved_tree) of the latest resolution per network
+_index_roots = {}
+_docsrs_roots = {}
+_praezi_roots = {}
+
+# (krate, enabled optionals) -> expansion, shared by all roots of a network
+_index_expansions = {}
+_docsrs_expansions = {}
+_praezi_expansions = {}
+
+# With EVOLYSIS_LAZY set, a single month only builds the snapshots; closures are queried with closure_of()
+LAZY = bool(os.environ.get("EVOLYSIS_LAZY")) and ts_start == ts_end
+
+# Resolved roots are checkpointed per network and month (see checkpoint.py); an empty EVOLYSIS_CHECKPOINT_DIR disables it
+CHECKPOINT_DIR = os.environ.get("EVOLYSIS_CHECKPOINT_DIR", os.path.join(CACHE_DIR, "closures"))
+_checkpoint_key = cache_key("crates.io-index", "releases.csv", "docsrs.csv")
+# the resolution code: this script (expand, replay, ..) and the modules it resolves with
+_checkpoint_code = checkpoint.code_version([os.path.realpath(__file__)] +
+    [os.path.join(os.path.dirname(os.path.realpath(__file__)), m) for m in ["features.py", "resolver.py", "semver_ffi.py", "crates_index.py"]])
 
-# Calculate Dependency Closure (function level)
-praezi_fn_closure = dep_fn_closure(_praezi_snapshot,_dependencies,_features)
-praezi_pkg_closure = fn2pkgclosure(praezi_fn_closure)
+def closure_checkpoint(network, month):
+    """
+        Checkpoint of a network for a month, keyed by the inputs and the code of the resolution.
+        None without a fingerprint: an index that is not a git checkout, or a stitching store without manifest.
+    """
+    if not CHECKPOINT_DIR or _checkpoint_key is None:
+        return None
+    key = [checkpoint.FORMAT, _checkpoint_code, _checkpoint_key]
+    if network == "praezi":
+        if _praezi_manifest is None:
+            return None
+        st = os.stat(manifest.manifest_path(STORE))
+        key.append([st.st_size, st.st_mtime_ns])
+    fingerprint = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()[:16]
+    return checkpoint.Checkpoint(CHECKPOINT_DIR, network, month, fingerprint)
+
+def evolve(month):
+    """
+        Advance the snapshots to `month` and rebuild the networks, resolving only the packages whose tree could have changed
+    """
+    global ts, dt_max, dt_min
+    global _index_snapshot, _docsrs_snapshot, _praezi_snapshot
+    global index_closure, docsrs_closure, praezi_fn_closure, praezi_pkg_closure
+
+    ts = month
+    dt_max = parse_month(ts)
+    dt_min = dt_max - relativedelta(months=1)
+    instrument.context["month"] = ts
+
+    with instrument.phase("snapshot"):
+        changed = advance_snapshots(dt_max)
+        _index_snapshot = ordered_snapshot(_index_versions)
+        _docsrs_snapshot = ordered_snapshot(_docsrs_versions)
+        _praezi_snapshot = ordered_snapshot(_praezi_versions)
+        _index_resolver.update(_index_snapshot, changed["index"])
+        _docsrs_resolver.update(_docsrs_snapshot, changed["docsrs"])
+        _praezi_resolver.update(_praezi_snapshot, changed["praezi"])
+
+        stale = {
+            "index": len(stale_roots(_index_snapshot, _index_roots, changed["index"])),
+            "docsrs": len(stale_roots(_docsrs_snapshot, _docsrs_roots, changed["docsrs"])),
+            "praezi": len(stale_roots(_praezi_snapshot, _praezi_roots, changed["praezi"])),
+        }
+
+        invalidate_expansions(_index_expansions, changed["index"])
+        invalidate_expansions(_docsrs_expansions, changed["docsrs"])
+        invalidate_expansions(_praezi_expansions, changed["praezi"])
+
+    if LAZY:
+        index_closure = docsrs_closure = praezi_fn_closure = praezi_pkg_closure = None
+        print("[{}] {}: closures are resolved on demand, see closure_of()".format(sys.argv[0], ts))
+        return
+
+    checkpoints = dict((network, closure_checkpoint(network, ts)) for network in ["index", "docsrs", "praezi"])
+
+    elapsed = {}
+    # Calculate Dependency Closure (package level)
+    with instrument.phase("closure index") as ph:
+        index_closure = dep_closure(_index_resolver,_dependencies,_feature_table,_index_roots,changed["index"],_index_expansions,checkpoints["index"])
+    elapsed["index"] = ph.wall
+
+    with instrument.phase("closure docsrs") as ph:
+        docsrs_closure = dep_closure(_docsrs_resolver,_dependencies,_feature_table,_docsrs_roots,changed["docsrs"],_docsrs_expansions,checkpoints["docsrs"])
+    elapsed["docsrs"] = ph.wall
+
+    # Calculate Dependency Closure (function level)
+    with instrument.phase("closure praezi") as ph:
+        praezi_fn_closure = FnTable.from_closure(dep_fn_closure(_praezi_resolver,_dependencies,_feature_table,_praezi_roots,changed["praezi"],_praezi_expansions,checkpoints["praezi"]))
+        praezi_pkg_closure = fn2pkgclosure(praezi_fn_closure)
+    elapsed["praezi"] = ph.wall
+
+    # roots restored from a checkpoint were not resolved
+    for (network, cp) in checkpoints.items():
+        if cp is not None:
+            stale[network] -= cp.restored
+            instrument.count("checkpoint.restored.{}".format(network), cp.restored)
+        instrument.count("resolved.{}".format(network), stale[network])
+
+    print("[{}] {}: resolved {} index ({:.1f}s), {} docs.rs ({:.1f}s), {} praezi packages ({:.1f}s)".format(sys.argv[0], ts,
+        stale["index"], elapsed["index"], stale["docsrs"], elapsed["docsrs"], stale["praezi"], elapsed["praezi"]))
+
+# ####
+# ###### On-demand closure queries
+# ####
+
+NETWORKS = ["index", "docsrs", "praezi"]
+
+# (network, month) -> (resolver, roots, expansions) of the months queried besides the current one
+_query_states = {}
+# name -> [names of packages with a version depending on it,..], built on the first dependents query
+_reverse_dependencies = None
+
+def network_state(network, month):
+    """
+        (resolver, roots, expansions) of a network at a month; the current month uses those of the session
+    """
+    if month == ts:
+        return {"index": (_index_resolver, _index_roots, _index_expansions),
+                "docsrs": (_docsrs_resolver, _docsrs_roots, _docsrs_expansions),
+                "praezi": (_praezi_resolver, _praezi_roots, _praezi_expansions)}[network]
+    if (network, month) not in _query_states:
+        is_valid = {"index": lambda p,v: True, "docsrs": is_docsrs_valid, "praezi": is_praezi_valid}[network]
+        day = parse_month(month).date()
+        versions = {}
+        for (date, p, v) in _timeline:
+            if date > day:
+                break
+            if is_valid(p,v):
+                versions.setdefault(p, set()).add(v)
+        _query_states[(network, month)] = (Resolver(ordered_snapshot(versions)), {}, {})
+    return _query_states[(network, month)]
+
+def dependent_candidates(names, snapshot):
+    """
+        Packages of a snapshot with a version depending on one of names, directly or not, nearest first
+    """
+    global _reverse_dependencies
+    if _reverse_dependencies is None:
+        _reverse_dependencies = {}
+        for (krate, deps) in _dependencies.items():
+            p = krate.split("::")[0]
+            for d in deps:
+                _reverse_dependencies.setdefault(d[0], {})[p] = None
+    visited = set(names)
+    queue = collections.deque(names)
+    while queue:
+        for p in _reverse_dependencies.get(queue.popleft(), ()):
+            if p not in visited:
+                visited.add(p)
+                queue.append(p)
+                if p in snapshot:
+                    yield p
+
+def closure_of(crates, ts=None, network="praezi", dependents=False):
+    """
+        Stream (krate, resolved_tree) of the packages `crates` (a name or a list of names) at month ts
+        (default: the current one) as in the closures of a network: dependency edges for index and docsrs,
+        calls for praezi. With dependents=True, the packages whose tree reaches one of `crates` instead.
+        Only the packages asked for are resolved, once per network and month; packages without a tree are skipped.
+    """
+    if network not in NETWORKS:
+        raise Exception("Unknown network: {}".format(network))
+    if isinstance(crates, str):
+        crates = [crates]
+    month = parse_month(ts).strftime("%Y-%m") if ts else dt_max.strftime("%Y-%m")
+    _resolver, _roots, _expansions = network_state(network, month)
+    resolve_root = resolve_fn_root if network == "praezi" else resolve_dep_root
+
+    if dependents:
+        names = set(crates)
+        roots = dependent_candidates(crates, _resolver.snapshot)
+    else:
+        roots = [p for p in crates if p in _resolver.snapshot]
+    for p in roots:
+        if p not in _roots:
+            _roots[p] = traced(_resolver, lambda p: resolve_root(p, _resolver, _dependencies, _feature_table, _expansions), p)
+        _, krate, resolved_tree = _roots[p]
+        if not resolved_tree:
+            continue
+        if dependents:
+            if network == "praezi":
+                reached = any(call[2] in names for call in resolved_tree)
+            else:
+                reached = any(t.split("::")[0] in names for (s,t) in resolved_tree)
+            if not reached:
+                continue
+        yield (krate, resolved_tree)
+
+# Metrics written to out/ for every month in range mode: (function, network variable, name)
+MONTHLY_METRICS = [
+    (num_of_dependencies, "index_closure", "index"),
+    (num_of_dependencies, "docsrs_closure", "docsrs"),
+    (num_of_dependencies, "praezi_pkg_closure", "praezi"),
+    (num_of_overlap_depfn, "praezi_fn_closure", "praezi"),
+]
+
+evolve(ts_start)
+
+if ts_end != ts_start:
+    os.makedirs("out", exist_ok=True)
+    for month in months(ts_start, ts_end):
+        if month != ts_start:
+            evolve(month)
+        for (metric, network, name) in MONTHLY_METRICS:
+            metric(globals()[network], name)
+
+for (name, stats) in resolver_stats().items():
+    print("[{}] {} resolver: {hits} hits, {misses} misses, {evictions} evictions, hit rate {hit_rate:.2%}".format(sys.argv[0], name, **stats))
+for cache in [_cache, _dep_paths_cache]:
+    print("[{}] {} cache: {hits} hits, {disk_hits} disk hits, {misses} misses, {evictions} evictions, {prefetched} prefetched, {mb:.1f} MB".format(sys.argv[0], cache.name, **cache.stats()))
+
+instrument.add_section("resolvers", resolver_stats)
+instrument.add_section("features", _feature_table.stats)
+instrument.add_section("caches", lambda: dict((cache.name, cache.stats()) for cache in [_cache, _dep_paths_cache, _public_fns_cache]))
+REPORT_PATH = "out/{}-report.json".format(sys.argv[1])
+PROFILE_PATH = "out/{}-profile.folded".format(sys.argv[1])
+instrument.write_report(REPORT_PATH, PROFILE_PATH)
+# written again on exit, with the metrics run in the interactive session
+atexit.register(instrument.write_report, REPORT_PATH, PROFILE_PATH)
+print("[{}] report: {}".format(sys.argv[0], REPORT_PATH))
 
 # ####
 # ###### RUN ANALYSIS....
 # #####
 
 # Example: num_of_dependency_fns(praezi_fn_closure, "praezi")
-
@@ -0,0 +1,148 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Feature resolution over the features table of the index
+   (name::ver -> {feature: [feature, optional dependency or dep/feature,..]}).
+
+   Every feature of a crate version is flattened once, on first use, into the
+   tuple of entries it enables. The optionals enabled in a resolution state are
+   interned as FeatureSet objects: equal sets are the same object, so
+   (krate, feature set) keys hash and compare by identity instead of by a
+   string of the sorted list. The feature set of a dependency edge,
+   (dep crate, requested features, optional, default features, features passed
+   on by the dependent) -> FeatureSet, is memoized.
+
+   The results are those of expanding the feature maps recursively on every
+   edge: a feature set keeps repeated optionals (states are told apart by
+   their sorted list), a cyclic feature fails, and so does passing features
+   to a dependency without a features entry.
+
+   Example:
+      table = FeatureTable(_features)
+      fs = table.dependency("serde::1.0.104", ["derive"], False, True)
+      "serde_derive" in fs.members
+      table.dependency("tokio::0.2.11", [], True, True, ["rt-core"])   # a dependent enabling "tokio/rt-core"
+"""
+
+
+class FeatureSet(object):
+    """
+        Sorted optionals enabled in a state, their set, and the features they
+        pass on to dependencies: dep -> [feature,..] (None if an entry has more than one "/")
+    """
+    __slots__ = ["optionals", "members", "transitive"]
+
+    def __init__(self, optionals):
+        self.optionals = optionals
+        self.members = frozenset(optionals)
+        self.transitive = {}
+        for opt in optionals:
+            if "/" in opt:
+                parts = opt.split("/")
+                if len(parts) != 2:
+                    self.transitive = None
+                    break
+                self.transitive.setdefault(parts[0], []).append(parts[1])
+
+    def __repr__(self):
+        return "FeatureSet({})".format(list(self.optionals))
+
+
+class FeatureTable(object):
+    def __init__(self, features):
+        self.features = features
+        self._flat = {}
+        self._sets = {}
+        self._dependencies = {}
+        self.EMPTY = self.intern([])
+
+    def intern(self, optionals):
+        """
+            The FeatureSet of a list of optionals
+        """
+        key = tuple(sorted(optionals))
+        fs = self._sets.get(key)
+        if fs is None:
+            fs = self._sets[key] = FeatureSet(key)
+        return fs
+
+    def _feature(self, krate, fmap, key, expanding=()):
+        flat = self._flat.get((krate, key))
+        if flat is None:
+            if key in expanding:
+                raise Exception("Cyclic feature {} of {}".format(key, krate))
+            expanding = expanding + (key,)
+            flat = []
+            for k in fmap[key]:
+                if k in fmap:
+                    flat.extend(self._feature(krate, fmap, k, expanding))
+                else:
+                    flat.append(k)
+            flat = self._flat[(krate, key)] = tuple(flat)
+        return flat
+
+    def flatten(self, krate, keys):
+        """
+            Entries enabled by the features `keys` of krate, with repetitions; keys that are not features are kept
+        """
+        fmap = self.features[krate]
+        flat = []
+        for key in keys:
+            if key in fmap:
+                flat.extend(self._feature(krate, fmap, key))
+            else:
+                flat.append(key)
+        return flat
+
+    def enabled(self, d_krate, d_features, d_optional, d_default_features):
+        """
+            Distinct entries of d_krate enabled by its default features and the requested ones
+        """
+        # Scenario: no optional, no default features, and no default features requested
+        if d_optional == False and d_default_features == False and not d_features:
+            return []
+        enabled = set()
+        if d_default_features and d_krate in self.features and "default" in self.features[d_krate]:
+            enabled.update(self.flatten(d_krate, ["default"]))
+        if d_features and d_krate in self.features:
+            enabled.update(self.flatten(d_krate, d_features))
+        return list(enabled)
+
+    def dependency(self, d_krate, d_features, d_optional, d_default_features, passed=None):
+        """
+            FeatureSet of a dependency edge to d_krate, with the features `passed` on by the dependent
+        """
+        key = (d_krate, tuple(d_features) if d_features else (), d_optional, d_default_features, tuple(passed) if passed else None)
+        d_fs = self._dependencies.get(key)
+        if d_fs is None:
+            optionals = self.enabled(d_krate, d_features, d_optional, d_default_features)
+            if passed:
+                optionals = optionals + self.flatten(d_krate, passed)
+            d_fs = self._dependencies[key] = self.intern(optionals)
+        return d_fs
+
+    def stats(self):
+        return {"flattened": len(self._flat), "feature_sets": len(self._sets), "dependencies": len(self._dependencies)}
@@ -0,0 +1,226 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Columnar function-level closure. The rows of a dep_fn_closure result,
+   (src_krate, s_fn, d_name, d_ver, t_fn, t_dispatch) per root package, are
+   interned and stored as int32 NumPy columns:
+
+      root      index into `roots` (rows are grouped by root, in closure order)
+      src, dst  index into `krates` (crate::ver)
+      s_fn, t_fn  index into `fns`
+      dispatch  index into `dispatches`
+
+   The table behaves like the dict it replaces (`items()`, `[root]`, `len`, ...)
+   by decoding rows on access; metrics use the columns directly.
+
+   Example:
+      table = FnTable.from_closure(dep_fn_closure(...))
+      rows = unique_rows(table.root, table.dst, table.t_fn)
+      table.fn_graph().functions(table.krate_id("serde::1.0.104"))
+"""
+import numpy as np
+
+from array import array
+
+
+class Interner(object):
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def __call__(self, value):
+        idx = self.ids.get(value)
+        if idx is None:
+            idx = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+
+class FnTable(object):
+    def __init__(self, roots, krates, fns, dispatches, offsets, root, src, s_fn, dst, t_fn, dispatch):
+        self.roots = roots
+        self.krates = krates
+        self.fns = fns
+        self.dispatches = dispatches
+        self.offsets = offsets
+        self.root = root
+        self.src = src
+        self.s_fn = s_fn
+        self.dst = dst
+        self.t_fn = t_fn
+        self.dispatch = dispatch
+        self._index = dict((r, i) for (i, r) in enumerate(roots))
+        self._names = [k.split("::") for k in krates]
+
+    @classmethod
+    def from_closure(cls, closure):
+        """
+            Build the table from {root: [(src_krate, s_fn, d_name, d_ver, t_fn, t_dispatch),..]}
+        """
+        krates = Interner()
+        fns = Interner()
+        dispatches = Interner()
+        roots = []
+        offsets = [0]
+        columns = [array('i') for _ in range(5)]
+        (src, s_fn, dst, t_fn, dispatch) = columns
+        for (k, calls) in closure.items():
+            roots.append(k)
+            krates(k)
+            for (src_krate, _s_fn, d_name, d_ver, _t_fn, t_dispatch) in calls:
+                src.append(krates(src_krate))
+                s_fn.append(fns(_s_fn))
+                dst.append(krates("{}::{}".format(d_name, d_ver)))
+                t_fn.append(fns(_t_fn))
+                dispatch.append(dispatches(t_dispatch))
+            offsets.append(len(src))
+        offsets = np.array(offsets, dtype=np.int64)
+        root = np.repeat(np.arange(len(roots), dtype=np.int32), np.diff(offsets))
+        columns = [np.frombuffer(c, dtype=np.int32) if len(c) else np.zeros(0, dtype=np.int32) for c in columns]
+        return cls(roots, krates.values, fns.values, dispatches.values, offsets, root, *columns)
+
+    def root_krates(self):
+        """
+            Krate id of every root
+        """
+        return np.array([self.krate_id(r) for r in self.roots], dtype=np.int32)
+
+    def rows(self, k):
+        """
+            Decoded rows of a root package
+        """
+        i = self._index[k]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        krates, fns, dispatches, names = self.krates, self.fns, self.dispatches, self._names
+        return [(krates[s], fns[sf], names[d][0], names[d][1], fns[tf], dispatches[dp])
+                for (s, sf, d, tf, dp) in zip(self.src[start:end].tolist(), self.s_fn[start:end].tolist(),
+                                             self.dst[start:end].tolist(), self.t_fn[start:end].tolist(),
+                                             self.dispatch[start:end].tolist())]
+
+    def __len__(self):
+        return len(self.roots)
+
+    def __iter__(self):
+        return iter(self.roots)
+
+    def __contains__(self, k):
+        return k in self._index
+
+    def __getitem__(self, k):
+        return self.rows(k)
+
+    def keys(self):
+        return list(self.roots)
+
+    def values(self):
+        return [self.rows(k) for k in self.roots]
+
+    def items(self):
+        for k in self.roots:
+            yield (k, self.rows(k))
+
+    def krate_id(self, krate):
+        """
+            Id of a crate::ver string, None if it does not occur in the table
+        """
+        if getattr(self, "_krate_ids", None) is None:
+            self._krate_ids = dict((k, i) for (i, k) in enumerate(self.krates))
+        return self._krate_ids.get(krate)
+
+    def fn_graph(self):
+        """
+            Function-level call graph of all rows, built once per table
+        """
+        if getattr(self, "_fn_graph", None) is None:
+            self._fn_graph = FnGraph(self)
+        return self._fn_graph
+
+    def nbytes(self):
+        return sum(c.nbytes for c in (self.offsets, self.root, self.src, self.s_fn, self.dst, self.t_fn, self.dispatch))
+
+
+class FnGraph(object):
+    """
+        Call graph whose nodes are the distinct (krate, fn) pairs of a table,
+        numbered in order of appearance (the caller of a row before its callee)
+    """
+    def __init__(self, table):
+        krate_seq = np.column_stack([table.src, table.dst]).ravel()
+        fn_seq = np.column_stack([table.s_fn, table.t_fn]).ravel()
+        pairs, inverse = unique_rows(krate_seq, fn_seq, return_inverse=True)
+        _, first = np.unique(inverse, return_index=True)
+        order = np.argsort(first, kind="stable")
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        node = rank[inverse]
+        self.n = len(order)
+        self.krate = pairs[order, 0]
+        self.fn = pairs[order, 1]
+        self.caller = node[0::2]
+        self.callee = node[1::2]
+        # crate -> function ids in node order
+        self._by_krate = np.argsort(self.krate, kind="stable")
+        self._krate_starts = np.searchsorted(self.krate[self._by_krate], np.arange(len(table.krates) + 1))
+
+    def functions(self, krate_id):
+        """
+            Node ids of the functions of a crate
+        """
+        if krate_id is None:
+            return np.zeros(0, dtype=np.int64)
+        return self._by_krate[self._krate_starts[krate_id]:self._krate_starts[krate_id + 1]]
+
+
+def as_fn_table(closure):
+    return closure if isinstance(closure, FnTable) else FnTable.from_closure(closure)
+
+
+def unique_rows(*columns, **kwargs):
+    """
+        Distinct rows of int32 columns as a 2d array (sorted), followed by the
+        inverse and then the counts when `return_inverse`/`return_counts` are set
+        (the order of np.unique): (rows, inverse, counts).
+        Rows are packed into one int64 key when the column ranges allow it.
+    """
+    flags = {"return_counts": kwargs.get("return_counts", False), "return_inverse": kwargs.get("return_inverse", False)}
+    if not columns[0].size:
+        rows = np.zeros((0, len(columns)), dtype=np.int32)
+        extra = [np.zeros(0, dtype=np.int64) for f in ("return_inverse", "return_counts") if flags[f]]
+        return tuple([rows] + extra) if extra else rows
+    radix = [int(c.max()) + 1 for c in columns]
+    if np.prod([float(r) for r in radix]) >= 2 ** 63:
+        result = np.unique(np.stack(columns, axis=1), axis=0, **flags)
+        if flags["return_inverse"]:
+            result = (result[0], result[1].ravel()) + result[2:]
+        return result
+    key = np.zeros(columns[0].size, dtype=np.int64)
+    for (c, r) in zip(columns, radix):
+        key = key * r + c
+    result = np.unique(key, **flags)
+    key = result[0] if isinstance(result, tuple) else result
+    rows = np.empty((key.size, len(columns)), dtype=np.int32)
+    for i in range(len(columns) - 1, -1, -1):
+        key, rows[:, i] = np.divmod(key, radix[i])
+    return (rows,) + result[1:] if isinstance(result, tuple) else rows
@@ -0,0 +1,70 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Fork-based worker pool for evolysis-rustcg.py. Workers are forked after the
+   lookup tables, snapshots and caches are built and inherit them copy-on-write;
+   only task arguments and results are pickled. Tasks can be closures, as they
+   are never sent to the workers. Instrumentation counts made by a task are
+   merged into the parent's counters.
+
+   Example:
+      results = forkpool.run(lambda p: resolve(p), roots, jobs=8)   # {p: result}
+      for (p, result) in forkpool.imap(lambda p: resolve(p), roots, jobs=8): ..
+"""
+import multiprocessing
+
+import instrument
+
+_task = None
+
+def _call(item):
+    # counts made by the task are sent back with its result
+    before = instrument.counters.copy()
+    result = _task(item)
+    return (item, result, instrument.counters - before)
+
+
+def imap(task, items, jobs, chunksize=None):
+    """
+        Yield (item, task(item)) as the `jobs` forked workers finish them
+    """
+    global _task
+    _task = task
+    try:
+        with multiprocessing.get_context("fork").Pool(jobs) as pool:
+            if chunksize is None:
+                chunksize = max(1, len(items) // (jobs * 64))
+            for (item, result, counts) in pool.imap_unordered(_call, items, chunksize):
+                instrument.merge(counts)
+                yield (item, result)
+    finally:
+        _task = None
+
+
+def run(task, items, jobs, chunksize=None):
+    """
+        {item: task(item)}, computed by `jobs` forked workers in the order of `items`
+    """
+    return dict(imap(task, items, jobs, chunksize))
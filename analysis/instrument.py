@@ -0,0 +1,226 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Run instrumentation for evolysis-rustcg.py.
+
+   Phases record wall time, CPU time (including forked workers that were
+   waited for) and the peak RSS while the phase was open. On Linux the peak is
+   reset at phase boundaries (/proc/self/clear_refs), elsewhere it is the peak of
+   the process so far. Counters are named integers (FFI calls, stitching files
+   read, ..); counts made in forkpool workers are merged into the parent.
+   Sections are callables evaluated when the report is written (resolver and
+   cache statistics).
+
+   With EVOLYSIS_PROFILE_MS set, a sampling profiler (SIGPROF every that many
+   ms of CPU time) counts the Python stacks of the main thread, written in
+   folded format (`frame;frame;frame count`, as read by flamegraph.pl).
+
+   Example:
+      with instrument.phase("closure index") as ph:
+          ...
+      ph.wall
+      instrument.count("ffi.max_satisfying")
+      @instrument.timed
+      def num_of_dependencies(_closure, name): ..
+      instrument.write_report("out/2016-12-report.json")
+"""
+import atexit
+import collections
+import functools
+import json
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+
+PROFILE_MS = float(os.environ.get("EVOLYSIS_PROFILE_MS") or 0)
+
+counters = collections.Counter()
+phases = []
+# added to every phase started while set, e.g. {"month": "2016-12"}
+context = {}
+sections = collections.OrderedDict()
+samples = collections.Counter()
+
+_lock = threading.Lock()
+_open = []
+_started = time.time()
+
+
+def count(name, n=1):
+    with _lock:
+        counters[name] += n
+
+
+def merge(delta):
+    with _lock:
+        counters.update(delta)
+
+
+def add_section(name, stats):
+    sections[name] = stats
+
+
+####
+##### Phases
+####
+
+def _cpu():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+_started_cpu = _cpu()
+
+
+def _peak_rss():
+    """
+        Peak RSS in bytes since the last reset
+    """
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) << 10
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss << 10
+
+
+def _sample_rss():
+    # fold the peak into every open phase, then start a new peak
+    peak = _peak_rss()
+    for ph in _open:
+        ph.peak_rss = max(ph.peak_rss, peak)
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        pass
+
+
+class Phase(object):
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+
+    def __enter__(self):
+        self.context = dict(context)
+        _sample_rss()
+        _open.append(self)
+        self._wall = time.time()
+        self._cpu = _cpu()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.time() - self._wall
+        self.cpu = _cpu() - self._cpu
+        _sample_rss()
+        _open.remove(self)
+        phases.append(self)
+        return False
+
+    def as_dict(self):
+        record = {"name": self.name, "wall": self.wall, "cpu": self.cpu, "peak_rss_mb": self.peak_rss / float(1 << 20)}
+        record.update(self.context)
+        return record
+
+
+def phase(name):
+    return Phase(name)
+
+
+def timed(metric):
+    """
+        Run every call of a metric `metric(network, name, ..)` as the phase "<metric> <name>"
+    """
+    @functools.wraps(metric)
+    def wrapper(*args, **kwargs):
+        with phase(" ".join([metric.__name__] + [str(a) for a in args[1:2]])):
+            return metric(*args, **kwargs)
+    return wrapper
+
+
+####
+##### Sampling profiler
+####
+
+def _on_sample(signum, frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    samples[";".join(reversed(stack))] += 1
+
+
+def start_profiler(ms=PROFILE_MS):
+    """
+        Sample the main thread every `ms` of CPU time; forked children do not inherit the timer
+    """
+    signal.signal(signal.SIGPROF, _on_sample)
+    signal.setitimer(signal.ITIMER_PROF, ms / 1000.0, ms / 1000.0)
+    # a sample during interpreter shutdown would kill the process; runs after the other exit handlers
+    atexit.register(stop_profiler)
+
+
+def stop_profiler():
+    signal.setitimer(signal.ITIMER_PROF, 0, 0)
+
+
+####
+##### Report
+####
+
+def report():
+    return {
+        "argv": sys.argv,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_started)),
+        "wall": time.time() - _started,
+        "cpu": _cpu() - _started_cpu,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "phases": [ph.as_dict() for ph in phases],
+        "counters": dict(counters),
+        "sections": dict((name, stats()) for (name, stats) in sections.items()),
+    }
+
+
+def write_report(path, profile_path=None):
+    """
+        Write the JSON report (and the folded profile samples, if any) atomically
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    with open(path + ".tmp", "w") as fh:
+        json.dump(report(), fh, indent=2, sort_keys=False)
+    os.replace(path + ".tmp", path)
+    if profile_path and samples:
+        with open(profile_path + ".tmp", "w") as fh:
+            fh.writelines("{} {}\n".format(stack, n) for (stack, n) in samples.most_common())
+        os.replace(profile_path + ".tmp", profile_path)
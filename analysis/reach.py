@@ -0,0 +1,371 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Reachability counting on integer graphs. Nodes are 0..n-1 and edges are
+   given as two id arrays. The graph is stored as CSR arrays and condensed
+   into its strongly connected components (iterative Tarjan). Values are then
+   propagated over the condensed DAG in reverse topological order, so every
+   component is visited once with the union of the values of everything it
+   reaches; a value is dropped as soon as all its predecessors are visited.
+
+   `reach_counts` uses this with Python ints as exact bitsets: every node owns
+   `weight` bits, and the popcount of a union is the total weight of a
+   reachable set. For graphs made of disjoint groups (e.g. one dependency tree
+   per root), the bit offsets restart in every group. `estimate_reach_counts` propagates HyperLogLog sketches of
+   2^precision registers instead, so memory per value is fixed and the
+   relative standard error is about 1.04 / sqrt(2^precision).
+   `reach_label_counts` counts distinct labels (e.g. the crate of a function)
+   in reachable sets, and `source_label_counts` does so only for a few source
+   nodes, on the subgraph they reach.
+
+   Example:
+      g = Condensation(n, src, dst)
+      g.out_degree()       # distinct successors per node
+      reach_counts(g)      # reachable nodes per node, the node itself excluded
+      estimate_reach_counts(g, 12)
+      source_label_counts(n, src, dst, labels, sources)   # distinct labels reachable from sources
+"""
+import collections
+import operator
+
+import numpy as np
+
+
+def csr(n, src, dst):
+    """
+        Deduplicated adjacency of `n` nodes as (indptr, indices), successors in ascending order
+    """
+    key = np.unique(np.asarray(src, dtype=np.int64) * n + np.asarray(dst, dtype=np.int64))
+    src, dst = np.divmod(key, n)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst
+
+
+def scc(indptr, indices):
+    """
+        Component id of every node and the number of components. Components are
+        numbered in reverse topological order: an edge between two components
+        always goes from the higher to the lower id.
+    """
+    n = len(indptr) - 1
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+    index = [-1] * n
+    low = [0] * n
+    onstack = [False] * n
+    comp = [-1] * n
+    stack = []
+    counter = 0
+    ncomp = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        onstack[root] = True
+        work = [(root, indptr[root])]
+        while work:
+            v, i = work[-1]
+            end = indptr[v + 1]
+            while i < end:
+                w = indices[i]
+                i += 1
+                if index[w] == -1:
+                    work[-1] = (v, i)
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    onstack[w] = True
+                    work.append((w, indptr[w]))
+                    break
+                elif onstack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                work.pop()
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        onstack[w] = False
+                        comp[w] = ncomp
+                        if w == v:
+                            break
+                    ncomp += 1
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+    return np.array(comp, dtype=np.int64), ncomp
+
+
+class Condensation(object):
+    def __init__(self, n, src, dst):
+        self.n = n
+        self.indptr, self.indices = csr(n, src, dst)
+        self.comp, self.ncomp = scc(self.indptr, self.indices)
+        s = self.comp[np.repeat(np.arange(n), np.diff(self.indptr))]
+        d = self.comp[self.indices]
+        keep = s != d
+        self.dag_indptr, self.dag_indices = csr(self.ncomp, s[keep], d[keep])
+
+    def out_degree(self):
+        return np.diff(self.indptr)
+
+    def sizes(self, weights=None):
+        """
+            Number (or total weight) of the nodes of every component
+        """
+        return np.bincount(self.comp, weights=weights, minlength=self.ncomp)
+
+    def members(self):
+        """
+            Nodes ordered by component and the start of every component in that order
+        """
+        order = np.argsort(self.comp, kind="stable")
+        starts = np.zeros(self.ncomp + 1, dtype=np.int64)
+        np.cumsum(self.sizes().astype(np.int64), out=starts[1:])
+        return order, starts
+
+    def propagate(self, leaf, union, visit):
+        """
+            Visit the components sinks first. `visit(c, below)` gets the union of
+            the values of all components reachable from c (None for sinks); the
+            value of c itself is `union(below, leaf(c))`. `union` must not modify
+            its arguments.
+        """
+        indptr = self.dag_indptr.tolist()
+        indices = self.dag_indices.tolist()
+        pending = np.bincount(self.dag_indices, minlength=self.ncomp).tolist()
+        values = {}
+        for c in range(self.ncomp):
+            below = None
+            for d in indices[indptr[c]:indptr[c + 1]]:
+                below = values[d] if below is None else union(below, values[d])
+                pending[d] -= 1
+                if not pending[d]:
+                    del values[d]
+            visit(c, below)
+            if pending[c]:
+                values[c] = leaf(c) if below is None else union(below, leaf(c))
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(bits):
+        return bin(bits).count("1")
+
+
+def group_offsets(widths, groups):
+    """
+        Start of every width within its group, as if each group was laid out from 0
+    """
+    order = np.argsort(groups, kind="stable")
+    ends = np.cumsum(widths[order])
+    starts = ends - widths[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = groups[order][1:] != groups[order][:-1]
+    offsets = np.empty_like(starts)
+    offsets[order] = starts - np.maximum.accumulate(np.where(first, starts, 0))
+    return offsets
+
+
+def reach_counts(g, weights=None, groups=None):
+    """
+        Total weight (default: 1 per node) of the nodes reachable from every node, the node itself excluded.
+        With `groups` (a label per node, no edge between two groups), the bits of every group start
+        at 0, so a bitset is as wide as the weight of its group instead of the whole graph.
+    """
+    weights = np.ones(g.n, dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+    comp_w = g.sizes(weights).astype(np.int64)
+    if groups is None:
+        offsets = (np.cumsum(comp_w) - comp_w).tolist()
+    else:
+        comp_groups = np.zeros(g.ncomp, dtype=np.int64)
+        comp_groups[g.comp] = groups
+        offsets = group_offsets(comp_w, comp_groups).tolist()
+    widths = comp_w.tolist()
+    below_w = np.zeros(g.ncomp, dtype=np.int64)
+
+    def leaf(c):
+        return ((1 << widths[c]) - 1) << offsets[c]
+
+    def visit(c, below):
+        if below is not None:
+            below_w[c] = popcount(below)
+
+    g.propagate(leaf, operator.or_, visit)
+    # the other members of a cycle are reachable as well
+    return below_w[g.comp] + comp_w[g.comp] - weights
+
+
+
+def reach_label_counts(g, labels):
+    """
+        Number of distinct labels (ints) among the nodes reachable from every node, the node itself excluded
+    """
+    labels = np.asarray(labels).tolist()
+    order, starts = g.members()
+    order = order.tolist()
+    starts = starts.tolist()
+    counts = np.zeros(g.n, dtype=np.int64)
+
+    def leaf(c):
+        bits = 0
+        for v in order[starts[c]:starts[c + 1]]:
+            bits |= 1 << labels[v]
+        return bits
+
+    def visit(c, below):
+        below = below or 0
+        members = order[starts[c]:starts[c + 1]]
+        if len(members) == 1:
+            counts[members[0]] = popcount(below)
+            return
+        # the other members of a cycle are reachable as well, so is the own label if another member has it
+        seen = collections.Counter(labels[v] for v in members)
+        own = leaf(c)
+        for v in members:
+            counts[v] = popcount(below | (own if seen[labels[v]] > 1 else own & ~(1 << labels[v])))
+
+    g.propagate(leaf, operator.or_, visit)
+    return counts
+
+
+def successors(indptr, indices, nodes):
+    """
+        All edges (node, successor) leaving `nodes` as two arrays
+    """
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    return np.repeat(nodes, counts), indices[offsets]
+
+
+def reachable(indptr, indices, sources):
+    """
+        Sorted ids of all nodes reachable from any of `sources`, the sources included
+    """
+    seen = np.zeros(len(indptr) - 1, dtype=bool)
+    frontier = np.unique(sources)
+    seen[frontier] = True
+    while frontier.size:
+        _, nodes = successors(indptr, indices, frontier)
+        frontier = np.unique(nodes[~seen[nodes]])
+        seen[frontier] = True
+    return np.flatnonzero(seen)
+
+
+def source_label_counts(n, src, dst, labels, sources):
+    """
+        reach_label_counts for the `sources` only, on the subgraph reachable from them
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    indptr, indices = csr(n, src, dst)
+    nodes = reachable(indptr, indices, sources)
+    local = np.full(n, -1, dtype=np.int64)
+    local[nodes] = np.arange(len(nodes))
+    s, d = successors(indptr, indices, nodes)
+    g = Condensation(len(nodes), local[s], local[d])
+    _, sub_labels = np.unique(np.asarray(labels)[nodes], return_inverse=True)
+    return reach_label_counts(g, sub_labels)[local[sources]]
+
+
+####
+##### HyperLogLog sketches
+####
+
+def _mix(x):
+    """
+        splitmix64 finalizer over a uint64 array
+    """
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(x):
+    x = x.copy()
+    length = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = x >= np.uint64(1 << shift)
+        length[wide] += shift
+        x[wide] >>= np.uint64(shift)
+    return length + (x > 0)
+
+
+def hll_registers(ids, precision):
+    """
+        Register index and rank of every id
+    """
+    with np.errstate(over="ignore"):
+        h = _mix(np.asarray(ids, dtype=np.uint64) + np.uint64(0x9e3779b97f4a7c15))
+    bits = 64 - precision
+    index = (h >> np.uint64(bits)).astype(np.int64)
+    rest = h & np.uint64((1 << bits) - 1)
+    rank = (bits - _bit_length(rest) + 1).astype(np.uint8)
+    return index, rank
+
+
+def hll_estimate(registers):
+    m = len(registers)
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = m - np.count_nonzero(registers)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return estimate
+
+
+def estimate_reach_counts(g, precision=12):
+    """
+        Estimated number of nodes reachable from every node, the node itself excluded
+    """
+    if not 4 <= precision <= 16:
+        raise ValueError("precision must be between 4 and 16: {}".format(precision))
+    index, rank = hll_registers(np.arange(g.n), precision)
+    order, starts = g.members()
+    starts = starts.tolist()
+    below_n = np.zeros(g.ncomp)
+
+    def leaf(c):
+        registers = np.zeros(1 << precision, dtype=np.uint8)
+        if starts[c + 1] - starts[c] == 1:
+            v = order[starts[c]]
+            registers[index[v]] = rank[v]
+        else:
+            members = order[starts[c]:starts[c + 1]]
+            np.maximum.at(registers, index[members], rank[members])
+        return registers
+
+    def visit(c, below):
+        if below is not None:
+            below_n[c] = hll_estimate(below)
+
+    g.propagate(leaf, np.maximum, visit)
+    sizes = g.sizes()
+    return below_n[g.comp] + sizes[g.comp] - 1
@@ -0,0 +1,122 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Version resolution against a snapshot (name -> {versions}). Each package's
+   version list is registered and sorted once per snapshot, and resolved
+   `(name, requirement)` pairs are memoized in an LRU-bounded cache.
+
+   When a snapshot grows (range mode of evolysis-rustcg.py), `update` drops
+   the cached state of the packages with new versions only. Setting `touched`
+   to a set records every package name a resolution looked at.
+
+   Example:
+      resolver = Resolver(_index_snapshot)
+      resolver.resolve("serde", "^1.0")   # -> "1.0.104"
+      resolver.stats()
+"""
+import collections
+import os
+
+from semver_ffi import VersionSet
+
+## Default bound of memoized (name, requirement) pairs
+MAXSIZE = int(os.environ.get("EVOLYSIS_RESOLVER_CACHE", 1 << 20))
+
+
+class Resolver(object):
+    def __init__(self, snapshot, maxsize=MAXSIZE):
+        self.snapshot = snapshot
+        self.maxsize = maxsize
+        self._sets = {}
+        self._sorted = {}
+        self._memo = collections.OrderedDict()
+        self._reqs = {}
+        self.touched = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, name):
+        if self.touched is not None:
+            self.touched.add(name)
+        return name in self.snapshot
+
+    def version_set(self, name):
+        if name not in self._sets:
+            self._sets[name] = VersionSet(self.snapshot[name])
+        return self._sets[name]
+
+    def sorted(self, name):
+        """
+            All versions of a package in ascending order
+        """
+        if name not in self._sorted:
+            self._sorted[name] = self.version_set(name).sorted()
+        return self._sorted[name]
+
+    def resolve(self, name, req):
+        """
+            Highest version of `name` matching `req`, None if there is none.
+            Raises KeyError for packages that are not in the snapshot.
+        """
+        if self.touched is not None:
+            self.touched.add(name)
+        key = (name, req)
+        memo = self._memo
+        if key in memo:
+            self.hits += 1
+            memo.move_to_end(key)
+            return memo[key]
+        self.misses += 1
+        version = self.version_set(name).max_satisfying(req)
+        memo[key] = version
+        self._reqs.setdefault(name, set()).add(req)
+        if len(memo) > self.maxsize:
+            (e_name, e_req), _ = memo.popitem(last=False)
+            self._reqs[e_name].discard(e_req)
+            self.evictions += 1
+        return version
+
+    def update(self, snapshot, names):
+        """
+            Switch to a grown snapshot, dropping what is cached for the packages in `names`
+        """
+        self.snapshot = snapshot
+        for name in names:
+            self._sets.pop(name, None)
+            self._sorted.pop(name, None)
+            for req in self._reqs.pop(name, ()):
+                del self._memo[(name, req)]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memoized": len(self._memo),
+            "packages": len(self._sets),
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
@@ -0,0 +1,97 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Python bindings to Rust's semver library (bindings/). The library is located
+   with the SEMVER_FFI environment variable, or `target/release/libsemver_ffi.so`
+   relative to the working directory.
+
+   A VersionSet registers the versions of a package once; resolving a
+   requirement against it is a single FFI call returning the max-satisfying
+   version. FFI calls are counted in the run report (see instrument.py).
+"""
+import os
+
+import instrument
+
+from ctypes import cdll, c_bool, c_void_p, c_char_p, c_int32, c_int64, c_size_t
+
+
+####
+##### SETUP RUST VERSION RESOLVER
+####
+
+RUST = cdll.LoadLibrary(os.environ.get("SEMVER_FFI", "target/release/libsemver_ffi.so"))
+
+RUST.is_match.argtypes = (c_void_p,c_void_p)
+RUST.is_match.restype = c_bool
+RUST.cmp.argtypes = (c_void_p,c_void_p)
+RUST.cmp.restype = c_int32
+
+RUST.versions_new.argtypes = (c_void_p, c_size_t)
+RUST.versions_new.restype = c_void_p
+RUST.versions_free.argtypes = (c_void_p,)
+RUST.versions_free.restype = None
+RUST.max_satisfying.argtypes = (c_void_p, c_char_p)
+RUST.max_satisfying.restype = c_int64
+RUST.versions_sorted.argtypes = (c_void_p, c_void_p)
+RUST.versions_sorted.restype = c_size_t
+
+
+class VersionSet(object):
+    """
+        Versions of one package registered in the Rust library
+    """
+    def __init__(self, versions):
+        self.versions = list(versions)
+        raw = (c_char_p * len(self.versions))(*[v.encode('ascii') for v in self.versions])
+        self.handle = RUST.versions_new(raw, len(self.versions))
+        instrument.count("ffi.versions_new")
+
+    def __len__(self):
+        return len(self.versions)
+
+    def max_satisfying(self, req):
+        """
+            Highest version matching the requirement, None if there is none
+        """
+        idx = RUST.max_satisfying(self.handle, req.encode('ascii'))
+        instrument.count("ffi.max_satisfying")
+        if idx < 0:
+            return None
+        return self.versions[idx]
+
+    def sorted(self):
+        """
+            All versions in ascending order
+        """
+        out = (c_size_t * len(self.versions))()
+        n = RUST.versions_sorted(self.handle, out)
+        instrument.count("ffi.versions_sorted")
+        return [self.versions[i] for i in out[:n]]
+
+    def __del__(self):
+        if getattr(self, "handle", None) and RUST is not None:
+            RUST.versions_free(self.handle)
+            self.handle = None
@@ -0,0 +1,240 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Bounded caches over the per-release files of the stitching store
+   (entrypoints-*.txt, paths-*.txt), located with EVOLYSIS_STITCHING_STORE
+   (default /datasets/praezi/stitching). Parsed values are kept in an LRU with a
+   memory budget (EVOLYSIS_STITCH_CACHE_MB per cache, default 1024). The memory
+   of a parsed release is given by the cache's `sizeof` (e.g. the nbytes of a
+   NumPy array), or estimated from the size of its files. With
+   EVOLYSIS_STITCH_CACHE_DIR set, they are also pickled to
+   <dir>/<cache>/<crate>/<ver>.pickle, so evicted entries and later runs reload
+   without parsing. A disk entry is only used while the list of source files
+   of the release is unchanged.
+
+   `prefetch` loads a release in a background thread pool
+   (EVOLYSIS_PREFETCH_THREADS threads, default 8, 0 disables prefetching), so a
+   later `get` does not wait on the file system. At most EVOLYSIS_PREFETCH_DEPTH
+   prefetches (default 256) are outstanding per cache. Worker threads only read
+   and parse files; the LRU is only touched by the calling thread.
+
+   Example:
+      cache = StitchCache("entrypoints", "entrypoints", parse_entrypoints)
+      cache.get("serde::1.0.104")
+"""
+import collections
+import fnmatch
+import os
+import pickle
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import instrument
+
+STORE = os.environ.get("EVOLYSIS_STITCHING_STORE", "/datasets/praezi/stitching")
+
+BUDGET = int(os.environ.get("EVOLYSIS_STITCH_CACHE_MB", 1024)) << 20
+
+## Memory of a parsed release per byte of its files, for caches without sizeof: sets and dicts of short strings
+EXPANSION = 8
+
+DISK_DIR = os.environ.get("EVOLYSIS_STITCH_CACHE_DIR")
+
+PREFETCH_THREADS = int(os.environ.get("EVOLYSIS_PREFETCH_THREADS", 8))
+PREFETCH_DEPTH = int(os.environ.get("EVOLYSIS_PREFETCH_DEPTH", 256))
+
+_executor = None
+_caches = []
+
+def executor():
+    global _executor
+    if _executor is None and PREFETCH_THREADS > 0:
+        _executor = ThreadPoolExecutor(max_workers=PREFETCH_THREADS, thread_name_prefix="prefetch")
+    return _executor
+
+def _before_fork():
+    # let outstanding prefetches finish, no worker thread is in the middle of a read when forking
+    for cache in _caches:
+        wait(list(cache._pending.values()))
+
+def _after_fork_in_child():
+    # the pool's threads do not exist in the child: take over the finished futures, start a new pool when needed
+    global _executor
+    _executor = None
+    for cache in _caches:
+        for (krate, future) in list(cache._pending.items()):
+            cache._take(krate, future)
+
+os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
+
+
+class StitchCache(object):
+    def __init__(self, name, prefix, parse, budget=BUDGET, disk_dir=DISK_DIR, store=STORE, depth=PREFETCH_DEPTH, sizeof=None):
+        self.name = name
+        self.pattern = "{}-*.txt".format(prefix)
+        self.parse = parse
+        self.sizeof = sizeof
+        self.budget = budget
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self.store = store
+        self.depth = depth
+        self._lru = collections.OrderedDict()
+        self._pending = {}
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetched = 0
+        _caches.append(self)
+
+    def __contains__(self, krate):
+        return krate in self._lru
+
+    def files(self, krate):
+        p,v = krate.split("::")
+        folder = "{}/{}/{}".format(self.store, p, v)
+        return ["{}/{}".format(folder, f) for f in sorted(os.listdir(folder)) if fnmatch.fnmatch(f, self.pattern)]
+
+    def disk_path(self, krate):
+        p,v = krate.split("::")
+        return os.path.join(self.disk_dir, p, "{}.pickle".format(v))
+
+    def load_disk(self, krate, files):
+        try:
+            with open(self.disk_path(krate), "rb") as fh:
+                saved_files, value = pickle.load(fh)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value if saved_files == files else None
+
+    def save_disk(self, krate, files, value):
+        path = self.disk_path(krate)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".stitch-", dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump((files, value), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def load(self, krate):
+        """
+            (value, estimated size, read from disk) of a release, without touching the LRU
+        """
+        files = self.files(krate)
+        if self.disk_dir:
+            value = self.load_disk(krate, files)
+            if value is not None:
+                instrument.count("stitch.disk_reads")
+                return (value, self.size_of(value, files), True)
+        value = self.parse(krate, files)
+        instrument.count("stitch.files_read", len(files))
+        if self.disk_dir:
+            self.save_disk(krate, files, value)
+        return (value, self.size_of(value, files), False)
+
+    def size_of(self, value, files):
+        if self.sizeof is not None:
+            return self.sizeof(value)
+        return EXPANSION * sum(os.path.getsize(f) for f in files)
+
+    def insert(self, krate, value, size):
+        lru = self._lru
+        lru[krate] = (value, size)
+        self.size += size
+        while self.size > self.budget and len(lru) > 1:
+            _, (_, evicted) = lru.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def _take(self, krate, future):
+        # move a finished prefetch into the LRU, failed ones are loaded again by get()
+        del self._pending[krate]
+        if future.done() and future.exception() is None:
+            value, size, from_disk = future.result()
+            self.prefetched += 1
+            if from_disk:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            self.insert(krate, value, size)
+
+    def prefetch(self, krate):
+        """
+            Start loading a release in the background
+        """
+        if krate in self._lru or krate in self._pending or executor() is None:
+            return
+        if len(self._pending) >= self.depth:
+            for (done_krate, future) in [(k, f) for (k, f) in self._pending.items() if f.done()]:
+                self._take(done_krate, future)
+            if len(self._pending) >= self.depth:
+                return
+        self._pending[krate] = executor().submit(self.load, krate)
+
+    def get(self, krate):
+        """
+            Parsed value of a release; raises OSError if the release is not in the store
+        """
+        lru = self._lru
+        if krate in lru:
+            self.hits += 1
+            lru.move_to_end(krate)
+            return lru[krate][0]
+
+        if krate in self._pending:
+            future = self._pending[krate]
+            wait([future])
+            self._take(krate, future)
+            if krate in lru:
+                return lru[krate][0]
+
+        value, size, from_disk = self.load(krate)
+        if from_disk:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+        self.insert(krate, value, size)
+        return value
+
+    def clear(self):
+        wait(list(self._pending.values()))
+        self._pending.clear()
+        self._lru.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "prefetched": self.prefetched,
+            "entries": len(self._lru),
+            "mb": self.size / float(1 << 20),
+        }
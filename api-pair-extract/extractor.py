@@ -40,7 +40,6 @@ For empty call graphs, run this:
 
 """
 
-import json
 import sys
 import re
 import base64
@@ -52,6 +51,11 @@ import uuid
 
 import toml
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common"))
+import cgcache
+import apiindex
+import manifest
+import pubfns
 
 patternClosure = re.compile(r"::{{closure}}[[0-9]*]")
 patternImpl = re.compile(r"::{{impl}}[[0-9]*]")
@@ -59,28 +63,14 @@ patternBracket = re.compile(r"\[[A-Z|a-z|0-9]*\]")
 
 
 
-with open(sys.argv[1]) as cg_file:
-    cg = json.load(cg_file)
-
-with open(sys.argv[2]) as ty_file:
-    tyhir = json.load(ty_file)
-    _types = {}
-    _types_defid = {}
-    _traits = {}
-    _traits_defid = {}
-    _impls = {}
+###
+#### Load call graph and type hierarchy (through the compiled cache, see common/cgcache.py)
+###
 
-    for ty in tyhir['types']:
-        _types[ty['id']] = ty
-        if ty['relative_def_id'] is not None:
-            _types_defid[ty['relative_def_id']] = ty
-    for tr in tyhir['traits']:
-        _traits[tr['id']] = tr
-        if tr['relative_def_id'] is not None:
-            _traits_defid[tr['relative_def_id']] = tr
-    for im in tyhir['impls']:
-        if im['relative_def_id'] is not None:
-            _impls[im['relative_def_id']] = im
+cg = cgcache.load(sys.argv[1], sys.argv[2])
+_types = cg.types
+_traits = cg.traits
+_impls = cg.impls
 
 
 
@@ -131,14 +121,16 @@ def mine_and_normalize_fns(fn):
         defid_item = "::".join(segs[:-1]) 
 
         if "{{impl}}" not in defid_item:
-            if defid_item in _types_defid:
-                fn_str = "{} {}".format(_types_defid[defid_item]['string_id'],fn_name).encode('ascii')
+            ty = _types.by_defid(defid_item)
+            tr = _traits.by_defid(defid_item) if ty is None else None
+            if ty is not None:
+                fn_str = "{} {}".format(ty['string_id'],fn_name).encode('ascii')
                 base64_bytes = base64.b64encode(fn_str)
                 _mappings_crate_fns[key].append(base64_bytes.decode('ascii'))
                 _base64fns[fn['id']] = base64_bytes.decode('ascii') 
            
-            elif defid_item in _traits_defid:
-                trait = patternBracket.sub("",_traits_defid[defid_item]['relative_def_id'])
+            elif tr is not None:
+                trait = patternBracket.sub("",tr['relative_def_id'])
                 fn_str = "{} {}".format(trait,fn_name).encode('ascii')
                 base64_bytes = base64.b64encode(fn_str)
                 _mappings_crate_fns[key].append(base64_bytes.decode('ascii'))
@@ -156,21 +148,23 @@ def mine_and_normalize_fns(fn):
             structs = []
             traits = []
             implz = []
-            if _impl_defid in _impls:
-                implz.append(_impls[_impl_defid])
+            impl = _impls.by_defid(_impl_defid)
+            if impl is not None:
+                implz.append(impl)
 
             while implz:
                 impl = implz.pop()
                 if impl['type_id'] is not None: 
-                    structs.append(_types[impl['type_id']]['string_id'])
+                    structs.append(_types.by_id(impl['type_id'])['string_id'])
                 if impl['trait_id'] is not None:
-                    _raw = _traits[impl['trait_id']]['relative_def_id']
+                    _raw = _traits.by_id(impl['trait_id'])['relative_def_id']
                     if "{{impl}}" in _raw:
                         _impl = patternImpl.findall(_raw)[-1]
                         idx = _raw.rfind(_impl) + len(_impl)
                         _impl_defid = _raw[0:idx]
-                        if _impl_defid in _impls:
-                            implz.append(_impls[_impl_defid])    
+                        _next = _impls.by_defid(_impl_defid)
+                        if _next is not None:
+                            implz.append(_next)
                     else:
                         traits.append(patternBracket.sub("",_raw))
 
@@ -183,11 +177,11 @@ def mine_and_normalize_fns(fn):
 
 _mappings_id_nodes = {}
 
-for fn in cg['functions']:
+for fn in cg.functions:
     mine_and_normalize_fns(fn)
     _mappings_id_nodes[fn['id']] = fn
 
-for macro in cg['macros']:
+for macro in cg.macros:
     mine_and_normalize_fns(macro)
     _mappings_id_nodes[macro['id']] = macro
     
@@ -241,11 +235,11 @@ def extract_edge_data(edge):
         internal_package_edges[(src_,_base64fns[source_id])].add((src_,_base64fns[target_id]))
 
 
-for edge in cg['function_calls']:
+for edge in cg.function_calls:
     extract_edge_data(edge)
 
 
-for edge in cg['macro_calls']:
+for edge in cg.macro_calls:
     extract_edge_data(edge)
 
 
@@ -291,6 +285,8 @@ unique = uuid.uuid4()
 #### Dump entrypoints to disk
 ###
 
+_manifest_entries = {}
+
 for (krate,fns) in _mappings_crate_fns.items():
     name,ver = krate.split("::")
     if fns:
@@ -301,10 +297,15 @@ for (krate,fns) in _mappings_crate_fns.items():
         with open(filename,"w+") as f:
             f.writelines(s + '\n' for s in fns)
         os.chmod(filename, 0o777)
+        # hashed public functions for the bloat metric (see common/pubfns.py)
+        pubfns.write(pubfns.pubfns_path(filename), pubfns.hashes(name, fns))
+        _manifest_entries.setdefault((name,ver), set()).add("entrypoints")
 ###
 #### Dump exitpoints and paths
 ###
 
+_exitpoint_files = []
+
 for s in set([s for (s,t) in pkg_edges]):
     name,ver = s.split("::")    
     crate_folder = "{}/{}/{}".format(sys.argv[4],name,ver)
@@ -318,6 +319,7 @@ for s in set([s for (s,t) in pkg_edges]):
         with open(filename,"w+") as f:
             f.writelines(",".join(p) + '\n' for p in _paths)
         os.chmod(filename, 0o777)
+        _manifest_entries.setdefault((name,ver), set()).add("paths")
 
     ## Exitpoints
     keys = [(k,fn) for (k,fn) in cross_pkg_edges.keys() if k == s]
@@ -328,21 +330,42 @@ for s in set([s for (s,t) in pkg_edges]):
                 _deps[t] = {"S": [], "D": [], "M": []}
             _deps[t][dispatch].append(_fn)
 
+    if _deps:
+        _manifest_entries.setdefault((name,ver), set()).add("exitpoints")
     for t in _deps.keys():
         filename = "{}/exitpoints/{}/static-{}.txt".format(crate_folder,t,unique)
         os.makedirs(os.path.dirname(filename), exist_ok=True)
+        _exitpoint_files.append(filename)
         with open(filename,"w+") as f:
             f.writelines(fn + '\n' for fn in _deps[t]['S'])
         os.chmod(filename, 0o777)
 
         filename = "{}/exitpoints/{}/cha-{}.txt".format(crate_folder,t,unique)
         os.makedirs(os.path.dirname(filename), exist_ok=True)
+        _exitpoint_files.append(filename)
         with open(filename,"w+") as f:
             f.writelines(fn + '\n' for fn in _deps[t]['D'])
         os.chmod(filename, 0o777)
 
         filename = "{}/exitpoints/{}/macro-{}.txt".format(crate_folder,t,unique)
         os.makedirs(os.path.dirname(filename), exist_ok=True)
+        _exitpoint_files.append(filename)
         with open(filename,"w+") as f:
             f.writelines(fn + '\n' for fn in _deps[t]['M'])
-        os.chmod(filename, 0o777)
\ No newline at end of file
+        os.chmod(filename, 0o777)
+
+###
+#### Add exitpoints to the inverted API index if the store maintains one (see common/apiindex.py)
+###
+
+if _exitpoint_files and os.path.exists(apiindex.index_path(sys.argv[4])):
+    conn = apiindex.connect(sys.argv[4])
+    apiindex.add_files(conn, sys.argv[4], [apiindex.describe(sys.argv[4], f) for f in _exitpoint_files])
+    conn.close()
+
+###
+#### Record the written crate versions in the store manifest if there is one (see common/manifest.py)
+###
+
+if _manifest_entries and os.path.exists(manifest.manifest_path(sys.argv[4])):
+    manifest.append(sys.argv[4], [(name, ver, kinds) for ((name, ver), kinds) in _manifest_entries.items()])
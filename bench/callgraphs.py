@@ -0,0 +1,311 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Synthetic call graph corpus in the layout of rust-callgraphs:
+   <out>/<crate>/<ver>/{callgraph.json, type_hierarchy.json, Cargo.lock}
+   (schema in rustsec/README.md).
+
+   Every call graph holds the functions and macros of the crate under analysis,
+   the functions of its dependencies (two levels of the lock file) that are
+   used, std nodes (`package_name` null) and placeholders (`package_version`
+   null). Calls are internal, to dependencies, to std, between dependencies and
+   from dependencies back into the crate (callbacks), statically or dynamically
+   dispatched, and resolved or not. Function paths are inherent and trait impl
+   methods, free functions and closures, with the matching types, traits and
+   impls in type_hierarchy.json. The API of a crate version is the same in
+   every call graph that uses it, so the aggregated CDN shares nodes between
+   call graphs.
+
+   Run: python3 bench/callgraphs.py <out dir> <call graphs> [functions per call graph] [seed]
+"""
+import json
+import os
+import random
+import shutil
+import sys
+
+from corpus import geometric, weighted, crate_name, POPULARITY, MODULES, TYPES, METHODS
+
+## Mean number of direct dependencies of a crate
+DEPS_MEAN = 3
+## Calls of a function of the crate under analysis: (weight, target kind)
+CALLS_MEAN = 4
+CALLS = [(50, "internal"), (25, "std"), (20, "dep"), (5, "macro")]
+## Share of dynamically dispatched calls, of dependency functions that are placeholders
+## and of used dependency functions calling back into the crate
+DYNAMIC = 0.1
+PLACEHOLDERS = 0.05
+CALLBACKS = 0.03
+## Shape of a function path: (weight, shape)
+SHAPES = [(40, "impl"), (15, "trait impl"), (35, "fn"), (10, "closure")]
+
+TRAITS = ["Read", "Write", "Iterator", "Display", "Debug", "Clone", "Default", "From", "Serialize", "Deserialize"]
+
+STD = ["core::option[0]::{{impl}}[0]::unwrap[0]", "core::option[0]::{{impl}}[0]::map[0]",
+    "core::result[0]::{{impl}}[0]::unwrap[0]", "core::result[0]::{{impl}}[0]::map_err[0]",
+    "alloc::vec[0]::{{impl}}[1]::push[0]", "alloc::vec[0]::{{impl}}[1]::with_capacity[0]",
+    "alloc::string[0]::{{impl}}[0]::push_str[0]", "alloc::string[0]::{{impl}}[37]::to_string[0]",
+    "core::fmt[0]::{{impl}}[5]::write_fmt[0]", "core::fmt[0]::Formatter[0]::write_str[0]",
+    "core::iter[0]::traits[0]::iterator[0]::Iterator[0]::next[0]", "core::cell[0]::{{impl}}[20]::borrow_mut[0]",
+    "std::io[0]::Read[0]::read[0]", "std::io[0]::Write[0]::flush[0]", "std::sync[0]::mutex[0]::{{impl}}[4]::lock[0]",
+    "core::panicking[0]::panic[0]", "alloc::alloc[0]::exchange_malloc[0]", "core::ptr[0]::drop_in_place[0]"]
+STD_MACROS = ["std::println[0]", "std::format[0]", "core::panic[0]", "core::assert[0]", "alloc::vec[0]"]
+
+
+class Crate(object):
+    """
+        A crate of the corpus, with a deterministic API per version
+    """
+    def __init__(self, name, deps, nfns):
+        self.name = name
+        self.crate_name = name.replace("-", "_")
+        self.deps = deps
+        self.nfns = nfns
+        self.versions = ["0.{}.{}".format(i // 3 + 1, i % 3) for i in range(1 + len(name) % 4)]
+        self._items = {}
+
+    def items(self, ver, seed):
+        """
+            (relative_def_id, type, trait, impl) of the functions of a version
+        """
+        if ver not in self._items:
+            self._items[ver] = self._generate_items(ver, seed)
+        return self._items[ver]
+
+    def _generate_items(self, ver, seed):
+        rng = random.Random("{}:{}:{}".format(seed, self.name, ver))
+        items = []
+        for i in range(self.nfns):
+            module = "{}[0]".format(MODULES[i % len(MODULES)])
+            k = i // (len(MODULES) * len(TYPES))
+            ty = TYPES[(i // len(MODULES)) % len(TYPES)] + (str(k) if k else "")
+            method = "{}[0]".format(METHODS[rng.randrange(len(METHODS))] + str(i))
+            shape = weighted(rng, SHAPES)
+            path = "{}::{}".format(self.crate_name, module)
+            if shape == "fn":
+                items.append(("{}::{}".format(path, method), None, None, None))
+            elif shape == "closure":
+                items.append(("{}::{}::{{{{closure}}}}[0]".format(path, method), None, None, None))
+            else:
+                trait = TRAITS[i % len(TRAITS)] if shape == "trait impl" else None
+                impl = "{}::{{{{impl}}}}[{}]".format(path, i)
+                items.append(("{}::{}".format(impl, method), "{}::{}[0]".format(path, ty), trait, impl))
+        return items
+
+
+def crates_pool(rng, n, nfns):
+    """
+        Crates in publication order; dependencies point at earlier crates, biased towards the first ones
+    """
+    names = set()
+    crates = []
+    for i in range(n):
+        deps = set()
+        for _ in range(geometric(rng, DEPS_MEAN + 1) - 1):
+            if i > 0:
+                deps.add(crates[int(i * rng.random() ** POPULARITY)])
+        crates.append(Crate(crate_name(rng, names), sorted(deps, key=lambda c: c.name),
+            max(4, int(rng.lognormvariate(0, 0.5) * nfns))))
+    return crates
+
+
+class Graph(object):
+    """
+        callgraph.json and type_hierarchy.json under construction
+    """
+    def __init__(self):
+        self.functions = []
+        self.macros = []
+        self.function_calls = []
+        self.macro_calls = []
+        self.types = {}
+        self.traits = {}
+        self.impls = {}
+        self.nodes = {}
+        self._ids = {}
+
+    def node(self, table, package, ver, crate_name, def_id, visible, lines):
+        key = (package, ver, def_id)
+        if key not in self._ids:
+            self._ids[key] = len(self._ids)
+            node = {"id": self._ids[key], "package_name": package, "package_version": ver, "crate_name": crate_name,
+                "relative_def_id": def_id, "is_externally_visible": visible, "num_lines": lines,
+                "source_location": None if package is None else "src/{}.rs:{}:5: {}:6".format(def_id.split("::")[1][:-3], lines, lines * 2)}
+            table.append(node)
+            self.nodes[node["id"]] = node
+        return self._ids[key]
+
+    def item(self, crate, ver, item, visible, lines):
+        def_id, ty, trait, impl = item
+        if ver is not None and ty is not None:
+            if ty not in self.types:
+                self.types[ty] = {"id": len(self.types), "string_id": ty.split("::")[-1][:-3],
+                    "package_name": crate.name, "package_version": ver, "relative_def_id": ty}
+            trait_id = None
+            if trait is not None:
+                trait_def_id = "{}::traits[0]::{}[0]".format(crate.crate_name, trait)
+                if trait_def_id not in self.traits:
+                    self.traits[trait_def_id] = {"id": len(self.traits), "package_name": crate.name,
+                        "package_version": ver, "relative_def_id": trait_def_id}
+                trait_id = self.traits[trait_def_id]["id"]
+            if impl not in self.impls:
+                self.impls[impl] = {"id": len(self.impls), "type_id": self.types[ty]["id"], "trait_id": trait_id,
+                    "package_name": crate.name, "package_version": ver, "relative_def_id": impl}
+        return self.node(self.functions, crate.name, ver, crate.crate_name, def_id, visible, lines)
+
+    def std(self, rng):
+        def_id = rng.choice(STD)
+        return self.node(self.functions, None, None, def_id.split("::")[0], def_id, True, 0)
+
+    def std_macro(self, rng):
+        def_id = rng.choice(STD_MACROS)
+        return self.node(self.macros, None, None, def_id.split("::")[0], def_id, True, 0)
+
+    def call(self, rng, src, dst, resolved=True):
+        self.function_calls.append([src, dst, rng.random() >= DYNAMIC, resolved])
+
+    def macro_call(self, src, dst, resolved=True):
+        self.macro_calls.append([src, dst, resolved])
+
+
+def lock_closure(crate, rng):
+    """
+        [(crate, version)] of the lock file: the crate, its dependencies and theirs
+    """
+    locked = [(crate, crate.versions[-1])]
+    seen = set([crate.name])
+    for level in [crate.deps, [d for dep in crate.deps for d in dep.deps]]:
+        for dep in level:
+            if dep.name not in seen:
+                seen.add(dep.name)
+                locked.append((dep, rng.choice(dep.versions)))
+    return locked
+
+
+def callgraph(rng, crate, ver, seed):
+    """
+        (Graph, lock file entries) of a crate version
+    """
+    g = Graph()
+    locked = lock_closure(crate, rng)
+    versions = dict((c.name, v) for (c, v) in locked)
+
+    own = [g.item(crate, ver, item, rng.random() < 0.6, 1 + geometric(rng, 10)) for item in crate.items(ver, seed)]
+    own_macros = [g.node(g.macros, crate.name, ver, crate.crate_name, "{}::{}_macro[0]".format(crate.crate_name, METHODS[i]), True, 5)
+        for i in range(rng.randrange(3))]
+
+    def used(dep, caller_fns):
+        """
+            Add calls from caller_fns into `dep`, returns the called nodes
+        """
+        d_ver = versions[dep.name]
+        api = dep.items(d_ver, seed)
+        called = []
+        for src in caller_fns:
+            for _ in range(geometric(rng, 2)):
+                item = api[int(len(api) * rng.random() ** 2)]
+                placeholder = rng.random() < PLACEHOLDERS
+                dst = g.item(dep, None if placeholder else d_ver, item, True, 1 + geometric(rng, 10))
+                g.call(rng, src, dst, not placeholder)
+                called.append(dst)
+        return called
+
+    # calls of the crate under analysis
+    for src in own:
+        for _ in range(geometric(rng, CALLS_MEAN)):
+            kind = weighted(rng, CALLS)
+            if kind == "internal":
+                g.call(rng, src, own[int(len(own) * rng.random() ** 2)])
+            elif kind == "std":
+                g.call(rng, src, g.std(rng))
+            elif kind == "macro":
+                if own_macros and rng.random() < 0.5:
+                    g.macro_call(src, rng.choice(own_macros))
+                else:
+                    g.macro_call(src, g.std_macro(rng))
+            elif crate.deps:
+                used(rng.choice(crate.deps), [src])
+
+    # dependencies calling their own dependencies, std and back into the crate (callbacks)
+    called = dict((dep.name, set()) for (dep, _) in locked[1:])
+    for (src, dst, _, _) in list(g.function_calls):
+        node = g.nodes[dst]
+        if node["package_name"] in called:
+            called[node["package_name"]].add(dst)
+    for (dep, _) in locked[1:]:
+        fns = sorted(called[dep.name])
+        for src in fns:
+            if rng.random() < 0.5:
+                g.call(rng, src, g.std(rng))
+            if rng.random() < CALLBACKS:
+                g.call(rng, src, rng.choice(own), rng.random() < 0.5)
+        for d in dep.deps:
+            if d.name in versions and fns:
+                used(d, rng.sample(fns, min(len(fns), geometric(rng, 2))))
+
+    lock = [(c.name, v, [d.name for d in c.deps if d.name in versions]) for (c, v) in locked]
+    return g, lock
+
+
+def write_lock(path, lock, rng):
+    with open(path, "w") as fh:
+        versions = dict((name, ver) for (name, ver, _) in lock)
+        for (name, ver, deps) in lock:
+            fh.write('[[package]]\nname = "{}"\nversion = "{}"\n'.format(name, ver))
+            if deps:
+                # both forms of lock files: "name" and "name version"
+                fh.write("dependencies = [\n{}]\n".format("".join(' "{}",\n'.format(
+                    d if rng.random() < 0.5 else "{} {}".format(d, versions[d])) for d in deps)))
+            fh.write("\n")
+
+
+def generate(out, ncallgraphs, nfns=200, seed=0):
+    """
+        Write `ncallgraphs` call graphs of about `nfns` functions each to `out` (replacing it), returns its statistics
+    """
+    rng = random.Random(seed)
+    crates = crates_pool(rng, ncallgraphs, nfns)
+    shutil.rmtree(out, ignore_errors=True)
+    stats = {"callgraphs": 0, "functions": 0, "macros": 0, "function_calls": 0, "macro_calls": 0}
+    for crate in crates:
+        ver = crate.versions[-1]
+        g, lock = callgraph(rng, crate, ver, seed)
+        folder = os.path.join(out, crate.name, ver)
+        os.makedirs(folder)
+        with open(os.path.join(folder, "callgraph.json"), "w") as fh:
+            json.dump({"functions": g.functions, "macros": g.macros, "function_calls": g.function_calls, "macro_calls": g.macro_calls}, fh)
+        with open(os.path.join(folder, "type_hierarchy.json"), "w") as fh:
+            json.dump({"types": list(g.types.values()), "traits": list(g.traits.values()), "impls": list(g.impls.values())}, fh)
+        write_lock(os.path.join(folder, "Cargo.lock"), lock, rng)
+        stats["callgraphs"] += 1
+        for key in ["functions", "macros", "function_calls", "macro_calls"]:
+            stats[key] += len(getattr(g, key))
+    return stats
+
+
+if __name__ == "__main__":
+    stats = generate(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 200, int(sys.argv[4]) if len(sys.argv) > 4 else 0)
+    print("[{}] {}: {callgraphs} call graphs, {functions} functions, {macros} macros, {function_calls} function calls, {macro_calls} macro calls".format(
+        sys.argv[0], sys.argv[1], **stats))
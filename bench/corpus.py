@@ -0,0 +1,414 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Synthetic inputs of evolysis-rustcg.py: a crates.io-index checkout,
+   releases.csv, docsrs.csv and a stitching store (entrypoints, paths and
+   pubfns files with a manifest), all derived from a seed.
+
+   Crates are published over START..END at an increasing rate; each crate has
+   a heavy-tailed number of versions (patch, minor and major bumps, some
+   pre-releases). Dependencies point at crates published earlier, drawn with a
+   popularity bias (the in-degree follows a power law, as for serde or libc),
+   with a mix of requirement styles, optional dependencies, features,
+   `dep/feature` requests, targets and dev/build kinds. Functions of a crate
+   keep their names across versions and calls favour a few popular functions,
+   so the function-level closure reaches several levels deep.
+
+   Run: python3 bench/corpus.py <out dir> <crate versions> [seed]
+   (e.g. python3 bench/corpus.py /tmp/corpus-10k 10000), then from <out dir>:
+      EVOLYSIS_STITCHING_STORE=<out dir>/stitching python3 -i analysis/evolysis-rustcg.py 2020-02
+"""
+import base64
+import bisect
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import uuid
+
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common"))
+import manifest
+import pubfns
+
+START = datetime(2015, 1, 1)
+END = datetime(2020, 2, 14)
+
+## Mean number of versions per crate (geometric, heavy tail through RELEASE_BURST)
+VERSIONS_MEAN = 5
+RELEASE_BURST = 0.05
+## Mean number of dependencies of a version; POPULARITY > 1 concentrates them on early crates
+DEPS_MEAN = 4
+POPULARITY = 3.0
+## Share of dependencies on crates published after the dependent crate
+CYCLES = 0.02
+## Mean number of public functions of a crate (log-normal)
+FNS_MEDIAN = 20
+## Share of versions built on docs.rs and with call graphs in the stitching store
+DOCSRS_RATE = 0.85
+PRAEZI_RATE = 0.75
+
+## Requirement styles: (weight, format)
+REQUIREMENTS = [
+    (55, "{major}.{minor}.{patch}"),
+    (12, "^{major}.{minor}"),
+    (8, "~{major}.{minor}.{patch}"),
+    (3, "={major}.{minor}.{patch}"),
+    (7, "*"),
+    (8, ">= {major}.{minor}.{patch}"),
+    (7, ">= {major}.{minor}, < {next_major}"),
+]
+
+## Dependency kinds and targets: (weight, value)
+KINDS = [(75, "normal"), (20, "dev"), (5, "build")]
+TARGETS = [(90, None), (5, "cfg(unix)"), (3, "cfg(windows)"), (2, "x86_64-unknown-linux-gnu")]
+DISPATCH = [(80, "S"), (15, "D"), (5, "M")]
+
+FEATURES = ["std", "alloc", "derive", "full", "nightly", "unstable", "serde"]
+
+SYLLABLES = ["ser", "de", "tok", "io", "hy", "per", "rand", "lib", "log", "byte", "core", "net", "mio",
+    "futu", "res", "reg", "ex", "clap", "syn", "quo", "te", "proc", "ma", "cro", "url", "time", "chro",
+    "no", "num", "trait", "hash", "brown", "lazy", "stat", "ic", "once", "cell", "crypt", "ring", "tls"]
+SUFFIXES = ["", "", "", "", "-rs", "-sys", "_derive", "-util", "-core", "-macros"]
+
+MODULES = ["de", "ser", "io", "net", "sync", "util", "fmt", "error", "codec", "task", "buf", "parse"]
+TYPES = ["Builder", "Error", "Reader", "Writer", "Config", "Client", "Handle", "Stream", "Value", "Map"]
+METHODS = ["new", "build", "read", "write", "parse", "from_str", "with_capacity", "poll", "next",
+    "into_inner", "len", "is_empty", "get", "insert", "serialize", "deserialize", "fmt", "drop",
+    "clone", "default", "map", "flush"]
+
+
+def weighted(rng, choices):
+    r = rng.uniform(0, sum(w for (w, _) in choices))
+    for (w, value) in choices:
+        r -= w
+        if r <= 0:
+            return value
+    return choices[-1][1]
+
+
+def geometric(rng, mean):
+    """
+        Number of trials >= 1 with the given mean
+    """
+    if mean <= 1:
+        return 1
+    return int(math.log(1.0 - rng.random()) / math.log(1.0 - 1.0 / mean)) + 1
+
+
+def index_path(name):
+    """
+        Location of a crate file in the index: 1/a, 2/ab, 3/a/abc, ab/cd/abcd..
+    """
+    if len(name) <= 2:
+        return os.path.join(str(len(name)), name)
+    if len(name) == 3:
+        return os.path.join("3", name[0], name)
+    return os.path.join(name[:2], name[2:4], name)
+
+
+####
+##### Crates and versions
+####
+
+class Crate(object):
+    def __init__(self, name, published, nfns):
+        self.name = name
+        self.published = published
+        self.nfns = nfns
+        self.features = []
+        # [(date, ver, first fn, last fn)] in publication order
+        self.versions = []
+        self.dates = []
+        self._fns = []
+
+    def fn(self, i):
+        """
+            base64 of the i-th function ("module::Type method"), stable across versions
+        """
+        while len(self._fns) <= i:
+            k = len(self._fns) + len(self.name) * 7
+            m, k = METHODS[k % len(METHODS)], k // len(METHODS)
+            t, k = TYPES[k % len(TYPES)], k // len(TYPES)
+            mod = MODULES[k % len(MODULES)] + (str(k // len(MODULES)) if k >= len(MODULES) else "")
+            self._fns.append(base64.b64encode("{}::{} {}".format(mod, t, m).encode('ascii')).decode('ascii'))
+        return self._fns[i]
+
+
+def crate_name(rng, names):
+    """
+        A new crate name, added to `names`
+    """
+    while True:
+        name = "".join(rng.choice(SYLLABLES) for _ in range(rng.choice([1, 2, 2, 3]))) + rng.choice(SUFFIXES)
+        if len(names) > len(SYLLABLES) ** 3 // 2:
+            name += str(rng.randrange(len(names)))
+        if name not in names:
+            names.add(name)
+            return name
+
+
+def release_versions(rng, crate, count):
+    """
+        Version numbers and release dates of a crate, in order
+    """
+    major, minor, patch = 0, 1, 0
+    date = crate.published
+    first, last = 0, crate.nfns
+    for _ in range(count):
+        if date > END:
+            break
+        crate.versions.append((date, "{}.{}.{}".format(major, minor, patch), first, last))
+        pre = None
+        step = rng.random()
+        if step < 0.06:
+            major, minor, patch = major + 1, 0, 0
+            # a major bump drops some of the API
+            first += rng.randrange(max(1, (last - first) // 4))
+        elif step < 0.30:
+            minor, patch = minor + 1, 0
+        else:
+            patch += 1
+        if step < 0.30 and rng.random() < 0.1:
+            pre = "{}.{}.{}-alpha.1".format(major, minor, patch)
+        last += geometric(rng, 2) - 1
+        date = date + timedelta(days=geometric(rng, 1 if rng.random() < RELEASE_BURST else 60), seconds=rng.randrange(86400))
+        if pre is not None and date <= END:
+            crate.versions.append((date, pre, first, last))
+            date = date + timedelta(days=geometric(rng, 14), seconds=rng.randrange(86400))
+    crate.dates = [d for (d, _, _, _) in crate.versions]
+
+
+def publish_crates(rng, nversions):
+    """
+        Crates in publication order, with at least `nversions` versions in total
+    """
+    span = (END - START).total_seconds()
+    names = set()
+    crates = []
+    total = 0
+    while total < nversions:
+        # the number of new crates per month grows over the years
+        published = START + timedelta(seconds=span * math.sqrt(rng.random()))
+        crate = Crate(crate_name(rng, names), published, max(1, int(rng.lognormvariate(math.log(FNS_MEDIAN), 0.8))))
+        crate.features = rng.sample(FEATURES, rng.randrange(len(FEATURES)))
+        release_versions(rng, crate, geometric(rng, VERSIONS_MEAN * (4 if rng.random() < RELEASE_BURST else 1)))
+        crates.append(crate)
+        total += len(crate.versions)
+    crates.sort(key=lambda crate: (crate.published, crate.name))
+    return crates
+
+
+####
+##### Index entries and stitching files
+####
+
+def pick_crate(rng, crates, published, date):
+    """
+        A crate published before `date`, biased towards early (popular) crates
+    """
+    available = bisect.bisect_left(published, date)
+    if available == 0:
+        return None
+    return crates[int(available * rng.random() ** POPULARITY)]
+
+
+def requirement(rng, dep, date):
+    """
+        A requirement on a version of `dep` that was released before `date`
+    """
+    released = bisect.bisect_left(dep.dates, date)
+    if released == 0:
+        return "*"
+    i = released - 1 if rng.random() < 0.7 else rng.randrange(released)
+    ver = dep.versions[i][1]
+    if "-" in ver:
+        # only a requirement naming the pre-release matches it
+        return "^" + ver
+    major, minor, patch = [int(x) for x in ver.split(".")]
+    return weighted(rng, REQUIREMENTS).format(major=major, minor=minor, patch=patch, next_major=major + 1)
+
+
+def index_entry(rng, crate, version, crates, published):
+    date, ver, _, _ = version
+    deps = []
+    names = set()
+    for _ in range(geometric(rng, DEPS_MEAN + 1) - 1):
+        # mostly crates that are older than the crate itself: few cycles, as on crates.io
+        dep = pick_crate(rng, crates, published, date if rng.random() < CYCLES else crate.published)
+        if dep is None or dep is crate or dep.name in names:
+            continue
+        names.add(dep.name)
+        d = {
+            "name": dep.name,
+            "req": requirement(rng, dep, date),
+            "features": rng.sample(dep.features, min(len(dep.features), geometric(rng, 1.5) - 1)),
+            "optional": rng.random() < 0.2,
+            "default_features": rng.random() < 0.9,
+            "target": weighted(rng, TARGETS),
+            "kind": weighted(rng, KINDS),
+        }
+        if rng.random() < 0.01:
+            d["package"], d["name"] = dep.name, dep.name + "-renamed"
+        deps.append(d)
+
+    # features only name earlier features, optional dependencies and dep/feature requests (no cycles)
+    features = {}
+    optional = [d["name"] for d in deps if d["optional"]]
+    for feature in crate.features:
+        enables = rng.sample(list(features), min(len(features), geometric(rng, 1.5) - 1))
+        if optional and rng.random() < 0.5:
+            enables.append(rng.choice(optional))
+        if deps and rng.random() < 0.2:
+            d = rng.choice(deps)
+            enables.append("{}/{}".format(d["name"], rng.choice(FEATURES)))
+        features[feature] = enables
+    if crate.features or optional:
+        default = [f for f in crate.features if rng.random() < 0.5]
+        default += [name for name in optional if rng.random() < 0.3]
+        features["default"] = default
+
+    return {"name": crate.name, "vers": ver, "deps": deps, "features": features,
+            "cksum": "{:064x}".format(rng.getrandbits(256)), "yanked": rng.random() < 0.02}
+
+
+def popular_fn(rng, first, last):
+    """
+        Function index in [first, last), favouring the first functions of the API
+    """
+    return first + int((last - first) * rng.random() ** 2)
+
+
+def stitching_files(rng, crate, version, entry, crates_by_name):
+    """
+        (entrypoints, paths) of a version: calls from its functions to the functions of its dependencies
+    """
+    _, _, first, last = version
+    entrypoints = [crate.fn(i) for i in range(first, last)]
+    paths = set()
+    for d in entry["deps"]:
+        if d["kind"] == "dev" or rng.random() < 0.1:
+            continue
+        dep = crates_by_name[d.get("package", d["name"])]
+        # functions of the latest release of the dependency
+        released = max(1, bisect.bisect_left(dep.dates, version[0]))
+        _, _, d_first, d_last = dep.versions[released - 1]
+        for _ in range(geometric(rng, 3)):
+            paths.add((crate.fn(popular_fn(rng, first, last)), dep.name,
+                dep.fn(popular_fn(rng, d_first, d_last)), weighted(rng, DISPATCH)))
+    return entrypoints, sorted(paths)
+
+
+def write_lines(path, lines):
+    with open(path, "w") as fh:
+        fh.writelines(s + '\n' for s in lines)
+
+
+def format_ts(rng, date):
+    # releases.csv has timestamps with and without fractional seconds
+    if rng.random() < 0.9:
+        return date.strftime("%Y-%m-%dT%H:%M:%S.") + "{:06d}+00:00".format(rng.randrange(1000000))
+    return date.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def commit_index(index_dir):
+    """
+        Make the index a git checkout with a reproducible HEAD, so evolysis caches its tables
+    """
+    env = dict(os.environ, GIT_AUTHOR_NAME="bench", GIT_AUTHOR_EMAIL="bench@localhost", GIT_COMMITTER_NAME="bench",
+        GIT_COMMITTER_EMAIL="bench@localhost", GIT_AUTHOR_DATE=END.isoformat(), GIT_COMMITTER_DATE=END.isoformat())
+    try:
+        for cmd in [["init", "-q"], ["add", "-A"], ["commit", "-q", "-m", "synthetic index"]]:
+            subprocess.run(["git", "-C", index_dir] + cmd, env=env, stdout=subprocess.DEVNULL, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        print("[{}] could not commit {}, the tables will not be cached".format(sys.argv[0], index_dir))
+
+
+def generate(out, nversions, seed=0):
+    """
+        Write a corpus of at least `nversions` crate versions to `out` (replacing it), returns its statistics
+    """
+    rng = random.Random(seed)
+    crates = publish_crates(rng, nversions)
+    published = [crate.published for crate in crates]
+    crates_by_name = dict((crate.name, crate) for crate in crates)
+
+    shutil.rmtree(out, ignore_errors=True)
+    index_dir = os.path.join(out, "crates.io-index")
+    store = os.path.join(out, "stitching")
+    os.makedirs(index_dir)
+    os.makedirs(store)
+    with open(os.path.join(index_dir, "config.json"), "w") as fh:
+        json.dump({"dl": "https://crates.io/api/v1/crates", "api": "https://crates.io"}, fh)
+
+    stats = {"crates": len(crates), "versions": 0, "dependencies": 0, "docsrs": 0, "praezi": 0, "calls": 0}
+    with open(os.path.join(out, "releases.csv"), "w") as releases, \
+            open(os.path.join(out, "docsrs.csv"), "w") as docsrs, \
+            open(manifest.manifest_path(store), "w") as manifest_fh:
+        for crate in crates:
+            lines = []
+            for version in crate.versions:
+                entry = index_entry(rng, crate, version, crates, published)
+                lines.append(json.dumps(entry))
+                date, ver = version[0], version[1]
+                releases.write("{},{},{}\n".format(format_ts(rng, date), crate.name, ver))
+                built = rng.random() < DOCSRS_RATE
+                docsrs.write("{},{},{},rustc 1.41.0-nightly (412f43ac5 2019-11-24),{},{}\n".format(
+                    crate.name, ver, built, (date + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S"), 1 + rng.randrange(3)))
+                stats["versions"] += 1
+                stats["dependencies"] += len(entry["deps"])
+                stats["docsrs"] += built
+
+                if rng.random() < PRAEZI_RATE:
+                    entrypoints, paths = stitching_files(rng, crate, version, entry, crates_by_name)
+                    folder = os.path.join(store, crate.name, ver)
+                    os.makedirs(folder)
+                    unique = uuid.UUID(int=rng.getrandbits(128))
+                    entrypoints_file = os.path.join(folder, "entrypoints-{}.txt".format(unique))
+                    write_lines(entrypoints_file, entrypoints)
+                    pubfns.write(pubfns.pubfns_path(entrypoints_file), pubfns.hashes(crate.name, entrypoints))
+                    kinds = {"entrypoints"}
+                    if paths:
+                        write_lines(os.path.join(folder, "paths-{}.txt".format(unique)), [",".join(p) for p in paths])
+                        kinds.add("paths")
+                    manifest_fh.write(manifest.format_entry(crate.name, ver, kinds))
+                    stats["praezi"] += 1
+                    stats["calls"] += len(paths)
+            path = os.path.join(index_dir, index_path(crate.name))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_lines(path, lines)
+
+    commit_index(index_dir)
+    return stats
+
+
+if __name__ == "__main__":
+    stats = generate(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print("[{}] {}: {crates} crates, {versions} versions ({docsrs} on docs.rs, {praezi} with call graphs), {dependencies} dependencies, {calls} calls".format(
+        sys.argv[0], sys.argv[1], **stats))
@@ -0,0 +1,348 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Regression harness: runs every pipeline stage on a fixed fixture corpus and
+   compares its output with golden results, then checks its wall time and peak
+   RSS against earlier runs.
+
+    - annotate: ufiify-rustcg.py on every call graph of callgraphs.py (cdn_meta/)
+    - extract: extractor.py on every call graph (entrypoints, paths, exitpoints)
+    - aggregate, pdn json, cdn json: the steps of ufify/run.sh and gen/run.sh
+    - evolysis: evolysis-rustcg.py on a corpus.py corpus for FIXTURE_MONTHS, with
+      the closures of the last month and the files written by run.METRICS
+
+   Outputs are compared order-insensitively: every output is reduced to keys
+   (a file, a closure root, ..) holding the sorted list of their lines, with node
+   ids of the JSON networks replaced by names, uuids dropped from stitching file
+   names and numbers in CSV files rounded to 10 significant digits.
+
+   `record` writes the golden results to <work dir>/golden (or
+   $EVOLYSIS_BENCH_GOLDEN) and `check` compares with them. Both append the wall
+   time and peak RSS of every stage and evolysis phase to <work dir>/history.csv
+   unless the outputs differ. Once a stage has MIN_RUNS earlier runs, it is
+   flagged when it is more than $EVOLYSIS_BENCH_THRESHOLD (default 0.25) slower
+   or larger than the median of its last HISTORY_RUNS runs. `check` exits with 1
+   on a difference or a regression.
+
+   Run: python3 bench/regress.py record|check <work dir>
+"""
+import collections
+import datetime
+import gzip
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import callgraphs
+import corpus
+import run
+import stages
+
+sys.path.append(os.path.join(stages.ROOT, "common"))
+import pubfns
+
+EXTRACTOR = os.path.join(stages.ROOT, "api-pair-extract", "extractor.py")
+
+## The fixture corpus: call graphs (count, functions per call graph), crate versions, months and seed
+FIXTURE_CALLGRAPHS = 20
+FIXTURE_FUNCTIONS = 300
+FIXTURE_VERSIONS = 5000
+FIXTURE_MONTHS = "2019-11..2020-02"
+FIXTURE_SEED = 0
+
+GOLDEN = os.environ.get("EVOLYSIS_BENCH_GOLDEN")
+THRESHOLD = float(os.environ.get("EVOLYSIS_BENCH_THRESHOLD", 0.25))
+## Runs a stage is compared with, the runs needed before it is, and the wall time below which it is not flagged
+HISTORY_RUNS = 5
+MIN_RUNS = 3
+MIN_WALL = 0.1
+
+## Number of differing keys and lines shown per stage
+SHOWN = 5
+
+UUID = re.compile(r"-[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?=\.\w+$)")
+
+## Run in the evolysis session after run.METRICS: dumps the closures of the last month and the peak RSS
+DUMP = """
+import json
+_dump = {}
+for (_name, _closure) in [("index", index_closure), ("docsrs", docsrs_closure), ("praezi pkg", praezi_pkg_closure), ("praezi fn", praezi_fn_closure)]:
+    for (_k, _rows) in _closure.items():
+        _dump["closure {}/{}".format(_name, _k)] = sorted("\\t".join(str(x) for x in row) for row in _rows)
+with open("out/closures.json", "w") as fh:
+    json.dump(_dump, fh)
+with open("/proc/self/status") as fh:
+    _peak = [line.split()[1] for line in fh if line.startswith("VmHWM:")]
+with open("out/peak-rss", "w") as fh:
+    fh.write(_peak[0] if _peak else "0")
+"""
+
+
+def prepare(work_dir):
+    """
+        (call graph corpus, corpus) of the fixture, generated unless they were generated before
+    """
+    fixture = {"callgraphs": FIXTURE_CALLGRAPHS, "functions": FIXTURE_FUNCTIONS, "versions": FIXTURE_VERSIONS, "seed": FIXTURE_SEED}
+    stamp = os.path.join(work_dir, "fixture.json")
+    cg_dir, corpus_dir = os.path.join(work_dir, "callgraphs"), os.path.join(work_dir, "corpus")
+    if os.path.exists(stamp):
+        with open(stamp) as fh:
+            if json.load(fh)["fixture"] == fixture:
+                return cg_dir, corpus_dir
+    stats = {"fixture": fixture}
+    stats["callgraphs"] = callgraphs.generate(cg_dir, FIXTURE_CALLGRAPHS, FIXTURE_FUNCTIONS, FIXTURE_SEED)
+    stats["corpus"] = corpus.generate(corpus_dir, FIXTURE_VERSIONS, FIXTURE_SEED)
+    with open(stamp, "w") as fh:
+        json.dump(stats, fh)
+    return cg_dir, corpus_dir
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8", errors="surrogateescape") as fh:
+        return [line.rstrip("\n") for line in fh]
+
+
+def canonical_cell(cell):
+    try:
+        return "{:.10g}".format(float(cell))
+    except ValueError:
+        return cell
+
+
+def tree_outputs(top, canonical_file):
+    """
+        relative path (without uuid) -> sorted lines of every file under top, files sharing a key are merged
+    """
+    outputs = collections.defaultdict(list)
+    for (folder, _, files) in os.walk(top):
+        for name in files:
+            path = os.path.join(folder, name)
+            lines = canonical_file(path)
+            if lines is not None:
+                outputs[UUID.sub("", os.path.relpath(path, top))].extend(lines)
+    return dict((k, sorted(v)) for (k, v) in outputs.items())
+
+
+def stitching_file(path):
+    if path.endswith(".u64"):
+        return ["{:016x}".format(h) for h in pubfns.read(path)]
+    return read_lines(path)
+
+
+def pdn_outputs(path):
+    with open(path) as fh:
+        data = json.load(fh)
+    names = dict((node["id"], node["name"]) for node in data["nodes"])
+    return {"pdn nodes": sorted(names.values()),
+            "pdn edges": sorted("{} {}".format(names[e["src"]], names[t]) for e in data["edges"] for t in e["tgts"])}
+
+
+def cdn_outputs(path):
+    with open(path) as fh:
+        data = json.load(fh)
+    names = dict((node["id"], node["attr"]["def_id"]) for node in data["nodes"])
+    outputs = {"cdn nodes": sorted(",".join([a["def_id"], a["acc"], a["loc"], a["type"]]) for a in (n["attr"] for n in data["nodes"]))}
+    for (category, edges) in data.items():
+        if category != "nodes":
+            outputs["cdn {}".format(category)] = sorted("{} {}".format(names[e["src"]], names[t]) for e in edges for t in e["tgts"])
+    return outputs
+
+
+def evolysis_file(path):
+    name = os.path.basename(path)
+    if name in ["bench.log", "closures.json", "peak-rss"] or name.endswith("-report.json") or name.endswith("-profile.folded"):
+        return None
+    return [",".join(canonical_cell(cell) for cell in line.split(",")) for line in read_lines(path)]
+
+
+def run_stages(work_dir):
+    """
+        (stage -> outputs, [(stage, wall, peak RSS)]) of the pipeline on the fixture
+    """
+    cg_dir, corpus_dir = prepare(work_dir)
+    cdn = os.path.join(work_dir, "cdn")
+    store = os.path.join(work_dir, "stitching")
+    for folder in [cdn, store]:
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+    outputs, timings = {}, []
+
+    with open(os.path.join(work_dir, "regress.log"), "w") as log:
+        wall, rss, _ = stages.annotate(cg_dir, log, False)
+        timings.append(("annotate", wall, rss))
+        outputs["annotate"] = tree_outputs(cg_dir, lambda path: read_lines(path) if os.path.basename(os.path.dirname(path)) == "cdn_meta" else None)
+
+        wall, rss = 0.0, 0.0
+        for crate in sorted(os.listdir(cg_dir)):
+            for ver in sorted(os.listdir(os.path.join(cg_dir, crate))):
+                w, r = stages.run_script(EXTRACTOR, ["callgraph.json", "type_hierarchy.json", "Cargo.lock", store], os.path.join(cg_dir, crate, ver), log)
+                wall, rss = wall + w, max(rss, r)
+        timings.append(("extract", wall, rss))
+        outputs["extract"] = tree_outputs(store, stitching_file)
+
+        wall, _ = stages.aggregate(cg_dir, cdn, log)
+        timings.append(("aggregate", wall, None))
+        outputs["aggregate"] = tree_outputs(cdn, read_lines)
+
+        for (stage, script, prefix, canonical) in [("pdn json", stages.PDN_JSON, "pdn", pdn_outputs), ("cdn json", stages.CDN_JSON, "cdn", cdn_outputs)]:
+            wall, rss = stages.run_script(script, ["{}_all_nodes.txt".format(prefix), "{}_all_edges.txt".format(prefix), prefix], cdn, log)
+            timings.append((stage, wall, rss))
+            outputs[stage] = canonical(os.path.join(cdn, "{}.json".format(prefix)))
+
+    started = time.time()
+    report = run.run_pipeline(corpus_dir, FIXTURE_MONTHS, run.METRICS + ["exec({!r})".format(DUMP)])
+    wall = time.time() - started
+    with open(os.path.join(corpus_dir, "out", "peak-rss")) as fh:
+        timings.append(("evolysis", wall, int(fh.read()) / 1024.0))
+    for (name, (wall, _, rss)) in run.phase_totals(report).items():
+        if name != "total":
+            timings.append(("evolysis: {}".format(name), wall, rss))
+    with open(os.path.join(corpus_dir, "out", "closures.json")) as fh:
+        outputs["evolysis"] = json.load(fh)
+    outputs["evolysis"].update(tree_outputs(os.path.join(corpus_dir, "out"), evolysis_file))
+    return outputs, timings
+
+
+def golden_path(golden, stage):
+    return os.path.join(golden, "{}.json.gz".format(stage.replace(" ", "-")))
+
+
+def differences(expected, actual):
+    """
+        Messages for the keys and lines of actual that differ from expected
+    """
+    messages = []
+    for k in sorted(set(expected) - set(actual)):
+        messages.append("missing {} ({} lines)".format(k, len(expected[k])))
+    for k in sorted(set(actual) - set(expected)):
+        messages.append("unexpected {} ({} lines)".format(k, len(actual[k])))
+    for k in sorted(set(expected) & set(actual)):
+        if expected[k] != actual[k]:
+            e, a = collections.Counter(expected[k]), collections.Counter(actual[k])
+            missing, extra = sorted((e - a).elements()), sorted((a - e).elements())
+            messages.append("{}: {} lines missing, {} unexpected".format(k, len(missing), len(extra)))
+            messages.extend("  - {}".format(line) for line in missing[:SHOWN])
+            messages.extend("  + {}".format(line) for line in extra[:SHOWN])
+    return messages
+
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=stages.ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def read_history(path):
+    """
+        stage -> [(wall, peak RSS)] of the earlier runs, oldest first
+    """
+    history = collections.defaultdict(list)
+    if os.path.exists(path):
+        with open(path) as fh:
+            next(fh)
+            for line in fh:
+                _, _, stage, wall, rss = line.rstrip("\n").rsplit(",", 4)
+                history[stage].append((float(wall), float(rss) if rss else None))
+    return history
+
+
+def regressions(history, timings):
+    """
+        Messages for the stages slower or larger than THRESHOLD over the median of their last HISTORY_RUNS runs
+    """
+    messages = []
+    for (stage, wall, rss) in timings:
+        runs = history.get(stage, [])[-HISTORY_RUNS:]
+        if len(runs) < MIN_RUNS:
+            continue
+        base_wall = statistics.median(w for (w, _) in runs)
+        if wall >= MIN_WALL and wall > base_wall * (1 + THRESHOLD):
+            messages.append("{}: {:.2f}s, median of the last {} runs {:.2f}s (+{:.0%})".format(stage, wall, len(runs), base_wall, wall / base_wall - 1))
+        rss_runs = [r for (_, r) in runs if r is not None]
+        if rss is not None and rss_runs:
+            base_rss = statistics.median(rss_runs)
+            if rss > base_rss * (1 + THRESHOLD):
+                messages.append("{}: peak RSS {:.0f} MB, median of the last {} runs {:.0f} MB (+{:.0%})".format(stage, rss, len(rss_runs), base_rss, rss / base_rss - 1))
+    return messages
+
+
+def append_history(path, timings):
+    new = not os.path.exists(path)
+    with open(path, "a") as fh:
+        if new:
+            fh.write("date,revision,stage,wall,peak_rss_mb\n")
+        date, rev = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"), revision()
+        for (stage, wall, rss) in timings:
+            fh.write("{},{},{},{:.6f},{}\n".format(date, rev, stage, wall, "" if rss is None else "{:.1f}".format(rss)))
+
+
+def regress(command, work_dir):
+    os.makedirs(work_dir, exist_ok=True)
+    golden = GOLDEN or os.path.join(work_dir, "golden")
+    history_path = os.path.join(work_dir, "history.csv")
+
+    outputs, timings = run_stages(work_dir)
+    failed = False
+    if command == "record":
+        os.makedirs(golden, exist_ok=True)
+        for (stage, stage_outputs) in outputs.items():
+            with gzip.open(golden_path(golden, stage), "wt") as fh:
+                json.dump(stage_outputs, fh, sort_keys=True)
+        print("[{}] recorded the outputs of {} stages to {}".format(sys.argv[0], len(outputs), golden))
+    else:
+        for (stage, stage_outputs) in outputs.items():
+            if not os.path.exists(golden_path(golden, stage)):
+                raise Exception("no golden results for {} in {}, run record first".format(stage, golden))
+            with gzip.open(golden_path(golden, stage), "rt") as fh:
+                messages = differences(json.load(fh), stage_outputs)
+            print("[{}] {}: {}".format(sys.argv[0], stage, "{} differences".format(len(messages)) if messages else "equivalent"))
+            for message in messages[:SHOWN * (2 * SHOWN + 1)]:
+                print("    {}".format(message))
+            failed = failed or bool(messages)
+
+    slow = regressions(read_history(history_path), timings)
+    # the timings of a run with different outputs are not comparable
+    if not failed:
+        append_history(history_path, timings)
+    width = max(len(stage) for (stage, _, _) in timings)
+    print("{}  {:>9} {:>9}".format("stage".ljust(width), "wall (s)", "RSS (MB)"))
+    for (stage, wall, rss) in timings:
+        print("{}  {:>9.2f} {:>9}".format(stage.ljust(width), wall, "-" if rss is None else "{:.0f}".format(rss)))
+    for message in slow:
+        print("[{}] regression: {}".format(sys.argv[0], message))
+    return not (failed or (command == "check" and slow))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ["record", "check"]:
+        print("Run: python3 bench/regress.py record|check <work dir>")
+        sys.exit(2)
+    sys.exit(0 if regress(sys.argv[1], sys.argv[2]) else 1)
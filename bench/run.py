@@ -0,0 +1,175 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Scaling benchmark of evolysis-rustcg.py on synthetic corpora (corpus.py).
+
+   For every size, a corpus of that many crate versions is generated into
+   <work dir>/corpus-<size> (kept for later runs), and the pipeline runs on it
+   from a cold table cache with checkpoints disabled: table loading, the
+   closures of the month(s) EVOLYSIS_BENCH_MONTHS (default 2020-02, a range
+   such as 2019-01..2020-02 runs the incremental mode) and the METRICS below.
+   The phases of the run reports (see analysis/instrument.py) are collected
+   into <work dir>/scaling.csv, and a table of wall times per size is printed
+   with the fitted exponent b of wall ~ size^b per phase.
+
+   Run: python3 bench/run.py <work dir> <crate versions> [<crate versions> ..]
+   e.g. python3 bench/run.py /tmp/bench 1000 10000 100000
+"""
+import collections
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import corpus
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+SCRIPT = os.path.join(ROOT, "analysis", "evolysis-rustcg.py")
+
+MONTHS = os.environ.get("EVOLYSIS_BENCH_MONTHS", corpus.END.strftime("%Y-%m"))
+SEED = int(os.environ.get("EVOLYSIS_BENCH_SEED", 0))
+
+## Statements run in the interactive session after the networks are built
+METRICS = [
+    'num_of_dependencies(index_closure, "index")',
+    'num_of_dependencies(praezi_pkg_closure, "praezi")',
+    'num_of_dependents(index_closure, "index")',
+    'num_of_dependency_fns(praezi_fn_closure, "praezi")',
+    'num_of_dependents_fns(praezi_fn_closure, "praezi")',
+    'num_of_overlap_depfn(praezi_fn_closure, "praezi")',
+    'percentage_bloat_fns(praezi_pkg_closure, "praezi")',
+    'percentage_package_reach(praezi_pkg_closure, "praezi")',
+]
+
+
+def prepare(work_dir, size):
+    """
+        Corpus directory of a size, generated unless it was generated before with the same seed
+    """
+    out = os.path.join(work_dir, "corpus-{}".format(size))
+    stamp = os.path.join(out, "corpus.json")
+    if os.path.exists(stamp):
+        with open(stamp) as fh:
+            stats = json.load(fh)
+        if stats.get("seed") == SEED:
+            return out, stats
+    started = time.time()
+    stats = corpus.generate(out, size, SEED)
+    stats.update({"seed": SEED, "generate": time.time() - started})
+    with open(stamp, "w") as fh:
+        json.dump(stats, fh)
+    print("[{}] generated {} ({versions} versions, {calls} calls) in {generate:.1f}s".format(sys.argv[0], out, **stats))
+    return out, stats
+
+
+def run_pipeline(out, months=MONTHS, statements=METRICS):
+    """
+        Run report of evolysis-rustcg.py on a corpus for months, running statements in the session
+    """
+    env = dict(os.environ)
+    env["EVOLYSIS_STITCHING_STORE"] = os.path.join(out, "stitching")
+    env["EVOLYSIS_CACHE_DIR"] = os.path.join(out, "cache")
+    env["EVOLYSIS_CHECKPOINT_DIR"] = ""
+    if "SEMVER_FFI" not in env:
+        env["SEMVER_FFI"] = os.path.join(ROOT, "bindings", "target", "release", "libsemver_ffi.so")
+
+    shutil.rmtree(os.path.join(out, "cache"), ignore_errors=True)
+    shutil.rmtree(os.path.join(out, "out"), ignore_errors=True)
+    for folder in ["out", "out/bloat", "out/centrality"]:
+        os.makedirs(os.path.join(out, folder), exist_ok=True)
+
+    log = os.path.join(out, "out", "bench.log")
+    with open(log, "w") as fh:
+        proc = subprocess.run([sys.executable, "-i", SCRIPT, months], cwd=out, env=env, stdout=fh, stderr=subprocess.STDOUT,
+            input="\n".join(statements + [""]).encode('ascii'))
+    with open(log) as fh:
+        failed = proc.returncode != 0 or "Traceback" in fh.read()
+    if failed:
+        raise Exception("evolysis-rustcg.py failed on {}, see {}".format(out, log))
+    with open(os.path.join(out, "out", "{}-report.json".format(months))) as fh:
+        return json.load(fh)
+
+
+def phase_totals(report):
+    """
+        phase name -> (wall, cpu, peak rss), summed over months (the peak is the maximum)
+    """
+    totals = collections.OrderedDict()
+    for ph in report["phases"]:
+        wall, cpu, rss = totals.get(ph["name"], (0.0, 0.0, 0.0))
+        totals[ph["name"]] = (wall + ph["wall"], cpu + ph["cpu"], max(rss, ph["peak_rss_mb"]))
+    totals["total"] = (report["wall"], report["cpu"], report["peak_rss_mb"])
+    return totals
+
+
+def exponent(points):
+    """
+        Least-squares slope of log(wall) over log(size)
+    """
+    points = [(math.log(x), math.log(y)) for (x, y) in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mx = sum(x for (x, _) in points) / len(points)
+    my = sum(y for (_, y) in points) / len(points)
+    var = sum((x - mx) ** 2 for (x, _) in points)
+    if var == 0:
+        return None
+    return sum((x - mx) * (y - my) for (x, y) in points) / var
+
+
+def bench(work_dir, sizes):
+    os.makedirs(work_dir, exist_ok=True)
+    results = collections.OrderedDict()
+    for size in sizes:
+        out, stats = prepare(work_dir, size)
+        report = run_pipeline(out)
+        results[stats["versions"]] = phase_totals(report)
+        print("[{}] {} versions: {:.1f}s, peak RSS {:.0f} MB".format(sys.argv[0], stats["versions"], report["wall"], report["peak_rss_mb"]))
+
+    with open(os.path.join(work_dir, "scaling.csv"), "w") as fh:
+        fh.write("versions,phase,wall,cpu,peak_rss_mb\n")
+        for (versions, totals) in results.items():
+            for (name, (wall, cpu, rss)) in totals.items():
+                fh.write("{},{},{:.6f},{:.6f},{:.1f}\n".format(versions, name, wall, cpu, rss))
+
+    names = []
+    for totals in results.values():
+        names.extend(name for name in totals if name not in names)
+    width = max(len(name) for name in names)
+    print("{}  {}  {:>6}".format("phase".ljust(width), "  ".join("{:>10}".format(v) for v in results), "b"))
+    for name in names:
+        walls = [totals.get(name, (None,))[0] for totals in results.values()]
+        b = exponent([(v, w) for (v, w) in zip(results, walls) if w is not None])
+        print("{}  {}  {:>6}".format(name.ljust(width),
+            "  ".join("{:>10}".format("-" if w is None else "{:.3f}".format(w)) for w in walls),
+            "-" if b is None else "{:.2f}".format(b)))
+    return results
+
+
+if __name__ == "__main__":
+    bench(sys.argv[1], [int(size) for size in sys.argv[2:]])
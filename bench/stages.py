@@ -0,0 +1,199 @@
+# MIT License
+
+# Copyright (c) 2020 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+   Benchmark of the static CDN generation on synthetic call graph corpora
+   (callgraphs.py), stage by stage:
+
+    - annotate: ufiify-rustcg.py on every call graph (ufify/run.sh, step 1),
+      once compiling the call graph caches (cold) and once loading them (cached)
+    - aggregate: concatenating the node and edge files of all call graphs
+      (ufify/run.sh, steps 2-5, without GNU parallel)
+    - pdn json, cdn json: gen/generate-pdn-json.py and gen/generate-cdn-json.py (gen/run.sh)
+
+   For every stage it reports the wall time, the edges read per second, the peak
+   RSS of the largest Python process (none for the shell aggregation) and the
+   size of the output. A corpus of each size
+   is generated into <work dir>/callgraphs-<size> (EVOLYSIS_BENCH_FUNCTIONS
+   functions per call graph, default 200) and kept for later runs; the results
+   are written to <work dir>/stages.csv.
+
+   Run: python3 bench/stages.py <work dir> <call graphs> [<call graphs> ..]
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import callgraphs
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+UFIFY = os.path.join(ROOT, "ufify", "ufiify-rustcg.py")
+PDN_JSON = os.path.join(ROOT, "gen", "generate-pdn-json.py")
+CDN_JSON = os.path.join(ROOT, "gen", "generate-cdn-json.py")
+
+FUNCTIONS = int(os.environ.get("EVOLYSIS_BENCH_FUNCTIONS", 200))
+SEED = int(os.environ.get("EVOLYSIS_BENCH_SEED", 0))
+
+AGGREGATES = ["pdn_nodes", "cdn_nodes", "pdn_edges", "cdn_edges"]
+
+
+def prepare(work_dir, size):
+    """
+        Corpus directory of a size, generated unless it was generated before with the same parameters
+    """
+    out = os.path.join(work_dir, "callgraphs-{}".format(size))
+    stamp = os.path.join(work_dir, "callgraphs-{}.json".format(size))
+    if os.path.exists(stamp):
+        with open(stamp) as fh:
+            stats = json.load(fh)
+        if stats.get("seed") == SEED and stats.get("nfns") == FUNCTIONS:
+            return out, stats
+    stats = callgraphs.generate(out, size, FUNCTIONS, SEED)
+    stats.update({"seed": SEED, "nfns": FUNCTIONS})
+    with open(stamp, "w") as fh:
+        json.dump(stats, fh)
+    return out, stats
+
+
+## Runs a script as __main__ and writes its peak RSS (kB) to argv[1]; the max RSS of
+## wait4() would include the memory of the benchmark process the child was forked from
+PEAK_RSS = """
+import atexit, resource, runpy, sys
+def peak(path=sys.argv[1]):
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open("/proc/self/status") as fh:
+            kb = int([line.split()[1] for line in fh if line.startswith("VmHWM:")][0])
+    except (OSError, IndexError):
+        pass
+    with open(path, "w") as fh:
+        fh.write(str(kb))
+atexit.register(peak)
+sys.argv = sys.argv[2:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def run(cmd, cwd, log):
+    """
+        Wall time of a command
+    """
+    started = time.time()
+    if subprocess.run(cmd, cwd=cwd, stdout=log, stderr=subprocess.STDOUT).returncode != 0:
+        raise Exception("{} failed in {}, see {}".format(" ".join(cmd), cwd, log.name))
+    return time.time() - started
+
+
+def run_script(script, args, cwd, log):
+    """
+        (wall time, peak RSS in MB) of a Python script
+    """
+    peak = os.path.join(cwd, ".peak-rss")
+    wall = run([sys.executable, "-c", PEAK_RSS, peak, script] + args, cwd, log)
+    with open(peak) as fh:
+        rss = int(fh.read()) / 1024.0
+    os.remove(peak)
+    return wall, rss
+
+
+def lines(path):
+    with open(path, "rb") as fh:
+        return sum(1 for _ in fh)
+
+
+def annotate(out, log, cached):
+    """
+        ufiify-rustcg.py on every call graph of the corpus; (wall, peak RSS, output bytes)
+    """
+    wall, rss, size = 0.0, 0.0, 0
+    for crate in sorted(os.listdir(out)):
+        for ver in sorted(os.listdir(os.path.join(out, crate))):
+            folder = os.path.join(out, crate, ver)
+            shutil.rmtree(os.path.join(folder, "cdn_meta"), ignore_errors=True)
+            if not cached and os.path.exists(os.path.join(folder, "callgraph.cgc")):
+                os.remove(os.path.join(folder, "callgraph.cgc"))
+            w, r = run_script(UFIFY, ["callgraph.json", "./{}/{}".format(crate, ver)], folder, log)
+            wall, rss = wall + w, max(rss, r)
+            size += sum(e.stat().st_size for e in os.scandir(os.path.join(folder, "cdn_meta")))
+    return wall, rss, size
+
+
+def aggregate(out, cdn, log):
+    """
+        <cdn>/<kind>_all_<..>.txt from the files of all call graphs, without empty lines; (wall, output bytes)
+    """
+    wall = 0.0
+    for kind in AGGREGATES:
+        target = os.path.join(cdn, "{}_all_{}.txt".format(*kind.split("_")))
+        cmd = "find . -type f -name {}.txt -exec sh -c 'for f; do cat \"$f\"; echo; done' _ {{}} + | sed '/^$/d' > {}".format(kind, target)
+        wall += run(["sh", "-c", cmd], out, log)
+    return wall, sum(os.path.getsize(os.path.join(cdn, name)) for name in os.listdir(cdn))
+
+
+def bench(work_dir, sizes):
+    os.makedirs(work_dir, exist_ok=True)
+    rows = []
+    for size in sizes:
+        out, stats = prepare(work_dir, size)
+        cdn = os.path.join(work_dir, "cdn-{}".format(size))
+        shutil.rmtree(cdn, ignore_errors=True)
+        os.makedirs(cdn)
+        calls = stats["function_calls"] + stats["macro_calls"]
+
+        results = []
+        with open(os.path.join(work_dir, "cdn-{}.log".format(size)), "w") as log:
+            results.append(("annotate (cold)", calls) + annotate(out, log, False))
+            results.append(("annotate (cached)", calls) + annotate(out, log, True))
+            # streamed through find, cat and sed: no peak RSS
+            wall, size_bytes = aggregate(out, cdn, log)
+            edges = lines(os.path.join(cdn, "pdn_all_edges.txt")) + lines(os.path.join(cdn, "cdn_all_edges.txt"))
+            results.append(("aggregate", edges, wall, None, size_bytes))
+            for (stage, script, prefix) in [("pdn json", PDN_JSON, "pdn"), ("cdn json", CDN_JSON, "cdn")]:
+                wall, rss = run_script(script, ["{}_all_nodes.txt".format(prefix), "{}_all_edges.txt".format(prefix), prefix], cdn, log)
+                results.append((stage, lines(os.path.join(cdn, "{}_all_edges.txt".format(prefix))), wall, rss,
+                    os.path.getsize(os.path.join(cdn, "{}.json".format(prefix)))))
+
+        for (stage, edges, wall, rss, size_bytes) in results:
+            rows.append({"callgraphs": stats["callgraphs"], "stage": stage, "wall": wall, "edges": edges,
+                "edges_per_sec": edges / wall if wall > 0 else 0.0, "peak_rss_mb": rss, "output_mb": size_bytes / float(1 << 20)})
+
+    columns = ["callgraphs", "stage", "wall", "edges", "edges_per_sec", "peak_rss_mb", "output_mb"]
+    with open(os.path.join(work_dir, "stages.csv"), "w") as fh:
+        fh.write(",".join(columns) + "\n")
+        for row in rows:
+            fh.write("{},{},{:.6f},{},{:.1f},{},{:.3f}\n".format(row["callgraphs"], row["stage"], row["wall"], row["edges"],
+                row["edges_per_sec"], "" if row["peak_rss_mb"] is None else "{:.1f}".format(row["peak_rss_mb"]), row["output_mb"]))
+
+    print("{:>10}  {:<18} {:>9} {:>10} {:>12} {:>9} {:>10}".format("cgs", "stage", "wall (s)", "edges", "edges/s", "RSS (MB)", "out (MB)"))
+    for row in rows:
+        print("{:>10}  {:<18} {:>9.2f} {:>10} {:>12.0f} {:>9} {:>10.2f}".format(row["callgraphs"], row["stage"], row["wall"], row["edges"],
+            row["edges_per_sec"], "-" if row["peak_rss_mb"] is None else "{:.0f}".format(row["peak_rss_mb"]), row["output_mb"]))
+    return rows
+
+
+if __name__ == "__main__":
+    bench(sys.argv[1], [int(size) for size in sys.argv[2:]])
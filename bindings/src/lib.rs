@@ -25,8 +25,9 @@ extern crate semver;
 extern crate libc;
 
 use semver::{Version,VersionReq};
-use libc::c_char;
+use libc::{c_char, size_t};
 use std::ffi::CStr;
+use std::slice;
 
 #[no_mangle]
 pub extern fn is_match(req: *const c_char, ver: *const c_char) -> bool {
@@ -94,4 +95,104 @@ pub extern fn valid(ver: *const c_char) -> bool {
         Ok(_) => return true,
         Err(_) => return false,
     }
-}
\ No newline at end of file
+}
+
+/// A registered list of versions of one package, parsed once.
+/// Versions that do not parse are kept as `None` so indices match the input list.
+pub struct VersionSet {
+    versions: Vec<Option<Version>>,
+}
+
+#[no_mangle]
+pub extern fn versions_new(vers: *const *const c_char, len: size_t) -> *mut VersionSet {
+    let raw = unsafe {
+        assert!(!vers.is_null() || len == 0);
+        slice::from_raw_parts(vers, len)
+    };
+
+    let versions = raw.iter().map(|&ver| {
+        let ver_str = unsafe {
+            assert!(!ver.is_null());
+            CStr::from_ptr(ver)
+        };
+        match ver_str.to_str() {
+            Ok(v) => Version::parse(v).ok(),
+            Err(_) => None,
+        }
+    }).collect();
+
+    return Box::into_raw(Box::new(VersionSet { versions: versions }));
+}
+
+#[no_mangle]
+pub extern fn versions_free(set: *mut VersionSet) {
+    if set.is_null() {
+        return;
+    }
+    unsafe {
+        drop(Box::from_raw(set));
+    }
+}
+
+/// Index of the highest version matching `req`, or -1 if none does (or `req` does not parse).
+/// On equal versions the later one in the registered list wins, like a stable sort followed by a pop.
+#[no_mangle]
+pub extern fn max_satisfying(set: *const VersionSet, req: *const c_char) -> i64 {
+    let set = unsafe {
+        assert!(!set.is_null());
+        &*set
+    };
+    let req_str = unsafe {
+        assert!(!req.is_null());
+        CStr::from_ptr(req)
+    };
+
+    let r = match req_str.to_str().ok().and_then(|c| VersionReq::parse(c).ok()) {
+        Some(r) => r,
+        None => return -1,
+    };
+
+    let mut best: Option<(usize, &Version)> = None;
+    for (idx, ver) in set.versions.iter().enumerate() {
+        if let Some(v) = ver {
+            if r.matches(v) {
+                best = match best {
+                    Some((_, b)) if v < b => best,
+                    _ => Some((idx, v)),
+                };
+            }
+        }
+    }
+
+    match best {
+        Some((idx, _)) => idx as i64,
+        None => -1,
+    }
+}
+
+/// Writes the indices of all registered versions into `out` in ascending semver order
+/// (versions that do not parse last, as with `cmp`) and returns how many were written.
+#[no_mangle]
+pub extern fn versions_sorted(set: *const VersionSet, out: *mut size_t) -> size_t {
+    let set = unsafe {
+        assert!(!set.is_null());
+        &*set
+    };
+    let out = unsafe {
+        assert!(!out.is_null() || set.versions.is_empty());
+        slice::from_raw_parts_mut(out, set.versions.len())
+    };
+
+    let mut order: Vec<usize> = (0..set.versions.len()).collect();
+    order.sort_by(|&a, &b| match (&set.versions[a], &set.versions[b]) {
+        (Some(x), Some(y)) => x.cmp(y),
+        (Some(_), None) => std::cmp::Ordering::Less,
+        (None, Some(_)) => std::cmp::Ordering::Greater,
+        (None, None) => std::cmp::Ordering::Equal,
+    });
+
+    for (slot, idx) in out.iter_mut().zip(order.iter()) {
+        *slot = *idx;
+    }
+    return order.len();
+}
@@ -0,0 +1,189 @@
+# MIT License
+
+# Copyright (c) 2021 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+"""
+Inverted "who calls this API" index over the exitpoints in the stitching store.
+Exitpoints are stored per caller crate:
+
+    <store>/<crate>/<ver>/exitpoints/<dep>/{static,cha,macro}-<uuid>.txt
+
+The index (an SQLite file, `<store>/api-index.sqlite` by default) inverts them
+into `(dep crate, normalized fn) -> (caller crate::ver, dispatch)` rows, where
+dispatch is S (static), D (CHA) or M (macro) as in the paths files. Indexed
+files are recorded, so `update` only reads exitpoint files that were added
+since the last run. The extractor adds its own exitpoints when the index exists.
+
+Example:
+    python3 common/apiindex.py build /datasets/praezi/stitching
+    python3 common/apiindex.py update /datasets/praezi/stitching
+    python3 common/apiindex.py query /datasets/praezi/stitching serde "Serializer serialize_str"
+"""
+
+import base64
+import os
+import sqlite3
+import sys
+
+INDEX_NAME = "api-index.sqlite"
+
+DISPATCH = {"static": "S", "cha": "D", "macro": "M"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    dep TEXT NOT NULL,
+    fn TEXT NOT NULL,
+    caller TEXT NOT NULL,
+    dispatch TEXT NOT NULL,
+    PRIMARY KEY (dep, fn, caller, dispatch)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY
+) WITHOUT ROWID;
+"""
+
+
+def index_path(store):
+    return os.path.join(store, INDEX_NAME)
+
+
+def connect(store, path=None):
+    conn = sqlite3.connect(path or index_path(store), timeout=600)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def encode_fn(fn):
+    return base64.b64encode(fn.encode('ascii')).decode('ascii')
+
+
+def decode_fn(fn):
+    return base64.b64decode(fn.encode('ascii')).decode('ascii')
+
+
+####
+##### Scanning the store
+####
+
+def _subdirs(path):
+    try:
+        return [e for e in os.scandir(path) if e.is_dir()]
+    except OSError:
+        return []
+
+
+def exitpoint_files(store):
+    """
+        Yield (relative path, caller, dep, dispatch) for every exitpoint file in the store
+    """
+    for crate in _subdirs(store):
+        for ver in _subdirs(crate.path):
+            caller = "{}::{}".format(crate.name, ver.name)
+            for dep in _subdirs(os.path.join(ver.path, "exitpoints")):
+                for f in os.scandir(dep.path):
+                    kind = f.name.split("-")[0]
+                    if kind in DISPATCH and f.name.endswith(".txt"):
+                        rel = os.path.relpath(f.path, store)
+                        yield (rel, caller, dep.name, DISPATCH[kind])
+
+
+def describe(store, path):
+    """
+        (relative path, caller, dep, dispatch) of a single exitpoint file path
+    """
+    rel = os.path.relpath(path, store)
+    crate, ver, _, dep, name = rel.split(os.sep)[-5:]
+    return (rel, "{}::{}".format(crate, ver), dep, DISPATCH[name.split("-")[0]])
+
+
+def add_files(conn, store, files):
+    """
+        Index exitpoint files given as (relative path, caller, dep, dispatch); already indexed files are skipped
+    """
+    added = 0
+    with conn:
+        for (rel, caller, dep, dispatch) in files:
+            if conn.execute("SELECT 1 FROM files WHERE path = ?", (rel,)).fetchone():
+                continue
+            with open(os.path.join(store, rel)) as fh:
+                fns = set(line.rstrip('\n') for line in fh if line.strip())
+            conn.executemany("INSERT OR IGNORE INTO calls VALUES (?,?,?,?)",
+                             [(dep, fn, caller, dispatch) for fn in fns])
+            conn.execute("INSERT INTO files VALUES (?)", (rel,))
+            added += 1
+    return added
+
+
+def update(store, path=None):
+    """
+        Build the index or bring it up to date with exitpoint files added since the last run
+    """
+    conn = connect(store, path)
+    added = add_files(conn, store, exitpoint_files(store))
+    conn.close()
+    return added
+
+
+####
+##### Query API
+####
+
+def callers(conn, dep, fn):
+    """
+        Dependents calling `fn` (normalized, not base64-encoded) of crate `dep`:
+        {"callers": {crate::ver: [dispatch, ...]}, "counts": {"S": n, "D": n, "M": n}}
+    """
+    result = {"callers": {}, "counts": {"S": 0, "D": 0, "M": 0}}
+    rows = conn.execute("SELECT caller, dispatch FROM calls WHERE dep = ? AND fn = ?", (dep, encode_fn(fn)))
+    for (caller, dispatch) in rows:
+        result["callers"].setdefault(caller, []).append(dispatch)
+        result["counts"][dispatch] += 1
+    return result
+
+
+def used_apis(conn, dep):
+    """
+        All called functions of crate `dep` with their number of callers per dispatch kind
+    """
+    apis = {}
+    rows = conn.execute("SELECT fn, dispatch, COUNT(*) FROM calls WHERE dep = ? GROUP BY fn, dispatch", (dep,))
+    for (fn, dispatch, count) in rows:
+        apis.setdefault(decode_fn(fn), {"S": 0, "D": 0, "M": 0})[dispatch] = count
+    return apis
+
+
+if __name__ == "__main__":
+    cmd, store = sys.argv[1], sys.argv[2]
+    if cmd in ("build", "update"):
+        print("[{}] indexed {} new exitpoint files".format(sys.argv[0], update(store)))
+    elif cmd == "query":
+        conn = connect(store)
+        if len(sys.argv) > 4:
+            res = callers(conn, sys.argv[3], sys.argv[4])
+            for (caller, kinds) in sorted(res["callers"].items()):
+                print("{},{}".format(caller, "".join(sorted(kinds))))
+            print("static: {S}, cha: {D}, macro: {M}".format(**res["counts"]))
+        else:
+            for (fn, counts) in sorted(used_apis(conn, sys.argv[3]).items()):
+                print("{},{},{},{}".format(fn, counts["S"], counts["D"], counts["M"]))
+    else:
+        raise Exception("unknown command: " + cmd)
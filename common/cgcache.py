@@ -0,0 +1,427 @@
+# MIT License
+
+# Copyright (c) 2021 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+"""
+Compiled cache of a crate's `callgraph.json` and `type_hierarchy.json`. The
+JSON files are converted once into a binary file next to the call graph
+(`callgraph.cgc`) holding:
+
+ - an interned, sorted string table
+ - columnar node fields for functions, macros, types, traits and impls
+ - edge arrays for function and macro calls
+ - prebuilt `id -> row` and `relative_def_id -> rows` indexes
+
+Later runs mmap the file instead of parsing JSON. The cache stores the size and
+mtime of the source files and is rebuilt automatically when they change.
+
+Usage from a script:
+    cg = cgcache.load("callgraph.json", "type_hierarchy.json")
+    for fn in cg.functions: ...
+    cg.types.by_defid("wayland_client::imp[0]::Dispatcher[0]")
+
+Pre-build caches for a corpus:
+    find . -name callgraph.json -printf '%h\n' | parallel 'python3 common/cgcache.py {}/callgraph.json {}/type_hierarchy.json'
+"""
+
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+MAGIC = b"RCGC"
+FORMAT = 1
+
+####
+##### Table layouts (field, kind)
+####
+## s: interned string, i: integer (None -> -1), b: boolean (None/absent -> -1)
+
+NODE_FIELDS = [
+    ("id", "i"), ("package_name", "s"), ("package_version", "s"), ("crate_name", "s"),
+    ("relative_def_id", "s"), ("is_externally_visible", "b"), ("num_lines", "i"), ("source_location", "s")]
+
+TYPE_FIELDS = [
+    ("id", "i"), ("string_id", "s"), ("package_name", "s"), ("package_version", "s"), ("relative_def_id", "s")]
+
+TRAIT_FIELDS = [
+    ("id", "i"), ("package_name", "s"), ("package_version", "s"), ("relative_def_id", "s")]
+
+IMPL_FIELDS = [
+    ("id", "i"), ("type_id", "i"), ("trait_id", "i"), ("package_name", "s"), ("package_version", "s"), ("relative_def_id", "s")]
+
+TABLES = [
+    ("functions", "cg", NODE_FIELDS), ("macros", "cg", NODE_FIELDS),
+    ("types", "ty", TYPE_FIELDS), ("traits", "ty", TRAIT_FIELDS), ("impls", "ty", IMPL_FIELDS)]
+
+## function_calls: [src, dst, static, (resolved)], macro_calls: [src, dst, (resolved)]
+EDGES = [("function_calls", 4), ("macro_calls", 3)]
+
+TYPECODES = {"s": "i", "i": "q", "b": "b"}
+
+
+def fingerprint(cg_path, ty_path):
+    fp = []
+    for path in [cg_path, ty_path]:
+        try:
+            st = os.stat(path)
+            fp.append([st.st_size, st.st_mtime_ns])
+        except (OSError, TypeError):
+            fp.append(None)
+    return fp
+
+
+def default_cache_path(cg_path):
+    return os.path.splitext(cg_path)[0] + ".cgc"
+
+
+####
+##### Compile JSON -> binary
+####
+
+def _load_json(path, empty):
+    if path is None or not os.path.exists(path):
+        return empty
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _encode(value, kind, sidx):
+    if value is None:
+        return -1
+    if kind == "s":
+        return sidx[value]
+    if kind == "b":
+        return 1 if value else 0
+    return value
+
+
+def compile_json(cg_path, ty_path=None):
+    """
+        Convert the JSON files into the binary cache layout and return the bytes
+    """
+    cg = _load_json(cg_path, {})
+    ty = _load_json(ty_path, {})
+    docs = {"cg": cg, "ty": ty}
+
+    strings = set()
+    for (name, doc, fields) in TABLES:
+        for item in docs[doc].get(name, list()):
+            for (field, kind) in fields:
+                if kind == "s" and item.get(field) is not None:
+                    strings.add(item[field])
+    strings = sorted(strings)
+    sidx = dict((s, i) for (i, s) in enumerate(strings))
+
+    sections = []
+    data = "\0".join(strings).encode("utf-8")
+    sections.append(("strings", "B", array.array("B", data)))
+
+    for (name, doc, fields) in TABLES:
+        items = docs[doc].get(name, list())
+        for (field, kind) in fields:
+            col = array.array(TYPECODES[kind], [_encode(item.get(field), kind, sidx) for item in items])
+            sections.append(("{}.{}".format(name, field), col.typecode, col))
+        ## id -> row (dense, ids are small sequential integers in rustcg output)
+        ids = [item['id'] for item in items]
+        by_id = array.array("q", [-1]) * ((max(ids) + 1) if ids else 0)
+        for (row, _id) in enumerate(ids):
+            by_id[_id] = row
+        sections.append(("{}.by_id".format(name), "q", by_id))
+        ## relative_def_id -> rows (rows sorted by interned def_id)
+        keyed = sorted((sidx[item['relative_def_id']], row) for (row, item) in enumerate(items) if item.get('relative_def_id') is not None)
+        sections.append(("{}.defid_keys".format(name), "i", array.array("i", [k for (k, _) in keyed])))
+        sections.append(("{}.defid_rows".format(name), "q", array.array("q", [r for (_, r) in keyed])))
+
+    for (name, width) in EDGES:
+        calls = cg.get(name, list())
+        for pos in range(width):
+            if pos < 2:
+                col = array.array("q", [call[pos] for call in calls])
+            else:
+                col = array.array("b", [(1 if call[pos] else 0) if len(call) > pos else -1 for call in calls])
+            sections.append(("{}.{}".format(name, pos), col.typecode, col))
+
+    header = {"format": FORMAT, "source": fingerprint(cg_path, ty_path), "num_strings": len(strings), "sections": {}}
+    offset = 0
+    for (name, tc, col) in sections:
+        header["sections"][name] = [offset, tc, len(col)]
+        offset += _align(len(col) * col.itemsize)
+
+    raw_header = json.dumps(header).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(raw_header)) + raw_header
+    prefix += b"\0" * (_align(len(prefix)) - len(prefix))
+
+    out = bytearray(prefix)
+    for (name, tc, col) in sections:
+        raw = col.tobytes()
+        out += raw + b"\0" * (_align(len(raw)) - len(raw))
+    return bytes(out)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+####
+##### Loading
+####
+
+class Table(object):
+    """
+        Columnar view over one node table (functions, macros, types, traits or impls)
+    """
+    def __init__(self, cg, name, fields):
+        self.cg = cg
+        self.name = name
+        self.fields = fields
+        self.columns = dict((field, cg.section("{}.{}".format(name, field))) for (field, _) in fields)
+        self._by_id = cg.section("{}.by_id".format(name))
+        self._defid_keys = cg.section("{}.defid_keys".format(name))
+        self._defid_rows = cg.section("{}.defid_rows".format(name))
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __iter__(self):
+        strings = self.cg.strings
+        names = [field for (field, _) in self.fields]
+        cols = []
+        for (field, kind) in self.fields:
+            raw = self.columns[field].tolist()
+            if kind == "s":
+                cols.append([None if v == -1 else strings[v] for v in raw])
+            elif kind == "b":
+                cols.append([None if v == -1 else v == 1 for v in raw])
+            else:
+                cols.append([None if v == -1 else v for v in raw])
+        for values in zip(*cols):
+            yield dict(zip(names, values))
+
+    def value(self, row, field):
+        raw = self.columns[field][row]
+        kind = dict(self.fields)[field]
+        if raw == -1:
+            return None
+        if kind == "s":
+            return self.cg.string(raw)
+        if kind == "b":
+            return raw == 1
+        return raw
+
+    def row(self, row):
+        strings = self.cg.strings
+        item = {}
+        for (field, kind) in self.fields:
+            raw = self.columns[field][row]
+            if raw == -1:
+                item[field] = None
+            elif kind == "s":
+                item[field] = strings[raw]
+            elif kind == "b":
+                item[field] = raw == 1
+            else:
+                item[field] = raw
+        return item
+
+    def row_of(self, _id):
+        if 0 <= _id < len(self._by_id):
+            row = self._by_id[_id]
+            if row != -1:
+                return row
+        return None
+
+    def by_id(self, _id):
+        row = self.row_of(_id)
+        return None if row is None else self.row(row)
+
+    def rows_by_defid(self, def_id):
+        key = self.cg.find(def_id)
+        if key is None:
+            return []
+        lo = bisect.bisect_left(self._defid_keys, key)
+        hi = bisect.bisect_right(self._defid_keys, key)
+        return [self._defid_rows[i] for i in range(lo, hi)]
+
+    def by_defid(self, def_id):
+        """
+            Last item with this relative_def_id (same as building a dict over the JSON list)
+        """
+        rows = self.rows_by_defid(def_id)
+        return self.row(rows[-1]) if rows else None
+
+
+class Edges(object):
+    def __init__(self, cg, name, width):
+        self.columns = [cg.section("{}.{}".format(name, pos)) for pos in range(width)]
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __iter__(self):
+        cols = [col.tolist() for col in self.columns]
+        for edge in zip(*cols):
+            call = [edge[0], edge[1]]
+            for flag in edge[2:]:
+                if flag == -1:
+                    break
+                call.append(flag == 1)
+            yield call
+
+
+class Callgraph(object):
+    def __init__(self, buf, header, data_offset):
+        self._buf = buf
+        self._view = memoryview(buf)
+        self.header = header
+        self._data_offset = data_offset
+        self._strings = None
+        self.functions = Table(self, "functions", NODE_FIELDS)
+        self.macros = Table(self, "macros", NODE_FIELDS)
+        self.types = Table(self, "types", TYPE_FIELDS)
+        self.traits = Table(self, "traits", TRAIT_FIELDS)
+        self.impls = Table(self, "impls", IMPL_FIELDS)
+        self.function_calls = Edges(self, "function_calls", 4)
+        self.macro_calls = Edges(self, "macro_calls", 3)
+
+    def __getitem__(self, key):
+        ## data['functions'], .. as on the parsed callgraph.json
+        if key not in [name for (name, _, _) in TABLES] + [name for (name, _) in EDGES]:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def section(self, name):
+        offset, tc, count = self.header["sections"][name]
+        start = self._data_offset + offset
+        return self._view[start:start + count * array.array(tc).itemsize].cast(tc)
+
+    @property
+    def strings(self):
+        if self._strings is None:
+            if self.header["num_strings"] == 0:
+                self._strings = []
+            else:
+                self._strings = bytes(self.section("strings")).decode("utf-8").split("\0")
+        return self._strings
+
+    def string(self, sidx):
+        return self.strings[sidx]
+
+    def find(self, s):
+        """
+            Index of `s` in the interned string table, or None
+        """
+        strings = self.strings
+        i = bisect.bisect_left(strings, s)
+        if i < len(strings) and strings[i] == s:
+            return i
+        return None
+
+    def node_by_id(self, _id):
+        node = self.functions.by_id(_id)
+        if node is None:
+            node = self.macros.by_id(_id)
+        return node
+
+    def close(self):
+        self.functions = self.macros = self.types = self.traits = self.impls = None
+        self.function_calls = self.macro_calls = None
+        self._view.release()
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+
+def _open(buf):
+    if bytes(buf[:4]) != MAGIC:
+        return None
+    (header_len,) = struct.unpack("<I", buf[4:8])
+    header = json.loads(bytes(buf[8:8 + header_len]).decode("utf-8"))
+    return header, _align(8 + header_len)
+
+
+def _read_cache(cache_path, source):
+    try:
+        with open(cache_path, "rb") as fh:
+            buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        opened = _open(buf)
+    except Exception:
+        opened = None
+    if opened is None or opened[0].get("format") != FORMAT or opened[0].get("source") != source:
+        buf.close()
+        return None
+    return Callgraph(buf, opened[0], opened[1])
+
+
+def _write_cache(cache_path, raw):
+    folder = os.path.dirname(os.path.abspath(cache_path))
+    fd, tmp = tempfile.mkstemp(prefix=".cgc-", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(raw)
+        os.chmod(tmp, 0o664)
+        os.replace(tmp, cache_path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load(cg_path, ty_path=None, cache_path=None, cache=True):
+    """
+        Load a call graph (and optionally its type hierarchy) through the binary
+        cache, (re)building the cache if it is missing or stale. If the cache
+        cannot be written (e.g., read-only corpus), the compiled data is used
+        from memory.
+    """
+    if cache_path is None:
+        cache_path = default_cache_path(cg_path)
+    source = fingerprint(cg_path, ty_path)
+
+    if cache:
+        cg = _read_cache(cache_path, source)
+        if cg is not None:
+            return cg
+
+    raw = compile_json(cg_path, ty_path)
+    if cache:
+        try:
+            _write_cache(cache_path, raw)
+            cg = _read_cache(cache_path, source)
+            if cg is not None:
+                return cg
+        except OSError:
+            pass
+    header, data_offset = _open(raw)
+    return Callgraph(raw, header, data_offset)
+
+
+if __name__ == "__main__":
+    cg = load(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print("[{}] {} functions, {} macros, {} function calls, {} macro calls, {} types, {} traits, {} impls".format(
+        sys.argv[1], len(cg.functions), len(cg.macros), len(cg.function_calls), len(cg.macro_calls),
+        len(cg.types), len(cg.traits), len(cg.impls)))
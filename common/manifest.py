@@ -0,0 +1,142 @@
+# MIT License
+
+# Copyright (c) 2021 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+"""
+Manifest of the stitching store: one line per crate version present in the
+store with the artifact kinds it has.
+
+    <store>/manifest.txt:  <crate>,<ver>,<kind> <kind> ...
+
+Kinds are `entrypoints` (entrypoints-*.txt), `paths` (paths-*.txt) and
+`exitpoints` (exitpoints/). A version folder without artifacts (e.g., created by
+the `mkdir -p` step of the extraction) is listed with no kinds. Once built, the
+extractor appends the versions it writes; a version may appear on several lines
+and its kinds are merged when loading.
+
+Example:
+    python3 common/manifest.py build /datasets/praezi/stitching
+    python3 common/manifest.py show /datasets/praezi/stitching serde
+"""
+
+import fcntl
+import os
+import sys
+import tempfile
+
+MANIFEST_NAME = "manifest.txt"
+
+KINDS = ("entrypoints", "paths", "exitpoints")
+
+
+def manifest_path(store):
+    return os.path.join(store, MANIFEST_NAME)
+
+
+def format_entry(name, ver, kinds):
+    return "{},{},{}\n".format(name, ver, " ".join(k for k in KINDS if k in kinds))
+
+
+def kinds_of(folder):
+    """
+        Artifact kinds in a version folder of the store
+    """
+    kinds = set()
+    for entry in os.scandir(folder):
+        if entry.name.startswith("entrypoints-") and entry.name.endswith(".txt"):
+            kinds.add("entrypoints")
+        elif entry.name.startswith("paths-") and entry.name.endswith(".txt"):
+            kinds.add("paths")
+        elif entry.name == "exitpoints" and entry.is_dir():
+            kinds.add("exitpoints")
+    return kinds
+
+
+def scan(store):
+    """
+        Yield (crate, ver, kinds) for every version folder in the store
+    """
+    for crate in os.scandir(store):
+        if not crate.is_dir():
+            continue
+        for ver in os.scandir(crate.path):
+            if ver.is_dir():
+                yield (crate.name, ver.name, kinds_of(ver.path))
+
+
+def build(store, path=None):
+    """
+        Write the manifest of the whole store (replacing an existing one), returns the number of versions
+    """
+    path = path or manifest_path(store)
+    fd, tmp = tempfile.mkstemp(prefix=".manifest-", dir=os.path.dirname(os.path.abspath(path)))
+    count = 0
+    with os.fdopen(fd, "w") as fh:
+        for (name, ver, kinds) in scan(store):
+            fh.write(format_entry(name, ver, kinds))
+            count += 1
+    os.chmod(tmp, 0o664)
+    os.replace(tmp, path)
+    return count
+
+
+def append(store, entries, path=None):
+    """
+        Add (crate, ver, kinds) entries; concurrent extractor runs are serialized with a lock on the file
+    """
+    with open(path or manifest_path(store), "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            fh.writelines(format_entry(name, ver, kinds) for (name, ver, kinds) in entries)
+            fh.flush()
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def load(store, path=None):
+    """
+        {crate::ver: {kinds}}, None if the store has no manifest
+    """
+    path = path or manifest_path(store)
+    if not os.path.exists(path):
+        return None
+    manifest = {}
+    with open(path) as fh:
+        for line in fh:
+            name, ver, kinds = line.rstrip('\n').split(",")
+            manifest.setdefault("{}::{}".format(name, ver), set()).update(kinds.split())
+    return manifest
+
+
+if __name__ == "__main__":
+    cmd, store = sys.argv[1], sys.argv[2]
+    if cmd == "build":
+        print("[{}] {} crate versions in {}".format(sys.argv[0], build(store), manifest_path(store)))
+    elif cmd == "show":
+        manifest = load(store)
+        if manifest is None:
+            raise Exception("no manifest in store: " + store)
+        for (krate, kinds) in sorted(manifest.items()):
+            if len(sys.argv) < 4 or krate.split("::")[0] == sys.argv[3]:
+                print("{},{}".format(krate, " ".join(k for k in KINDS if k in kinds)))
+    else:
+        raise Exception("unknown command: " + cmd)
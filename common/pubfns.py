@@ -0,0 +1,134 @@
+# MIT License
+
+# Copyright (c) 2021 Joseph Hejderup
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+#!/usr/bin/env python3
+"""
+Hashed public functions of the crate versions in the stitching store. Next to
+every entrypoints-<uuid>.txt, the extractor writes pubfns-<uuid>.u64: the
+sorted, distinct 64-bit hashes (blake2b) of `<crate>::<decoded fn>`, stored as
+little-endian uint64. The number of public functions in a file is its size / 8.
+
+Hashes of the same function are equal across versions of a crate, so
+duplicated functions in a dependency tree can be counted from the hashes alone
+without decoding any entrypoint.
+
+Example:
+    python3 common/pubfns.py build /datasets/praezi/stitching
+    python3 common/pubfns.py count /datasets/praezi/stitching serde 1.0.104
+"""
+
+import base64
+import hashlib
+import os
+import sys
+import tempfile
+
+from array import array
+
+
+def pubfns_path(entrypoints_file):
+    """
+        pubfns-<uuid>.u64 next to an entrypoints-<uuid>.txt file
+    """
+    folder, name = os.path.split(entrypoints_file)
+    return os.path.join(folder, "pubfns-" + name[len("entrypoints-"):-len(".txt")] + ".u64")
+
+
+def fn_hash(name, fn):
+    """
+        64-bit hash of a decoded function of crate `name`
+    """
+    digest = hashlib.blake2b("{}::{}".format(name, fn).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def hashes(name, entrypoints):
+    """
+        Sorted distinct hashes of base64-encoded entrypoints of crate `name`
+    """
+    return sorted(set(fn_hash(name, base64.b64decode(fn.encode('ascii')).decode('ascii')) for fn in entrypoints))
+
+
+def write(path, values):
+    folder = os.path.dirname(os.path.abspath(path))
+    data = array('Q', values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    fd, tmp = tempfile.mkstemp(prefix=".pubfns-", dir=folder)
+    with os.fdopen(fd, "wb") as fh:
+        data.tofile(fh)
+    os.chmod(tmp, 0o777)
+    os.replace(tmp, path)
+
+
+def read(path):
+    data = array('Q')
+    with open(path, "rb") as fh:
+        data.frombytes(fh.read())
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data
+
+
+def count(path):
+    return os.path.getsize(path) // 8
+
+
+def entrypoints_files(store):
+    for crate in os.scandir(store):
+        if not crate.is_dir():
+            continue
+        for ver in os.scandir(crate.path):
+            if not ver.is_dir():
+                continue
+            for f in os.scandir(ver.path):
+                if f.name.startswith("entrypoints-") and f.name.endswith(".txt"):
+                    yield (crate.name, f.path)
+
+
+def build(store):
+    """
+        Write the missing pubfns files of the store, returns the number of written files
+    """
+    written = 0
+    for (name, path) in entrypoints_files(store):
+        if os.path.exists(pubfns_path(path)):
+            continue
+        with open(path) as fh:
+            write(pubfns_path(path), hashes(name, [line.rstrip('\n') for line in fh]))
+        written += 1
+    return written
+
+
+if __name__ == "__main__":
+    cmd, store = sys.argv[1], sys.argv[2]
+    if cmd == "build":
+        print("[{}] wrote {} pubfns files".format(sys.argv[0], build(store)))
+    elif cmd == "count":
+        folder = os.path.join(store, sys.argv[3], sys.argv[4])
+        values = set()
+        for f in sorted(os.listdir(folder)):
+            if f.startswith("pubfns-") and f.endswith(".u64"):
+                values.update(read(os.path.join(folder, f)))
+        print("{}::{},{}".format(sys.argv[3], sys.argv[4], len(values)))
+    else:
+        raise Exception("unknown command: " + cmd)
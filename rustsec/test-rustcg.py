@@ -30,20 +30,17 @@
 
 import json 
 import sys
+import os
 import re
 
-regex = r".+{{impl}}\[\d+\]"
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "common"))
+import cgcache
 
-# Load raw cg
+regex = r".+{{impl}}\[\d+\]"
 
-with open(sys.argv[1] + "/callgraph.json") as cg_file:
-    cg = json.load(cg_file)
+# Load raw cg and type hierarchy information (through the compiled cache, see common/cgcache.py)
 
-# Load type hierarchy information
-try:
-    with open(sys.argv[1] + "/type_hierarchy.json") as cg_file:
-        type_hir = json.load(cg_file)
-except:
+def write_empty_type_hierarchy():
     with open(sys.argv[1] + "/type_hierarchy.json", 'w+') as ty_file:
         empty = {}
         empty['types'] = list()
@@ -52,36 +49,26 @@ except:
         json.dump(empty,ty_file)
     sys.exit(0)
 
+if not os.path.exists(sys.argv[1] + "/type_hierarchy.json"):
+    write_empty_type_hierarchy()
 
-# Lookup table for types
-
-# lookup table for type information
-
-_lookup_def_id = {}
-_lookup_id_def = {}
+try:
+    cg = cgcache.load(sys.argv[1] + "/callgraph.json", sys.argv[1] + "/type_hierarchy.json")
+except (OSError, ValueError):
+    # a type hierarchy that does not parse is replaced like a missing one; a broken call graph still fails
+    cgcache.load(sys.argv[1] + "/callgraph.json", cache=False)
+    write_empty_type_hierarchy()
 
-for ty in type_hir.get('types',list()):
-    def_id = ty['relative_def_id']
-    if ty['package_name'] is not None:
-        def_id = ty['package_name']  + ty['relative_def_id']
-    
-    _lookup_def_id[def_id] = ty
-    _lookup_id_def[ty['id']] = ty
 
-for tr in type_hir.get('traits',list()):
-    def_id = tr['relative_def_id']
-    if tr['package_name'] is not None:
-        def_id = tr['package_name']  + tr['relative_def_id']
-    _lookup_def_id[def_id] = tr
-    _lookup_id_def[tr['id']] = tr
+# lookup of type information, the package name disambiguates identical
+# relative_def_ids of different packages (std items have no package name)
 
-for impl in type_hir.get('impls',list()):
-    def_id = impl['relative_def_id']
-    if impl['package_name'] is not None:
-        def_id = impl['package_name']  + impl['relative_def_id']
-    
-    _lookup_def_id[def_id] = impl   
-    _lookup_id_def[impl['id']] = impl
+def lookup_def_id(def_id, package_name=None):
+    for table in [cg.types, cg.traits, cg.impls]:
+        for row in table.rows_by_defid(def_id):
+            if table.value(row, 'package_name') == package_name:
+                return table.row(row)
+    raise KeyError(def_id)
 
 # check if def_id is in the type information
 
@@ -97,41 +84,35 @@ def check_type(def_id, package_name=None):
     if '{{impl}}' in def_id:  # trait impl
         for match in re.findall(regex, def_id):
             try:
-                if package_name is not None:
-                    match = package_name + match
-                _lookup_def_id[match]
+                lookup_def_id(match, package_name)
             except:
                 if match.split("::")[0] not in std:
                     raise Exception("Missing trait implementation in the call graph!")
     else:
         try:
-            if package_name is not None:
-                 def_id = package_name + def_id
-            _lookup_def_id[def_id]
+            lookup_def_id(def_id, package_name)
 
             def_segs = def_id.split("::")
             def_segs.pop()
             def_id = "::".join(def_segs)
-            if package_name is not None:
-                def_id = package_name + def_id
-            _lookup_def_id[def_id]
+            lookup_def_id(def_id, package_name)
         except:
             try:
                 def_segs = def_id.split("::")
                 def_segs.pop()
                 def_id = "::".join(def_segs)
-                _lookup_def_id[def_id]             
+                lookup_def_id(def_id)
             except:
                 pass # we cannot fully validate this
 
-for fn in cg.get('functions', list()):
+for fn in cg.functions:
     def_id = fn['relative_def_id']
     if 'package_name' in fn and fn['package_name'] is not None:
         check_type(def_id, fn['package_name'])
     else:
         check_type(def_id)       
 
-for m in cg.get('macros', list()):
+for m in cg.macros:
     def_id = m['relative_def_id']
     if 'package_name' in m and m['package_name'] is not None:
         check_type(def_id, m['package_name'])
@@ -139,14 +120,14 @@ for m in cg.get('macros', list()):
         check_type(def_id)       
 
 
-for fn in cg.get('functions', list()):
+for fn in cg.functions:
     def_id = fn['relative_def_id']
     if 'package_name' in fn and fn['package_name'] is not None:
         check_type(def_id, fn['package_name'])
     else:
         check_type(def_id)       
 
-for m in cg.get('macros', list()):
+for m in cg.macros:
     def_id = m['relative_def_id']
     if 'package_name' in m and m['package_name'] is not None:
         check_type(def_id, m['package_name'])